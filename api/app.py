@@ -1,13 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 from routers import health, auth, users, venues, matches, fields, reviews
 from core.config import settings
+from core.password_pool import password_pool
+from core import invalidation
+from core.schedule_jobs import schedule_job_runner
+from core.lifecycle import lifecycle_scheduler
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = invalidation.create_listener()
+    if listener is not None:
+        listener.start()
+    schedule_job_runner.resume()
+    if settings.LIFECYCLE_ENABLED:
+        lifecycle_scheduler.start()
+    yield
+    if listener is not None:
+        await listener.stop()
+    lifecycle_scheduler.shutdown()
+    schedule_job_runner.shutdown()
+    password_pool.shutdown()
 
 app = FastAPI(
     title="PlayoffArena API",
     description="API для создания и поиска спортивных матчей.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
@@ -0,0 +1,1559 @@
+"""Замеры и нагрузочные проверки, подключаются к manage.py как команды bench-*.
+
+    python manage.py bench-login [--logins N] [--concurrency N]
+    python manage.py bench-recommendations [--matches N] [--players N] [--queries N]
+    python manage.py bench-feed [--pages 1,1000] [--limit N] [--queries N]
+    python manage.py bench-match-writes [--rosters 10,50] [--queries N]
+    python manage.py bench-rooms [--sockets N] [--rooms N] [--events N]
+    python manage.py bench-schedule [--days N] [--fields N]
+    python manage.py bench-availability [--fields N] [--days N] [--queries N]
+    python manage.py bench-partitions [--years N] [--fields N] [--queries N]
+    python manage.py bench-booking [--users N] [--concurrency N]
+    python manage.py bench-join [--users N] [--max-players N] [--rounds N] [--concurrency N]
+    python manage.py bench-search [--matches N] [--venues N] [--queries N]
+    python manage.py bench-geo [--fields N] [--queries N] [--postgres]
+    python manage.py bench-venue-search [--venues N] [--queries N] [--postgres [--emulate-trgm]]
+    python manage.py bench-reviews [--rosters 10,20,40] [--queries N] [--concurrency N]
+    python manage.py bench-recompute [--reviews N] [--players N] [--matches N]
+    python manage.py bench-leaderboard [--players N] [--queries N] [--postgres]
+    python manage.py bench-uploads [--uploads N] [--size-mb N] [--slow N]
+
+Команды, которым нужна БД, работают с DATABASE_URL: синтетические строки создаются
+под своим префиксом и удаляются в конце замера.
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, time as day_time, timedelta
+from time import perf_counter
+
+import httpx
+import psutil
+import websockets
+from starlette.concurrency import run_in_threadpool
+
+from core import geo, leaderboard, recommendations
+from core.config import settings
+from core.response_cache import response_cache
+from core.password_pool import PasswordPool, PasswordPoolSaturated
+from core.security import create_access_token, pwd_context
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from db import models, partitions, repository, schemas
+from db.session import SessionLocal, engine
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    if not samples:
+        return "no samples"
+    p50, p99 = samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {p50 * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms"
+
+
+class Scratch:
+    """Синтетические пользователи и матчи одного замера. Всё, что создано под префиксом
+    email bench-<tag>-, удаляется в cleanup() — и в начале, если прошлый прогон прервали."""
+
+    def __init__(self, tag: str):
+        self.pattern = f"bench-{tag}-%@example.com"
+        self.tag = tag
+
+    def users(self, db, count: int) -> list:
+        return db.execute(text("""
+            INSERT INTO users (email, pass_hash, role, full_name, level, position,
+                               sportsmanship_rating, skill_rating, no_show_count, reviews_count)
+            SELECT 'bench-' || :tag || '-' || n || '@example.com', 'bench', 'athlete', 'Bench ' || n,
+                   'любитель', 'защитник', 0, 0, 0, 0
+            FROM generate_series(1, :count) AS n
+            RETURNING id
+        """), {"tag": self.tag, "count": count}).scalars().all()
+
+    def match(self, db, captain_id: int, players: list, max_players: int, waitlist: bool = True) -> int:
+        """Активный публичный матч без поля; players — подтверждённые участники по порядку."""
+        match_id = db.execute(text("""
+            INSERT INTO matches (title, captain_id, starts_at, max_players, status, is_private,
+                                 waitlist_enabled, invite_code, confirmed_count, waitlist_count)
+            VALUES ('bench ' || :tag, :captain_id, LOCALTIMESTAMP + interval '7 days', :max_players, 'active', false,
+                    :waitlist, substr(md5(random()::text), 1, 10), :confirmed, 0)
+            RETURNING id
+        """), {"tag": self.tag, "captain_id": captain_id, "max_players": max_players, "waitlist": waitlist,
+               "confirmed": len(players)}).scalar_one()
+        db.execute(text("""
+            INSERT INTO match_players (match_id, user_id, status, joined_at)
+            SELECT :match_id, user_id, 'confirmed', LOCALTIMESTAMP + n * interval '1 millisecond'
+            FROM unnest(CAST(:players AS integer[])) WITH ORDINALITY AS p(user_id, n)
+        """), {"match_id": match_id, "players": players})
+        return match_id
+
+    def finished_match(self, db, captain_id: int, players: list) -> int:
+        """Матч, закончившийся три часа назад, с составом players — для отзывов."""
+        match_id = self.match(db, captain_id, players, max_players=max(len(players), 2))
+        db.execute(text("""
+            UPDATE matches SET status = 'completed', starts_at = LOCALTIMESTAMP - interval '3 hours' WHERE id = :match_id
+        """), {"match_id": match_id})
+        return match_id
+
+    def fields(self, db, owner_id: int, count: int, price_per_hour: int = 5000) -> list:
+        """Площадка владельца owner_id с count полями."""
+        venue_id = db.execute(text("""
+            INSERT INTO venue_profiles (owner_id, iin_bin, title)
+            VALUES (:owner_id, 'B' || lpad(CAST(:owner_id AS text), 11, '0'), 'bench ' || :tag)
+            RETURNING id
+        """), {"owner_id": owner_id, "tag": self.tag}).scalar_one()
+        return db.execute(text("""
+            INSERT INTO fields (venue_id, sport, address, price_per_hour)
+            SELECT :venue_id, 'football', 'bench ' || :tag || ' ' || n, :price
+            FROM generate_series(1, :count) AS n
+            RETURNING id
+        """), {"venue_id": venue_id, "tag": self.tag, "count": count, "price": price_per_hour}).scalars().all()
+
+    def cleanup(self, db) -> None:
+        db.rollback()
+        params = {"pattern": self.pattern}
+        users = "SELECT id FROM users WHERE email LIKE :pattern"
+        matches = f"SELECT id FROM matches WHERE captain_id IN ({users})"
+        venues = f"SELECT id FROM venue_profiles WHERE owner_id IN ({users})"
+        fields = f"SELECT id FROM fields WHERE venue_id IN ({venues})"
+        for statement in (
+            f"UPDATE time_slots SET held_by = NULL, held_until = NULL WHERE held_by IN ({users})",
+            f"UPDATE time_slots SET status = 'available', match_id = NULL WHERE match_id IN ({matches})",
+            f"DELETE FROM player_reviews WHERE match_id IN ({matches}) OR reviewer_id IN ({users}) OR subject_id IN ({users})",
+            f"DELETE FROM match_players WHERE match_id IN ({matches}) OR user_id IN ({users})",
+            f"DELETE FROM matches WHERE id IN ({matches})",
+            f"DELETE FROM time_slots WHERE field_id IN ({fields})",
+            f"DELETE FROM pricing_rules WHERE field_id IN ({fields})",
+            f"DELETE FROM schedule_jobs WHERE venue_id IN ({venues})",
+            f"DELETE FROM fields WHERE id IN ({fields})",
+            f"DELETE FROM venue_profiles WHERE id IN ({venues})",
+            f"DELETE FROM users WHERE id IN ({users})",
+        ):
+            db.execute(text(statement), params)
+        db.commit()
+
+
+def timed(fn, queries: int) -> list:
+    timings = []
+    for _ in range(queries):
+        started = perf_counter()
+        fn()
+        timings.append(perf_counter() - started)
+    return timings
+
+
+async def _login_storm(verify, logins: int, concurrency: int) -> dict:
+    """logins проверок bcrypt в concurrency потоков запросов; рядом пробник — короткий вызов
+    в общем threadpool Starlette, как у синхронного обработчика или запроса к БД."""
+    hashed = pwd_context.hash("bench-password")
+    remaining = list(range(logins))
+    latencies, probes, rejected = [], [], 0
+
+    async def client():
+        nonlocal rejected
+        while remaining:
+            remaining.pop()
+            started = perf_counter()
+            try:
+                await verify("bench-password", hashed)
+            except PasswordPoolSaturated:
+                rejected += 1
+                await asyncio.sleep(0.01)  # Retry-After, сжатый для замера
+                continue
+            latencies.append(perf_counter() - started)
+
+    async def probe(stop: asyncio.Event):
+        while not stop.is_set():
+            started = perf_counter()
+            await run_in_threadpool(lambda: None)
+            probes.append(perf_counter() - started)
+            await asyncio.sleep(0.005)
+
+    stop = asyncio.Event()
+    probing = asyncio.create_task(probe(stop))
+    started = perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+    stop.set()
+    await probing
+    return {"elapsed": elapsed, "latencies": latencies, "probes": probes, "rejected": rejected}
+
+
+def bench_login(args) -> int:
+    """Проверка пароля при входе: как было (bcrypt в общем threadpool) и через PasswordPool."""
+    pool = PasswordPool(args.kind, args.workers, args.max_queue)
+    modes = {
+        "shared threadpool": lambda password, hashed: run_in_threadpool(pwd_context.verify, password, hashed),
+        f"password pool ({args.kind}, {args.workers} workers)": pool.verify_async,
+    }
+    try:
+        for name, verify in modes.items():
+            result = asyncio.run(_login_storm(verify, args.logins, args.concurrency))
+            print(
+                f"{name}: {len(result['latencies']) / result['elapsed']:.1f} logins/s, "
+                f"login {percentiles(result['latencies'])}, 503 retries {result['rejected']}; "
+                f"other threadpool calls {percentiles(result['probes'])}"
+            )
+    finally:
+        pool.shutdown()
+    return 0
+
+
+def bench_recommendations(args) -> int:
+    """Офлайн-замер core.recommendations на синтетических составах, без БД."""
+    rng = random.Random(args.seed)
+    positions = ["вратарь", "защитник", "полузащитник", "нападающий", None]
+    now = datetime.now()
+
+    def roster_row(match_id: int, members: list):
+        ratings = [rng.uniform(1, 5) for user_id in members if user_id % 4]
+        return (
+            match_id, now + timedelta(minutes=rng.randint(10, 14 * 24 * 60)), rng.choice((10, 12, 14, 22)),
+            len(members), members, [rng.choice(positions) for _ in members], ratings, rng.randint(0, len(members)),
+        )
+
+    rosters = {
+        match_id: rng.sample(range(1, args.players + 1), rng.randint(0, 9))
+        for match_id in range(1, args.matches + 1)
+    }
+    index = recommendations.RosterIndex()
+    started = perf_counter()
+    index.load(roster_row(match_id, members) for match_id, members in rosters.items())
+    print(f"load: {args.matches} matches in {perf_counter() - started:.3f}s")
+
+    timings = []
+    for _ in range(args.queries):
+        player = recommendations.Player(
+            rng.randint(1, args.players), rng.choice((None, rng.uniform(1, 5))), rng.choice(positions), rng.randint(0, 3),
+        )
+        co_players = {rng.randint(1, args.players): rng.randint(1, 20) for _ in range(rng.randint(0, 50))}
+        started = perf_counter()
+        index.recommend(player, co_players, args.limit)
+        timings.append(perf_counter() - started)
+    print(f"recommend (limit {args.limit}): {percentiles(timings)}")
+
+    timings = []
+    for _ in range(args.queries):
+        match_id = rng.randint(1, args.matches)
+        members = rosters[match_id]
+        if members and rng.random() < 0.5:
+            members.pop(rng.randrange(len(members)))
+        else:
+            members.append(rng.randint(1, args.players))
+        index.invalidate(f"match:{match_id}")
+        started = perf_counter()
+        full, dirty = index.pending()
+        index.refresh(dirty, [roster_row(match_id, members)])
+        timings.append(perf_counter() - started)
+    print(f"join/leave refresh: {percentiles(timings)}")
+    return 0
+
+
+def bench_feed(args) -> int:
+    """GET /api/matches без кэша ответа: страница по skip (OFFSET, как было) и по курсору."""
+    pages = [int(page) for page in args.pages.split(",")]
+    with SessionLocal() as db:
+        for page in pages:
+            skip = (page - 1) * args.limit
+            after = None
+            if skip:
+                previous = db.execute(repository.active_matches_query().offset(skip - 1).limit(1)).scalars().first()
+                if previous is None:
+                    print(f"page {page}: в ленте меньше {skip} матчей, пропущено")
+                    continue
+                after = repository.encode_match_cursor(previous)
+
+            def render(**kwargs):
+                matches = repository.get_active_matches(db, limit=args.limit, **kwargs)
+                schemas.MatchPage(items=matches, next_cursor=None).model_dump_json()
+                db.expire_all()
+
+            decoded = repository.decode_match_cursor(after) if after else None
+            print(f"page {page} skip:   {percentiles(timed(lambda: render(skip=skip), args.queries))}")
+            print(f"page {page} cursor: {percentiles(timed(lambda: render(after=decoded), args.queries))}")
+    return 0
+
+
+def bench_match_writes(args) -> int:
+    """join/leave с ответом MatchDetailsPublic: отдельное чтение после COMMIT (как было)
+    и чтение той же транзакцией до COMMIT (details=True)."""
+    scratch = Scratch("writes")
+    rosters = [int(size) for size in args.rosters.split(",")]
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        try:
+            users = scratch.users(db, max(rosters) + 1)
+            mover_id = users[-1]
+            for size in rosters:
+                match_id = scratch.match(db, users[0], users[:size], max_players=size + 5)
+                db.commit()
+
+                def request(write, **kwargs):
+                    """Как обработчик: пользователь и строка матча, запись, ответ; сессия закрывается."""
+                    result = write(db, db.get(models.User, mover_id), repository.get_match_row(db, match_id), **kwargs)
+                    if not kwargs:
+                        result = repository.get_match_details_json(db, match_id)
+                    db.close()
+                    return result
+
+                def separate_read():
+                    request(repository.add_player_to_match)
+                    request(repository.remove_player_from_match)
+
+                def same_transaction():
+                    request(repository.add_player_to_match, details=True)
+                    request(repository.remove_player_from_match, details=True)
+
+                for name, cycle in (("read after commit", separate_read), ("read before commit", same_transaction)):
+                    cycle()
+                    print(f"{size} players, join+leave, {name}: {percentiles(timed(cycle, args.queries))}")
+        finally:
+            scratch.cleanup(db)
+    return 0
+
+
+def _start_server(port: int) -> subprocess.Popen:
+    """Отдельный процесс uvicorn: записи из процесса замера доходят до него через NOTIFY,
+    как из другого воркера."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "LIFECYCLE_ENABLED": "false"},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def _room_storm(args, port: int, match_ids: list, movers: list) -> dict:
+    arrivals: dict = {}
+    sent: dict = {}
+    connected = asyncio.Semaphore(0)
+    connecting = asyncio.Semaphore(args.connect_concurrency)
+    errors = []
+
+    async def client(match_id: int):
+        try:
+            async with connecting:
+                socket = await websockets.connect(f"ws://127.0.0.1:{port}/api/matches/{match_id}/ws", max_queue=None)
+                await socket.recv()  # снимок
+            connected.release()
+            async with socket:
+                async for raw in socket:
+                    message = json.loads(raw)
+                    if message["type"] == "ping":
+                        await socket.send('{"type":"pong"}')
+                        continue
+                    key = (message["match_id"], message["type"], message.get("user_id") or message["user"]["id"])
+                    arrivals.setdefault(key, []).append(time.time())
+        except Exception as e:
+            errors.append(e)
+            connected.release()
+
+    def write(match_id: int, user_id: int):
+        with SessionLocal() as db:
+            user, match = db.get(models.User, user_id), repository.get_match_row(db, match_id)
+            sent[(match_id, "player_joined", user_id)] = time.time()
+            repository.add_player_to_match(db, user, match)
+            sent[(match_id, "player_left", user_id)] = time.time()
+            repository.remove_player_from_match(db, user, repository.get_match_row(db, match_id))
+
+    started = perf_counter()
+    clients = [asyncio.create_task(client(match_ids[i % len(match_ids)])) for i in range(args.sockets)]
+    for _ in clients:
+        await connected.acquire()
+    connect_seconds = perf_counter() - started
+    rss = psutil.Process(args.server_pid).memory_info().rss
+    for event in range(args.events):
+        await asyncio.to_thread(write, match_ids[event % len(match_ids)], movers[event])
+        await asyncio.sleep(args.pause)
+    await asyncio.sleep(1)
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+    latencies = [arrived - sent[key] for key, times in arrivals.items() for arrived in times]
+    return {"connect_seconds": connect_seconds, "rss": rss, "latencies": latencies, "errors": errors}
+
+
+def bench_rooms(args) -> int:
+    """Тысячи сокетов комнат матчей на одном воркере uvicorn; join/leave из этого процесса."""
+    scratch = Scratch("rooms")
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        users = scratch.users(db, args.rooms + args.events)
+        match_ids = [scratch.match(db, users[room], [users[room]], max_players=args.events + 2) for room in range(args.rooms)]
+        db.commit()
+    server = _start_server(args.port)
+    try:
+        args.server_pid = server.pid
+        idle_rss = psutil.Process(server.pid).memory_info().rss
+        result = asyncio.run(_room_storm(args, args.port, match_ids, users[args.rooms:]))
+        expected = 2 * args.events * (args.sockets // args.rooms)
+        print(f"{args.sockets} sockets in {args.rooms} rooms connected in {result['connect_seconds']:.1f}s, "
+              f"{len(result['errors'])} failed; server RSS +{(result['rss'] - idle_rss) / 2**20:.1f} MB")
+        print(f"deltas delivered {len(result['latencies'])} of ~{expected}: {percentiles(result['latencies'])}")
+        print(json.dumps(httpx.get(f"http://127.0.0.1:{args.port}/api/metrics").json()["match_rooms"]))
+    finally:
+        server.terminate()
+        server.wait()
+        with SessionLocal() as db:
+            scratch.cleanup(db)
+    return 0
+
+
+def _generate_row_by_row(db, field: models.Field, schedule: schemas.ScheduleGenerationRequest) -> int:
+    """Генерация до set-based вставки: запрос на существование и объект ORM на каждый слот."""
+    new_slots = []
+    for start, end in repository.schedule_candidates(schedule):
+        exists = db.query(models.TimeSlot).filter_by(field_id=field.id, start_time=start).first()
+        if not exists:
+            new_slots.append(models.TimeSlot(field_id=field.id, start_time=start, end_time=end))
+    db.add_all(new_slots)
+    db.commit()
+    return len(new_slots)
+
+
+def bench_schedule(args) -> int:
+    """generate-schedule: построчная генерация (как было) и одна вставка с ON CONFLICT на пачку,
+    на пустом диапазоне и повторно по уже созданному."""
+    scratch = Scratch("schedule")
+    start = date.today() + timedelta(days=1)
+    schedule = schemas.ScheduleGenerationRequest(
+        start_date=start, end_date=start + timedelta(days=args.days - 1),
+        start_time=day_time(8), end_time=day_time(23), slot_duration_minutes=60,
+    )
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        try:
+            owner = scratch.users(db, 1)[0]
+            field_ids = scratch.fields(db, owner, 2 * args.fields)
+            db.commit()
+            modes = (("row by row", _generate_row_by_row, field_ids[:args.fields]),
+                     ("set-based", repository.generate_schedule_for_field, field_ids[args.fields:]))
+            for name, generate, ids in modes:
+                for run in ("empty range", "repeat"):
+                    started, created = perf_counter(), 0
+                    for field_id in ids:
+                        created += generate(db, db.get(models.Field, field_id), schedule)
+                    elapsed = perf_counter() - started
+                    print(f"{name}, {run}: {created} slots for {len(ids)} fields x {args.days} days "
+                          f"in {elapsed:.2f}s ({elapsed / len(ids) * 1000:.1f} ms per field)")
+        finally:
+            scratch.cleanup(db)
+    return 0
+
+
+def bench_availability(args) -> int:
+    """Неделя площадки в пикере слотов: запрос на каждое поле и день (как было) и одна сетка
+    /api/fields/availability. Через приложение, с холодным кэшем ответов на каждом просмотре."""
+    from fastapi.testclient import TestClient
+    from app import app
+
+    scratch = Scratch("availability")
+    start = date.today() + timedelta(days=1)
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        owner = scratch.users(db, 1)[0]
+        field_ids = scratch.fields(db, owner, args.fields)
+        db.commit()
+        schedule = schemas.ScheduleGenerationRequest(
+            start_date=start, end_date=start + timedelta(days=args.days - 1),
+            start_time=day_time(8), end_time=day_time(23), slot_duration_minutes=60,
+        )
+        for field_id in field_ids:
+            repository.generate_schedule_for_field(db, db.get(models.Field, field_id), schedule)
+    client = TestClient(app)
+    days = [(start + timedelta(days=n)).isoformat() for n in range(args.days)]
+
+    def per_day():
+        response_cache.reset()
+        return sum(
+            len(client.get(f"/api/fields/{field_id}/slots", params={"on_date": day}).content)
+            for field_id in field_ids for day in days
+        )
+
+    def grid():
+        response_cache.reset()
+        response = client.get("/api/fields/availability", params={
+            "field_ids": field_ids, "start_date": start.isoformat(), "days": args.days,
+        })
+        return len(response.content)
+
+    try:
+        for name, view, requests in (("per field and day", per_day, len(field_ids) * len(days)), ("grid", grid, 1)):
+            size = view()
+            print(f"{name}: {requests} requests, {size} bytes, {percentiles(timed(view, args.queries))}")
+    finally:
+        with SessionLocal() as db:
+            scratch.cleanup(db)
+    return 0
+
+
+def bench_partitions(args) -> int:
+    """Запросы слотов дня и генерация месяца расписания по мере того, как time_slots обрастает
+    историей: каждый шаг добавляет год прошлых слотов в свои месячные партиции."""
+    scratch = Scratch("partitions")
+    day = date.today() + timedelta(days=1)
+    month = partitions.add_months(partitions.month_start(date.today()), 2)
+    schedule = schemas.ScheduleGenerationRequest(
+        start_date=month, end_date=partitions.add_months(month, 1) - timedelta(days=1),
+        start_time=day_time(8), end_time=day_time(23), slot_duration_minutes=30,
+    )
+    created_months = []
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        if not partitions.is_partitioned(db.connection()):
+            print("time_slots is not partitioned here; run the migrations on Postgres first")
+            return 1
+        try:
+            owner = scratch.users(db, 1)[0]
+            field_ids = scratch.fields(db, owner, args.fields + 1)
+            history_ids, target_id = field_ids[:-1], field_ids[-1]
+            db.commit()
+            repository.generate_schedule_for_field(db, db.get(models.Field, target_id), schemas.ScheduleGenerationRequest(
+                start_date=day, end_date=day, start_time=day_time(8), end_time=day_time(23), slot_duration_minutes=30,
+            ))
+            # Далёкое прошлое, чтобы не задеть настоящие партиции.
+            first_year = 2000
+            for step in range(args.years + 1):
+                if step:
+                    year = first_year + step - 1
+                    created_months += partitions.ensure_partitions(
+                        engine, partitions.months_between(date(year, 1, 1), date(year, 12, 31)))
+                    db.execute(text("""
+                        INSERT INTO time_slots (field_id, start_time, end_time, status)
+                        SELECT f, t, t + interval '30 minutes', 'available'
+                        FROM unnest(CAST(:fields AS integer[])) AS f,
+                             generate_series(make_timestamp(:year, 1, 1, 8, 0, 0),
+                                             make_timestamp(:year, 12, 31, 22, 30, 0), interval '30 minutes') AS t
+                        WHERE CAST(t AS time) BETWEEN '08:00' AND '22:30'
+                    """), {"fields": history_ids, "year": year})
+                    db.commit()
+                    db.execute(text("ANALYZE time_slots"))
+                rows = db.execute(text("SELECT count(*) FROM time_slots")).scalar()
+                count = len(partitions.list_partitions(db.connection()))
+                db.commit()
+                queries = timed(lambda: repository.get_slots_for_field_on_date(db, target_id, day), args.queries)
+                field = db.get(models.Field, target_id)
+                started = perf_counter()
+                generated = repository.generate_schedule_for_field(db, field, schedule)
+                generation = perf_counter() - started
+                db.execute(text("DELETE FROM time_slots WHERE field_id = :field_id AND start_time >= :month"),
+                           {"field_id": target_id, "month": month})
+                db.commit()
+                print(f"{rows} rows in {count} partitions: day slots {percentiles(queries)}; "
+                      f"month generation ({generated} slots) {generation * 1000:.1f} ms")
+        finally:
+            scratch.cleanup(db)
+            for created in created_months:
+                db.execute(text(f"DROP TABLE IF EXISTS {partitions.partition_name(created)}"))
+                partitions._known_months.discard(created)
+            db.commit()
+    return 0
+
+
+def _race(sessions, user_ids: list, concurrency: int, attempt) -> list:
+    """attempt(db, user) для каждого пользователя в concurrency потоков, стартующих разом
+    (своё соединение на поток); результаты в порядке user_ids, упавшие попытки — исключением."""
+    results = [None] * len(user_ids)
+    chunks = [range(start, len(user_ids), concurrency) for start in range(min(concurrency, len(user_ids)))]
+    barrier = threading.Barrier(len(chunks))
+
+    def worker(indexes):
+        with sessions() as db:
+            users = [db.get(models.User, user_ids[index]) for index in indexes]
+            barrier.wait()
+            for index, user in zip(indexes, users):
+                try:
+                    results[index] = attempt(db, user)
+                except Exception as exc:
+                    db.rollback()
+                    results[index] = exc
+
+    threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def bench_booking(args) -> int:
+    """Гонка за один слот: все пользователи разом удерживают его, затем разом создают на нём матч.
+    Удержать и забронировать должен ровно один, и бронь достаётся тому, кто удерживает."""
+    scratch = Scratch("booking")
+    day = date.today() + timedelta(days=1)
+    race_engine = create_engine(engine.url, pool_size=args.concurrency, max_overflow=0)
+    sessions = sessionmaker(bind=race_engine, autoflush=False)
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        owner, *user_ids = scratch.users(db, args.users + 1)
+        field_id = scratch.fields(db, owner, 1)[0]
+        db.commit()
+        repository.generate_schedule_for_field(db, db.get(models.Field, field_id), schemas.ScheduleGenerationRequest(
+            start_date=day, end_date=day, start_time=day_time(10), end_time=day_time(11), slot_duration_minutes=60,
+        ))
+        slot_id = db.execute(text("SELECT id FROM time_slots WHERE field_id = :field_id"), {"field_id": field_id}).scalar_one()
+    failed = False
+    try:
+        started = perf_counter()
+        holds = _race(sessions, user_ids, args.concurrency, lambda db, user: repository.hold_slot(
+            db, slot_id=slot_id, user=user, ttl_seconds=60))
+        elapsed = perf_counter() - started
+        holders = [user_id for user_id, result in zip(user_ids, holds) if not isinstance(result, (str, Exception))]
+        print(f"hold: {len(user_ids)} attempts in {elapsed:.2f}s, {len(holders)} held, "
+              f"refused {dict(Counter(str(result) for result in holds if isinstance(result, (str, Exception))))}")
+
+        def book(db, user):
+            result = repository.create_match(db, user, schemas.MatchCreate(title="bench booking", slot_id=slot_id, max_players=10))
+            return result if isinstance(result, str) else "booked"
+
+        started = perf_counter()
+        bookings = _race(sessions, user_ids, args.concurrency, book)
+        elapsed = perf_counter() - started
+        winners = [user_id for user_id, result in zip(user_ids, bookings) if result == "booked"]
+        print(f"book: {len(user_ids)} attempts in {elapsed:.2f}s, {len(winners)} booked, "
+              f"refused {dict(Counter(str(result) for result in bookings if result != 'booked'))}")
+        with SessionLocal() as db:
+            slot = db.execute(text("SELECT status, match_id, held_by FROM time_slots WHERE id = :id"), {"id": slot_id}).one()
+            matches = db.execute(text("SELECT count(*) FROM matches WHERE slot_id = :id"), {"id": slot_id}).scalar()
+        print(f"slot: status {slot.status}, held_by {slot.held_by}, matches on slot {matches}")
+        failed = (len(holders) != 1 or winners != holders or matches != 1
+                  or slot.status != models.TimeSlotStatus.booked.name or slot.held_by is not None)
+        print("FAILED: more than one or no winner" if failed else "ok: exactly one holder and one booking")
+    finally:
+        race_engine.dispose()
+        with SessionLocal() as db:
+            scratch.cleanup(db)
+    return 1 if failed else 0
+
+
+JOIN_STATE_SQL = text("""
+    SELECT m.max_players, m.confirmed_count, m.waitlist_count,
+           count(*) FILTER (WHERE mp.status = 'confirmed') AS confirmed,
+           count(*) FILTER (WHERE mp.status = 'waitlist') AS waitlist
+    FROM matches m LEFT JOIN match_players mp ON mp.match_id = m.id
+    WHERE m.id = :match_id
+    GROUP BY m.id
+""")
+
+
+def _join_violations(state) -> dict:
+    """{вид нарушения: пример} для строки JOIN_STATE_SQL."""
+    problems = {}
+    if state.confirmed > state.max_players:
+        problems["over capacity"] = f"{state.confirmed} confirmed > {state.max_players} seats"
+    if state.waitlist and state.confirmed < state.max_players:
+        problems["free seat while waitlisted"] = f"{state.confirmed}/{state.max_players} confirmed, {state.waitlist} waiting"
+    if (state.confirmed_count, state.waitlist_count) != (state.confirmed, state.waitlist):
+        problems["counter drift"] = (f"counters {state.confirmed_count}/{state.waitlist_count} "
+                                     f"vs rows {state.confirmed}/{state.waitlist}")
+    return problems
+
+
+def bench_join(args) -> int:
+    """Вступления и выходы вперемешку в один матч с листом ожидания. Пока идёт гонка, отдельное
+    соединение проверяет зафиксированное состояние: мест не больше max_players, свободного места
+    при непустом листе ожидания нет, счётчики совпадают со строками match_players."""
+    scratch = Scratch("join")
+    race_engine = create_engine(engine.url, pool_size=args.concurrency, max_overflow=0)
+    sessions = sessionmaker(bind=race_engine, autoflush=False)
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        captain, *user_ids = scratch.users(db, args.users + 1)
+        match_id = scratch.match(db, captain, [captain], args.max_players)
+        db.commit()
+    violations, examples, samples, done = Counter(), {}, 0, threading.Event()
+
+    def record(problems: dict):
+        violations.update(list(problems))
+        for kind, example in problems.items():
+            examples.setdefault(kind, example)
+
+    def monitor():
+        nonlocal samples
+        with SessionLocal() as db:
+            while not done.is_set():
+                record(_join_violations(db.execute(JOIN_STATE_SQL, {"match_id": match_id}).one()))
+                db.rollback()
+                samples += 1
+
+    def churn(db, user):
+        calls = 0
+        for _ in range(args.rounds):
+            match = db.get(models.Match, match_id)
+            repository.add_player_to_match(db, user, match)
+            if random.random() < 0.7:
+                repository.remove_player_from_match(db, user, db.get(models.Match, match_id))
+                calls += 1
+            calls += 1
+        return calls
+
+    watcher = threading.Thread(target=monitor)
+    watcher.start()
+    try:
+        started = perf_counter()
+        results = _race(sessions, user_ids, args.concurrency, churn)
+        elapsed = perf_counter() - started
+        calls = sum(result for result in results if isinstance(result, int))
+        for result in results:
+            if isinstance(result, Exception):
+                record({type(result).__name__: str(result).splitlines()[0]})
+        done.set()
+        watcher.join()
+        with SessionLocal() as db:
+            final = db.execute(JOIN_STATE_SQL, {"match_id": match_id}).one()
+        record({f"final: {kind}": example for kind, example in _join_violations(final).items()})
+        print(f"{calls} join/leave calls by {len(user_ids)} users in {elapsed:.2f}s ({calls / elapsed:.0f}/s), "
+              f"{samples} committed states checked")
+        print(f"final: {final.confirmed}/{final.max_players} confirmed, {final.waitlist} waiting, "
+              f"counters {final.confirmed_count}/{final.waitlist_count}")
+        for kind, count in violations.most_common():
+            print(f"VIOLATION {kind} x{count}, e.g. {examples[kind]}")
+        print("ok: capacity and waitlist order held" if not violations else "FAILED")
+    finally:
+        done.set()
+        race_engine.dispose()
+        with SessionLocal() as db:
+            scratch.cleanup(db)
+    return 1 if violations else 0
+
+
+SEARCH_SPORTS = ["football", "basketball", "tennis", "volleyball", "padel"]
+
+
+def _seed_search(db, scratch: Scratch, args) -> list:
+    """args.venues площадок по args.fields полей разных видов спорта и args.matches активных
+    матчей на них на 90 дней вперёд. Возвращает id площадок."""
+    owners = scratch.users(db, args.venues + args.captains)
+    captains, owners = owners[args.venues:], owners[:args.venues]
+    field_ids = [field_id for owner in owners for field_id in scratch.fields(db, owner, args.fields)]
+    db.execute(text("""
+        UPDATE fields SET sport = (CAST(:sports AS text[]))[1 + id % cardinality(CAST(:sports AS text[]))],
+                          price_per_hour = 3000 + (id % 8) * 1000
+        WHERE id = ANY(CAST(:ids AS integer[]))
+    """), {"sports": SEARCH_SPORTS, "ids": field_ids})
+    db.execute(text("""
+        INSERT INTO matches (title, captain_id, field_id, starts_at, max_players, status, is_private,
+                             waitlist_enabled, invite_code, confirmed_count, waitlist_count)
+        SELECT 'bench ' || :tag, (CAST(:captains AS integer[]))[1 + n % cardinality(CAST(:captains AS integer[]))],
+               (CAST(:fields AS integer[]))[1 + (CAST(n AS bigint) * 7919) % cardinality(CAST(:fields AS integer[]))],
+               date_trunc('hour', LOCALTIMESTAMP) + interval '1 hour' * (1 + (CAST(n AS bigint) * 104729) % (90 * 24)),
+               10 + n % 5 * 2, 'active', n % 10 = 0, n % 2 = 0, substr(md5(:tag || n), 1, 10), 1 + n % 13, 0
+        FROM generate_series(1, :count) AS n
+    """), {"tag": scratch.tag, "captains": captains, "fields": field_ids, "count": args.matches})
+    db.commit()
+    db.execute(text("ANALYZE matches"))
+    db.execute(text("ANALYZE fields"))
+    db.commit()
+    return db.execute(text("SELECT DISTINCT venue_id FROM fields WHERE id = ANY(CAST(:ids AS integer[]))"),
+                      {"ids": field_ids}).scalars().all()
+
+
+def bench_search(args) -> int:
+    """GET /api/matches/search без кэша ответа: случайные сочетания фильтров по синтетическим
+    матчам и проверка, что ни страница, ни фасеты не читают matches целиком."""
+    from sqlalchemy.dialects import postgresql
+
+    rng = random.Random(args.seed)
+    scratch = Scratch("search")
+    today = date.today()
+
+    def random_params():
+        params = {}
+        if rng.random() < 0.7:
+            params["sports"] = rng.sample(SEARCH_SPORTS, rng.randint(1, 2))
+        if rng.random() < 0.7:
+            params["date_from"] = today + timedelta(days=rng.randint(0, 80))
+            params["date_to"] = params["date_from"] + timedelta(days=rng.randint(0, 10))
+        if rng.random() < 0.3:
+            params["time_from"], params["time_to"] = day_time(18), day_time(22)
+        if rng.random() < 0.3:
+            params["price_min"], params["price_max"] = 4000, 8000
+        if rng.random() < 0.2:
+            params["venue_id"] = rng.choice(venue_ids)
+        if rng.random() < 0.4:
+            params["min_free_spots"] = rng.randint(1, 5)
+        if rng.random() < 0.3:
+            params["waitlist"] = rng.random() < 0.5
+        return schemas.MatchSearchParams(**params)
+
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        try:
+            started = perf_counter()
+            venue_ids = _seed_search(db, scratch, args)
+            total = db.execute(text("SELECT count(*) FROM matches WHERE status = 'active'")).scalar()
+            print(f"seeded {args.matches} matches in {perf_counter() - started:.1f}s ({total} active in total)")
+            for _ in range(20):
+                repository.search_matches(db, random_params(), args.limit)
+            print(f"{args.queries} random searches: "
+                  f"{percentiles(timed(lambda: repository.search_matches(db, random_params(), args.limit), args.queries))}")
+            statements = repository.match_search_statements(schemas.MatchSearchParams(
+                sports=["tennis"], date_from=today, date_to=today + timedelta(days=7), min_free_spots=2,
+            ), args.limit)
+            for name, statement in zip(("items", "facets"), statements):
+                sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                plan = [row[0].strip() for row in db.execute(text("EXPLAIN " + sql))]
+                scans = [line for line in plan if "Seq Scan on matches" in line]
+                print(f"{name} plan: {'seq scan on matches: ' + scans[0] if scans else 'no seq scan on matches'}")
+        finally:
+            scratch.cleanup(db)
+    return 0
+
+
+def bench_geo(args) -> int:
+    """Поиск полей рядом: сеточный индекс core.geo против полного перебора на синтетических
+    точках (без БД) и сверка результатов; --postgres — ещё и bounding box по ix_fields_lat_lon."""
+    rng = random.Random(args.seed)
+    center_lat, center_lon = 43.24, 76.92
+    points = [(n, center_lat + rng.uniform(-1.5, 1.5), center_lon + rng.uniform(-2, 2)) for n in range(1, args.fields + 1)]
+    # Точки по обе стороны антимеридиана: ячейки сетки там не соседние по номеру.
+    points += [(args.fields + 1, 10.0, 179.99), (args.fields + 2, 10.0, -179.99)]
+    index = geo.GeoIndex(args.cell_degrees)
+    started = perf_counter()
+    index.load(points)
+    print(f"load: {len(points)} fields in {(perf_counter() - started) * 1000:.1f} ms")
+
+    def random_point():
+        return center_lat + rng.uniform(-1.4, 1.4), center_lon + rng.uniform(-1.9, 1.9)
+
+    cases = (("k=20 within 100 km", 100, 20), ("radius 5 km", 5, None), ("radius 20 km", 20, None))
+    for name, radius, limit in cases:
+        print(f"index {name}: {percentiles(timed(lambda: index.search(*random_point(), radius, limit), args.queries))}")
+    print(f"brute force radius 5 km: {percentiles(timed(lambda: geo.rank(points, *random_point(), 5), args.queries // 10))}")
+
+    mismatches = 0
+    for _ in range(args.checks):
+        lat, lon = random_point()
+        radius, limit = rng.choice((1, 5, 20, 60)), rng.choice((None, 1, 10, 50))
+        found, expected = index.search(lat, lon, radius, limit), geo.rank(points, lat, lon, radius, limit)
+        # Равные расстояния допускают любой порядок id.
+        if [round(distance, 9) for _, distance in found] != [round(distance, 9) for _, distance in expected]:
+            mismatches += 1
+    across = [field_id for field_id, _ in index.search(10.0, 179.995, 5)]
+    if sorted(across) != [args.fields + 1, args.fields + 2]:
+        mismatches += 1
+    print(f"checked {args.checks} random queries and the antimeridian against brute force: {mismatches} mismatches")
+
+    if args.postgres:
+        scratch = Scratch("geo")
+        with SessionLocal() as db:
+            scratch.cleanup(db)
+            try:
+                owner = scratch.users(db, 1)[0]
+                field_ids = scratch.fields(db, owner, args.fields)
+                db.execute(text("""
+                    UPDATE fields SET latitude = :lat + (random() * 3 - 1.5), longitude = :lon + (random() * 4 - 2)
+                    WHERE id = ANY(CAST(:ids AS integer[]))
+                """), {"lat": center_lat, "lon": center_lon, "ids": field_ids})
+                db.commit()
+                db.execute(text("ANALYZE fields"))
+                db.commit()
+                for name, radius, limit in cases:
+                    def bbox():
+                        lat, lon = random_point()
+                        geo.rank(db.execute(repository.geo_bbox_query(lat, lon, radius)).all(), lat, lon, radius, limit)
+                    print(f"postgres bounding box {name}: {percentiles(timed(bbox, args.queries // 10))}")
+            finally:
+                scratch.cleanup(db)
+    return 1 if mismatches else 0
+
+
+VENUE_WORDS = ["Арена", "Спорт", "Олимп", "Чемпион", "Динамо", "Стадион", "Юность", "Победа", "Лига", "Гол",
+               "Центр", "Парк", "Атлант", "Феникс", "Кайрат", "Астана", "Алатау", "Тулпар", "Барыс", "Жетысу"]
+VENUE_STREETS = ["Абая", "Сатпаева", "Толе би", "Жандосова", "Розыбакиева", "Гагарина", "Навои", "Аль-Фараби"]
+VENUE_AMENITIES = ["душ", "парковка", "раздевалка", "освещение", "кафе", "трибуны", "прокат инвентаря"]
+
+# Заглушки pg_trgm для --emulate-trgm: похожесть — доля триграмм запроса в лучшем слове
+# документа (упрощённый word_similarity), без индекса. Создаются в транзакции замера
+# и откатываются вместе с ней.
+EMULATED_TRGM_SQL = [
+    """CREATE FUNCTION word_similarity(text, text) RETURNS real LANGUAGE sql IMMUTABLE AS $$
+        WITH q AS (
+            SELECT DISTINCT substr('  ' || w || ' ', i, 3) AS gram
+            FROM regexp_split_to_table(lower($1), '\\W+') AS w, generate_series(1, length(w) + 1) AS i
+            WHERE w <> ''
+        )
+        SELECT coalesce(max(hits)::real / nullif((SELECT count(*) FROM q), 0), 0) FROM (
+            SELECT count(DISTINCT substr('  ' || w || ' ', i, 3)) AS hits
+            FROM regexp_split_to_table(lower($2), '\\W+') AS w, generate_series(1, length(w) + 1) AS i
+            WHERE w <> '' AND substr('  ' || w || ' ', i, 3) IN (SELECT gram FROM q)
+            GROUP BY w
+        ) AS words
+    $$""",
+    """CREATE FUNCTION bench_word_similar(text, text) RETURNS boolean LANGUAGE sql STABLE AS $$
+        SELECT word_similarity($1, $2) >= current_setting('pg_trgm.word_similarity_threshold')::real
+    $$""",
+    "CREATE OPERATOR <% (LEFTARG = text, RIGHTARG = text, FUNCTION = bench_word_similar)",
+]
+
+
+def _venue_search_rows(rng: random.Random, venues: int) -> tuple:
+    """Синтетические (id, title, description) заведений и (id, venue_id, sport, address,
+    amenities, description) их полей — по 1-4 поля на заведение."""
+    venue_rows, field_rows = [], []
+    for venue_id in range(1, venues + 1):
+        venue_rows.append((venue_id, f"{rng.choice(VENUE_WORDS)} {rng.choice(VENUE_WORDS)} {venue_id}",
+                           f"Спортивный комплекс {rng.choice(VENUE_WORDS)}, {' и '.join(rng.sample(SEARCH_SPORTS, 2))}"))
+        for _ in range(rng.randint(1, 4)):
+            field_rows.append((len(field_rows) + 1, venue_id, rng.choice(SEARCH_SPORTS),
+                               f"ул. {rng.choice(VENUE_STREETS)} {rng.randint(1, 300)}",
+                               ", ".join(rng.sample(VENUE_AMENITIES, 2)), None))
+    return venue_rows, field_rows
+
+
+def _venue_search_query(rng: random.Random) -> str:
+    """Слово целиком, префикс, слово с опечаткой или два слова из разных колонок."""
+    word = rng.choice(VENUE_WORDS + VENUE_STREETS + SEARCH_SPORTS).lower()
+    kind = rng.randrange(4)
+    if kind == 1:
+        return word[:4]
+    if kind == 2:
+        cut = rng.randrange(1, len(word) - 1)
+        return word[:cut] + word[cut + 1:]
+    if kind == 3:
+        return f"{word} {rng.choice(VENUE_STREETS + VENUE_AMENITIES).lower()}"
+    return word
+
+
+def bench_venue_search(args) -> int:
+    """Поиск заведений: индекс в памяти на синтетических заведениях и полях (без БД);
+    --postgres — ещё и VENUE_SEARCH_SQL по тем же строкам в транзакции, которая в конце
+    откатывается, со сверкой выдачи с индексом в памяти."""
+    from core.text_search import TextSearchIndex, text_search_index
+
+    rng = random.Random(args.seed)
+    venue_rows, field_rows = _venue_search_rows(rng, args.venues)
+    queries = [_venue_search_query(rng) for _ in range(args.queries)]
+    index = TextSearchIndex("memory", text_search_index.similarity_threshold)
+    started = perf_counter()
+    index.load(venue_rows, field_rows)
+    print(f"memory load: {len(venue_rows)} venues, {len(field_rows)} fields in "
+          f"{(perf_counter() - started) * 1000:.0f} ms, {index.stats()['tokens']} tokens")
+    pending = iter(queries * 2)
+    print(f"memory search: {percentiles(timed(lambda: index.search(next(pending), args.limit), args.queries))}")
+    if not args.postgres:
+        return 0
+
+    with SessionLocal() as db:
+        has_trgm = db.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")).scalar()
+        if not has_trgm and not args.emulate_trgm:
+            print("pg_trgm is not installed: the Postgres path needs it (or --emulate-trgm to check the SQL)")
+            return 0
+        backend = text_search_index.backend
+        try:
+            if not has_trgm:
+                for statement in EMULATED_TRGM_SQL:
+                    db.execute(text(statement))
+            owners = sorted(Scratch("venue-search").users(db, args.venues))
+            venue_ids = db.execute(text("""
+                INSERT INTO venue_profiles (owner_id, iin_bin, title, description)
+                SELECT owner_id, 'S' || lpad(CAST(owner_id AS text), 11, '0'), title, description
+                FROM unnest(CAST(:owners AS integer[]), CAST(:titles AS text[]), CAST(:descriptions AS text[]))
+                     AS v(owner_id, title, description)
+                ORDER BY owner_id
+                RETURNING id
+            """), {"owners": owners, "titles": [row[1] for row in venue_rows],
+                   "descriptions": [row[2] for row in venue_rows]}).scalars().all()
+            db.execute(text("""
+                INSERT INTO fields (venue_id, sport, address, amenities, price_per_hour)
+                SELECT (CAST(:venue_ids AS integer[]))[venue], sport, address, amenities, 5000
+                FROM unnest(CAST(:venues AS integer[]), CAST(:sports AS text[]), CAST(:addresses AS text[]),
+                            CAST(:amenities AS text[])) AS f(venue, sport, address, amenities)
+            """), {"venue_ids": sorted(venue_ids), "venues": [row[1] for row in field_rows],
+                   "sports": [row[2] for row in field_rows], "addresses": [row[3] for row in field_rows],
+                   "amenities": [row[4] for row in field_rows]})
+            db.execute(text("ANALYZE venue_profiles"))
+            db.execute(text("ANALYZE fields"))
+            # Индекс в памяти по тем же строкам базы — для сверки выдачи.
+            index.load(db.execute(repository.text_search_venue_rows_query()).all(),
+                       db.execute(repository.text_search_field_rows_query()).all())
+            text_search_index.backend = "postgres"
+            label = "postgres" if has_trgm else "postgres (emulated pg_trgm, no trigram index)"
+            checked = queries[:args.postgres_queries or (100 if has_trgm else 5)]
+            timings, overlap = [], []
+            for query in checked:
+                started = perf_counter()
+                found = {venue.id for venue in repository.search_venues(db, query, args.limit)}
+                timings.append(perf_counter() - started)
+                # Ранжирование у ts_rank и индекса в памяти разное, поэтому сверяются не первые
+                # limit, а то, находит ли индекс в памяти вообще каждое заведение из выдачи.
+                matched = {venue_id for venue_id, _, _ in index.search(query, len(venue_rows))}
+                overlap.append(len(found & matched) / len(found) if found else float(not matched))
+            print(f"{label} search_venues: {percentiles(timings)}")
+            print(f"Postgres top-{args.limit} also found by the memory index over {len(checked)} queries: "
+                  f"mean {sum(overlap) / len(overlap):.2f}, complete {sum(value == 1.0 for value in overlap)}")
+        finally:
+            text_search_index.backend = backend
+            db.rollback()
+    return 0
+
+
+def _review_request(players: list, no_shows: int) -> schemas.BulkReviewRequest:
+    """Оценки обоих типов каждому игроку и неявки последних no_shows из них."""
+    return schemas.BulkReviewRequest(
+        reviews=[schemas.PlayerReviewCreate(subject_id=player, review_type=review_type, rating=player % 5 + 1)
+                 for player in players for review_type in ("skill", "sportsmanship")],
+        no_shows=[schemas.NoShowCreate(subject_id=player) for player in players[len(players) - no_shows:]],
+    )
+
+
+REVIEW_COUNTS_SQL = text("""
+SELECT id, reviews_count, no_show_count FROM users WHERE id = ANY(CAST(:ids AS integer[]))
+""")
+
+
+def bench_reviews(args) -> int:
+    """Отзывы и неявки после матча: число SQL-запросов и время process_reviews_and_no_shows
+    на разных составах, затем одновременные отправки по разным матчам с одними и теми же
+    игроками — счётчики users не должны терять обновлений."""
+    scratch = Scratch("reviews")
+    rosters = [int(size) for size in args.rosters.split(",")]
+    statements = Counter()
+    race_engine = create_engine(engine.url, pool_size=args.concurrency, max_overflow=0)
+    sessions = sessionmaker(bind=race_engine, autoflush=False)
+    failed, errors, lost = 0, [], []
+
+    def count_statement(*_):
+        statements["sql"] += 1
+
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        event.listen(engine, "before_cursor_execute", count_statement)
+        try:
+            captain, *players = scratch.users(db, max(rosters) + 1)
+
+            def finished_match(size: int) -> int:
+                match_id = scratch.finished_match(db, captain, players[:size])
+                db.commit()
+                return match_id
+
+            for size in rosters:
+                request = _review_request(players[:size], args.no_shows)
+                timings, counts = [], set()
+                for _ in range(args.queries):
+                    match_id = finished_match(size)
+                    statements.clear()
+                    started = perf_counter()
+                    result = repository.process_reviews_and_no_shows(db, match_id, captain, request)
+                    timings.append(perf_counter() - started)
+                    counts.add(statements["sql"])
+                    if result != {"reviews_added": 2 * size, "no_shows_marked": args.no_shows}:
+                        failed += 1
+                repeated = repository.process_reviews_and_no_shows(db, match_id, captain, request)
+                print(f"{size} players ({2 * size} reviews, {args.no_shows} no-shows): "
+                      f"SQL statements per request {sorted(counts)}, {percentiles(timings)}, "
+                      f"repeat applies {repeated['reviews_added']} reviews")
+
+            size = max(rosters)
+            request = _review_request(players[:size], args.no_shows)
+            match_ids = iter([finished_match(size) for _ in range(args.concurrency)])
+            before = {row.id: row for row in db.execute(REVIEW_COUNTS_SQL, {"ids": players[:size]})}
+            db.commit()
+            results = _race(sessions, [captain] * args.concurrency, args.concurrency,
+                            lambda session, user: repository.process_reviews_and_no_shows(
+                                session, next(match_ids), user.id, request))
+            errors = [result for result in results if isinstance(result, Exception)]
+            for row in db.execute(REVIEW_COUNTS_SQL, {"ids": players[:size]}):
+                no_shows = args.concurrency if row.id in players[size - args.no_shows:size] else 0
+                if (row.reviews_count - before[row.id].reviews_count != 2 * (args.concurrency - len(errors))
+                        or row.no_show_count - before[row.id].no_show_count != no_shows - (len(errors) if no_shows else 0)):
+                    lost.append(row.id)
+            print(f"{args.concurrency} concurrent submissions on the same {size} players: "
+                  f"{len(errors)} errors, {len(lost)} players with lost updates, {failed} unexpected results")
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statement)
+            scratch.cleanup(db)
+            race_engine.dispose()
+    return 1 if failed or errors or lost else 0
+
+
+# Игроки, у которых числа и средние в users расходятся с точным подсчётом по player_reviews.
+RATING_MISMATCH_SQL = text("""
+SELECT u.id
+FROM users u
+LEFT JOIN (
+    SELECT subject_id,
+           count(*) FILTER (WHERE review_type = 'skill') AS skill_count,
+           avg(rating) FILTER (WHERE review_type = 'skill') AS skill_rating,
+           count(*) FILTER (WHERE review_type = 'sportsmanship') AS sportsmanship_count,
+           avg(rating) FILTER (WHERE review_type = 'sportsmanship') AS sportsmanship_rating
+    FROM player_reviews
+    WHERE subject_id = ANY(CAST(:ids AS integer[]))
+    GROUP BY subject_id
+) r ON r.subject_id = u.id
+WHERE u.id = ANY(CAST(:ids AS integer[])) AND (
+    u.skill_reviews_count <> coalesce(r.skill_count, 0)
+    OR u.sportsmanship_reviews_count <> coalesce(r.sportsmanship_count, 0)
+    OR abs(u.skill_rating - r.skill_rating) > 1e-6 OR abs(u.sportsmanship_rating - r.sportsmanship_rating) > 1e-6
+)
+""")
+
+# count отзывов без онлайн-обработки: каждая пара (автор, игрок) по разу на тип в матче.
+SEED_REVIEWS_SQL = text("""
+INSERT INTO player_reviews (match_id, reviewer_id, subject_id, review_type, rating)
+SELECT (CAST(:matches AS integer[]))[1 + k / (p * p)],
+       (CAST(:reviewers AS integer[]))[1 + k % p], (CAST(:subjects AS integer[]))[1 + k / p % p],
+       CAST(CASE WHEN n % 2 = 0 THEN 'skill' ELSE 'sportsmanship' END AS reviewtype), 1 + n * 7 % 5
+FROM generate_series(0, :count - 1) AS n,
+     LATERAL (SELECT n / 2 AS k, cardinality(CAST(:subjects AS integer[])) AS p) AS pair
+""")
+
+
+def bench_recompute(args) -> int:
+    """Пересчёт рейтингов: полный и инкрементальный на синтетических отзывах, отзыв,
+    закоммиченный позже отзывов с большим id, и полный пересчёт под потоком онлайн-отзывов.
+    После каждого шага числа и средние игроков сверяются с точным подсчётом."""
+    scratch = Scratch("recompute")
+    mismatched = 0
+
+    def seed(db, players: list, count: int) -> None:
+        matches = [scratch.finished_match(db, captain, []) for _ in range(count // (2 * len(players) ** 2) + 1)]
+        db.execute(SEED_REVIEWS_SQL, {"matches": matches, "reviewers": players, "subjects": players, "count": count})
+        db.commit()
+
+    def report(db, name: str, result: dict) -> None:
+        nonlocal mismatched
+        wrong = db.execute(RATING_MISMATCH_SQL, {"ids": everyone}).scalars().all()
+        db.commit()
+        mismatched += len(wrong)
+        print(f"{name}: {result['reviews_read']} reviews read in {result['read_seconds']}s, "
+              f"{result['users_updated']} of {result['users_checked']} users updated, {result['seconds']}s total, "
+              f"high-water mark {result['last_review_id']}; {len(wrong)} players off the exact counts")
+
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        try:
+            captain, late_reviewer, late_subject, *players = scratch.users(db, args.players + 3)
+            everyone = players + [late_subject]
+            started = perf_counter()
+            seed(db, players, args.reviews)
+            print(f"seeded {args.reviews} reviews on {args.players} players in {perf_counter() - started:.1f}s")
+            report(db, "full", repository.recompute_ratings(db, full=True, chunk_size=args.chunk_size))
+            report(db, "incremental, nothing new", repository.recompute_ratings(db, chunk_size=args.chunk_size))
+            seed(db, players, args.reviews // 100)
+            report(db, f"incremental after {args.reviews // 100} new reviews",
+                   repository.recompute_ratings(db, chunk_size=args.chunk_size))
+
+            # Отзыв берёт id, но коммитится после отзывов с большими id и после пересчёта.
+            with SessionLocal() as late:
+                match_id = scratch.finished_match(late, captain, [])
+                late.execute(SEED_REVIEWS_SQL, {"matches": [match_id], "reviewers": [late_reviewer],
+                                                "subjects": [late_subject], "count": 1})
+                seed(db, players, 100)
+                report(db, "incremental before the late commit", repository.recompute_ratings(db, chunk_size=args.chunk_size))
+                late.commit()
+            report(db, "incremental after the late commit", repository.recompute_ratings(db, chunk_size=args.chunk_size))
+
+            roster = players[:args.roster]
+            request = _review_request(roster, 0)
+            matches = [scratch.finished_match(db, captain, roster) for _ in range(args.matches)]
+            db.commit()
+            done, submitted = threading.Event(), []
+
+            def submit():
+                with SessionLocal() as online:
+                    for match_id in matches:
+                        if done.is_set():
+                            break
+                        repository.process_reviews_and_no_shows(online, match_id, captain, request)
+                        submitted.append(match_id)
+
+            writer = threading.Thread(target=submit)
+            writer.start()
+            try:
+                result = repository.recompute_ratings(db, full=True, chunk_size=args.chunk_size)
+            finally:
+                done.set()
+                writer.join()
+            report(db, f"full with {len(submitted)} online submissions during it", result)
+        finally:
+            scratch.cleanup(db)
+    return 1 if mismatched else 0
+
+
+LEADERBOARD_POSITIONS = ["вратарь", "защитник", "полузащитник", "нападающий", None]
+LEADERBOARD_LEVELS = ["новичок", "любитель", "продвинутый", "профи", None]
+
+
+def _leaderboard_row(rng: random.Random, user_id: int) -> tuple:
+    """Строка leaderboard_rows_query: у игрока без отзывов этого типа оценки нет."""
+    skill_count, sportsmanship_count = rng.randint(0, 40), rng.randint(0, 40)
+    return (user_id, rng.choice(LEADERBOARD_POSITIONS), rng.choice(LEADERBOARD_LEVELS),
+            rng.uniform(1, 5) if skill_count else None, skill_count,
+            rng.uniform(1, 5) if sportsmanship_count else None, sportsmanship_count)
+
+
+def _leaderboard_brute(rows: dict, metric: str, position=None, level=None, min_reviews: int = 0) -> list:
+    """id игроков по месту в таблице, перебором всех строк."""
+    score, count = (3, 4) if metric == "skill" else (5, 6)
+    ranked = [row for row in rows.values() if row[score] is not None and row[count] >= min_reviews
+              and (position is None or row[1] == position) and (level is None or row[2] == level)]
+    ranked.sort(key=lambda row: (-row[score], row[0]))
+    return [row[0] for row in ranked]
+
+
+def bench_leaderboard(args) -> int:
+    """Таблица лидеров: страницы топа и места игроков по индексу core.leaderboard на
+    синтетических игроках (без БД), сверка с перебором до и после точечного обновления;
+    --postgres — ещё и материализованное представление leaderboard на данных базы."""
+    from core.leaderboard import LeaderboardIndex
+
+    rng = random.Random(args.seed)
+    rows = {user_id: _leaderboard_row(rng, user_id) for user_id in range(1, args.players + 1)}
+    index = LeaderboardIndex()
+    started = perf_counter()
+    index.load(rows.values())
+    print(f"load: {args.players} players in {perf_counter() - started:.2f}s")
+
+    def random_filters():
+        return (rng.choice(leaderboard.METRICS), rng.choice(LEADERBOARD_POSITIONS), rng.choice(LEADERBOARD_LEVELS),
+                rng.choice((0, 0, 10)))
+
+    cases = (
+        ("top-20", lambda: index.top("skill")),
+        ("top-20 by position", lambda: index.top("skill", rng.choice(LEADERBOARD_POSITIONS[:-1]))),
+        ("top-20, random filters", lambda: index.top(*random_filters())),
+        ("page at offset 5000, by position", lambda: index.top("skill", "вратарь", offset=5000)),
+        ("rank", lambda: index.rank("skill", rng.randint(1, args.players))),
+        ("rank, random filters", lambda: index.rank(random_filters()[0], rng.randint(1, args.players),
+                                                    *random_filters()[1:])),
+    )
+    for name, query in cases:
+        print(f"{name}: {percentiles(timed(query, args.queries))}")
+
+    def mismatches(checks: int) -> int:
+        wrong = 0
+        for _ in range(checks):
+            metric, position, level, min_reviews = random_filters()
+            expected = _leaderboard_brute(rows, metric, position, level, min_reviews)
+            offset = rng.randrange(max(len(expected) - 50, 1))
+            total, page = index.top(metric, position, level, min_reviews, limit=50, offset=offset)
+            if total != len(expected) or [user_id for _, user_id, _, _ in page] != expected[offset:offset + 50]:
+                wrong += 1
+            for place in rng.sample(range(len(expected)), min(5, len(expected))):
+                if index.rank(metric, expected[place], position, level, min_reviews)[:2] != (place + 1, len(expected)):
+                    wrong += 1
+        return wrong
+
+    wrong = mismatches(args.checks)
+    print(f"checked {args.checks} random filters against brute force: {wrong} mismatches")
+    changed = sorted({rng.randint(1, args.players) for _ in range(args.changes)})
+    for user_id in changed:
+        rows[user_id] = _leaderboard_row(rng, user_id)
+    started = perf_counter()
+    index.refresh(changed, [rows[user_id] for user_id in changed])
+    print(f"refresh of {len(changed)} changed players: {(perf_counter() - started) * 1000:.1f} ms")
+    after = mismatches(args.checks)
+    print(f"after the refresh: {after} mismatches")
+    wrong += after
+
+    if args.postgres:
+        with SessionLocal() as db:
+            repository.refresh_leaderboard_view(db)
+            index.load(db.execute(repository.leaderboard_rows_query()).all())
+            rows = {row[0]: tuple(row) for row in db.execute(repository.leaderboard_rows_query()).all()}
+            print(f"postgres: {len(rows)} rated players in the database")
+
+            def page():
+                metric, position, level, min_reviews = random_filters()
+                return db.execute(repository.LEADERBOARD_PAGE_SQL[metric], {
+                    "position": position, "level": level, "min_reviews": min_reviews, "limit": 20, "offset": 0,
+                }).all()
+
+            def rank():
+                metric, position, level, min_reviews = random_filters()
+                return db.execute(repository.LEADERBOARD_RANK_SQL[metric], {
+                    "user_id": rng.choice(list(rows)), "position": position, "level": level, "min_reviews": min_reviews,
+                }).one_or_none()
+
+            print(f"materialized view, top-20 with random filters: {percentiles(timed(page, args.queries // 10))}")
+            print(f"materialized view, rank with random filters: {percentiles(timed(rank, args.queries // 10))}")
+            differ = 0
+            for _ in range(args.checks):
+                metric, position, level, min_reviews = random_filters()
+                view = db.execute(repository.LEADERBOARD_PAGE_SQL[metric], {
+                    "position": position, "level": level, "min_reviews": min_reviews, "limit": 50, "offset": 0,
+                }).all()
+                total, top = index.top(metric, position, level, min_reviews, limit=50)
+                if [row.user_id for row in view] != [user_id for _, user_id, _, _ in top] \
+                        or (view[0].total if view else 0) != total:
+                    differ += 1
+            print(f"view against the index on {args.checks} random filters: {differ} differ")
+            wrong += differ
+    return 1 if wrong else 0
+
+
+async def _upload_storm(args, port: int, emails: list) -> dict:
+    """Одновременные загрузки фото, повтор одного файла всеми, слишком большие файлы
+    (с Content-Length и без) и медленные клиенты, пока другой запрос ждёт ответа."""
+    process = psutil.Process(args.server_pid)
+    headers = [{"Authorization": f"Bearer {create_access_token({'sub': email})}"} for email in emails]
+    size = int(args.size_mb * 1024 * 1024)
+    payloads = [os.urandom(size) for _ in emails]
+    result = {"urls": set(), "errors": []}
+    peak = idle = process.memory_info().rss
+    sampling = True
+
+    async def sample():
+        nonlocal peak
+        while sampling:
+            peak = max(peak, process.memory_info().rss)
+            await asyncio.sleep(0.005)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=300,
+                                 limits=httpx.Limits(max_connections=len(emails) + 1)) as client:
+        async def upload(index: int, payload, name: str = "photo.jpg"):
+            started = perf_counter()
+            response = await client.post("/api/users/me/upload-photo", headers=headers[index],
+                                         files={"file": (name, payload)})
+            if response.status_code == 200:
+                result["urls"].add(response.json()["photo_url"])
+            return response.status_code, perf_counter() - started
+
+        sampler = asyncio.create_task(sample())
+        started = perf_counter()
+        storm = await asyncio.gather(*(upload(index, payload) for index, payload in enumerate(payloads)))
+        result["storm_seconds"] = perf_counter() - started
+        sampling = False
+        await sampler
+        result["storm"] = [seconds for status, seconds in storm if status == 200]
+        result["errors"] += [status for status, _ in storm if status != 200]
+        result["rss_per_upload"] = (peak - idle) / len(emails)
+
+        same = await asyncio.gather(*(upload(index, payloads[0]) for index in range(len(emails))))
+        result["errors"] += [status for status, _ in same if status != 200]
+        result["stored_urls"] = len(result["urls"])
+
+        too_big = os.urandom(settings.UPLOAD_MAX_PHOTO_BYTES + 1024 * 1024)
+
+        async def chunked():
+            for start in range(0, len(too_big), 64 * 1024):
+                yield too_big[start:start + 64 * 1024]
+
+        boundary = "bench-boundary"
+
+        async def multipart(body):
+            yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.jpg\"\r\n"
+                   f"Content-Type: application/octet-stream\r\n\r\n").encode()
+            async for chunk in body:
+                yield chunk
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        status, seconds = await upload(0, too_big)
+        response = await client.post(
+            "/api/users/me/upload-photo", content=multipart(chunked()),
+            headers={**headers[0], "Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        result["too_big"], result["too_big_seconds"] = [status, response.status_code], seconds
+
+        async def trickle(payload):
+            for start in range(0, len(payload), 16 * 1024):
+                yield payload[start:start + 16 * 1024]
+                await asyncio.sleep(args.slow_seconds * 16 * 1024 / len(payload))
+
+        async def slow_upload(index: int):
+            response = await client.post(
+                "/api/users/me/upload-photo", content=multipart(trickle(payloads[index][:256 * 1024])),
+                headers={**headers[index], "Content-Type": f"multipart/form-data; boundary={boundary}"},
+            )
+            if response.status_code == 200:
+                result["urls"].add(response.json()["photo_url"])
+            else:
+                result["errors"].append(response.status_code)
+
+        slow = [asyncio.create_task(slow_upload(index)) for index in range(min(args.slow, len(emails)))]
+        await asyncio.sleep(args.slow_seconds / 4)
+        probes = []
+        for _ in range(20):
+            started = perf_counter()
+            response = await client.get("/api/users/me", headers=headers[-1])
+            probes.append(perf_counter() - started)
+            if response.status_code != 200:
+                result["errors"].append(response.status_code)
+            await asyncio.sleep(0.05)
+        await asyncio.gather(*slow)
+        result["probes"] = probes
+    return result
+
+
+def bench_uploads(args) -> int:
+    """Загрузка фото на отдельный воркер uvicorn: пропускная способность и память сервера
+    при одновременных загрузках, дедупликация, отказ 413 и медленные клиенты.
+    Файлы, сохранённые замером, удаляются вместе с синтетическими пользователями."""
+    scratch = Scratch("uploads")
+    with SessionLocal() as db:
+        scratch.cleanup(db)
+        scratch.users(db, args.uploads)
+        emails = db.execute(text("SELECT email FROM users WHERE email LIKE :pattern ORDER BY id"),
+                            {"pattern": scratch.pattern}).scalars().all()
+        db.commit()
+    server = _start_server(args.port)
+    result = {"urls": set()}
+    try:
+        args.server_pid = server.pid
+        result = asyncio.run(_upload_storm(args, args.port, emails))
+        storm_mb = args.uploads * args.size_mb
+        print(f"{args.uploads} concurrent {args.size_mb} MB uploads: {storm_mb / result['storm_seconds']:.0f} MB/s, "
+              f"{percentiles(result['storm'])}, server RSS +{result['rss_per_upload'] / 2**20:.2f} MB per upload")
+        print(f"the same file from {args.uploads} users: {result['stored_urls'] - args.uploads} extra files stored")
+        print(f"over the limit: with Content-Length {result['too_big'][0]} in {result['too_big_seconds'] * 1000:.0f} ms, "
+              f"chunked {result['too_big'][1]}")
+        print(f"GET /api/users/me during {args.slow} slow uploads: {percentiles(result['probes'])}")
+        print(f"failed requests: {len(result['errors'])}")
+        print(json.dumps(httpx.get(f"http://127.0.0.1:{args.port}/api/metrics").json()["uploads"]))
+    finally:
+        server.terminate()
+        server.wait()
+        with SessionLocal() as db:
+            scratch.cleanup(db)
+        for url in result["urls"]:
+            path = url.lstrip("/")
+            if os.path.isfile(path):
+                os.remove(path)
+                if not os.listdir(os.path.dirname(path)):
+                    os.rmdir(os.path.dirname(path))
+    return 0 if not result.get("errors") and result.get("too_big") == [413, 413] else 1
+
+
+def add_commands(commands) -> None:
+    login = commands.add_parser("bench-login", help="пропускная способность проверки паролей при входе")
+    login.add_argument("--logins", type=int, default=200, help="всего проверок пароля")
+    login.add_argument("--concurrency", type=int, default=50, help="одновременных входов")
+    login.add_argument("--kind", default="thread", choices=("thread", "process"))
+    login.add_argument("--workers", type=int, default=4)
+    login.add_argument("--max-queue", type=int, default=64)
+    login.set_defaults(handler=bench_login)
+
+    bench = commands.add_parser("bench-recommendations", help="замерить рекомендации матчей на синтетических данных")
+    bench.add_argument("--matches", type=int, default=50000, help="активных матчей в индексе")
+    bench.add_argument("--players", type=int, default=200000, help="игроков, из которых набираются составы")
+    bench.add_argument("--queries", type=int, default=2000, help="запросов рекомендаций и вступлений/выходов")
+    bench.add_argument("--limit", type=int, default=20, help="матчей в одной рекомендации")
+    bench.add_argument("--seed", type=int, default=1)
+    bench.set_defaults(handler=bench_recommendations)
+
+    feed = commands.add_parser("bench-feed", help="лента матчей: OFFSET против курсора на ближних и дальних страницах")
+    feed.add_argument("--pages", default="1,1000", help="номера страниц через запятую")
+    feed.add_argument("--limit", type=int, default=20, help="матчей на странице")
+    feed.add_argument("--queries", type=int, default=200, help="запросов на каждую страницу")
+    feed.set_defaults(handler=bench_feed)
+
+    writes = commands.add_parser("bench-match-writes", help="join/leave с ответом MatchDetailsPublic на разных составах")
+    writes.add_argument("--rosters", default="10,50", help="размеры составов через запятую")
+    writes.add_argument("--queries", type=int, default=300, help="циклов вступления и выхода на состав")
+    writes.set_defaults(handler=bench_match_writes)
+
+    rooms = commands.add_parser("bench-rooms", help="нагрузка на WebSocket-комнаты матчей")
+    rooms.add_argument("--sockets", type=int, default=2000, help="открытых сокетов")
+    rooms.add_argument("--rooms", type=int, default=20, help="матчей, между которыми делятся сокеты")
+    rooms.add_argument("--events", type=int, default=100, help="пар вступление+выход")
+    rooms.add_argument("--pause", type=float, default=0.05, help="секунд между парами")
+    rooms.add_argument("--connect-concurrency", type=int, default=50, help="одновременных подключений")
+    rooms.add_argument("--port", type=int, default=8765)
+    rooms.set_defaults(handler=bench_rooms)
+
+    schedule = commands.add_parser("bench-schedule", help="генерация расписания: построчно и одной вставкой")
+    schedule.add_argument("--days", type=int, default=90, help="дней расписания (08:00-23:00, слоты по часу)")
+    schedule.add_argument("--fields", type=int, default=5, help="полей на каждый способ")
+    schedule.set_defaults(handler=bench_schedule)
+
+    availability = commands.add_parser("bench-availability", help="неделя площадки: запросы по дням против сетки")
+    availability.add_argument("--fields", type=int, default=8)
+    availability.add_argument("--days", type=int, default=7)
+    availability.add_argument("--queries", type=int, default=30, help="просмотров на каждый способ")
+    availability.set_defaults(handler=bench_availability)
+
+    partitioned = commands.add_parser("bench-partitions", help="слоты дня и генерация расписания при росте истории time_slots")
+    partitioned.add_argument("--years", type=int, default=3, help="лет истории, добавляемых по одному")
+    partitioned.add_argument("--fields", type=int, default=20, help="полей с историей (слоты по 30 минут, 08:00-23:00)")
+    partitioned.add_argument("--queries", type=int, default=200, help="запросов слотов дня на каждом шаге")
+    partitioned.set_defaults(handler=bench_partitions)
+
+    booking = commands.add_parser("bench-booking", help="одновременные удержания и брони одного слота: ровно один победитель")
+    booking.add_argument("--users", type=int, default=400, help="пользователей, борющихся за слот")
+    booking.add_argument("--concurrency", type=int, default=64, help="одновременных соединений")
+    booking.set_defaults(handler=bench_booking)
+
+    join = commands.add_parser("bench-join", help="вступления и выходы вперемешку: вместимость и лист ожидания")
+    join.add_argument("--users", type=int, default=300, help="игроков, вступающих и выходящих")
+    join.add_argument("--max-players", type=int, default=10)
+    join.add_argument("--rounds", type=int, default=5, help="вступлений на игрока (после 70% из них — выход)")
+    join.add_argument("--concurrency", type=int, default=64, help="одновременных соединений")
+    join.set_defaults(handler=bench_join)
+
+    search = commands.add_parser("bench-search", help="поиск матчей с фасетами на синтетических матчах")
+    search.add_argument("--matches", type=int, default=100000, help="активных матчей")
+    search.add_argument("--venues", type=int, default=30)
+    search.add_argument("--fields", type=int, default=5, help="полей на площадке")
+    search.add_argument("--captains", type=int, default=50, help="пользователей-капитанов")
+    search.add_argument("--queries", type=int, default=1000, help="случайных поисков")
+    search.add_argument("--limit", type=int, default=50, help="матчей на странице")
+    search.add_argument("--seed", type=int, default=1)
+    search.set_defaults(handler=bench_search)
+
+    nearby = commands.add_parser("bench-geo", help="поиск полей рядом: сеточный индекс против перебора")
+    nearby.add_argument("--fields", type=int, default=50000, help="полей с координатами")
+    nearby.add_argument("--queries", type=int, default=2000, help="запросов на каждый вид поиска")
+    nearby.add_argument("--checks", type=int, default=300, help="случайных сверок с перебором")
+    nearby.add_argument("--cell-degrees", type=float, default=0.05)
+    nearby.add_argument("--postgres", action="store_true", help="замерить и bounding box в БД (GEO_INDEX_ENABLED=false)")
+    nearby.add_argument("--seed", type=int, default=1)
+    nearby.set_defaults(handler=bench_geo)
+
+    venue_search = commands.add_parser("bench-venue-search", help="поиск заведений: индекс в памяти и VENUE_SEARCH_SQL")
+    venue_search.add_argument("--venues", type=int, default=20000, help="заведений (полей в 1-4 раза больше)")
+    venue_search.add_argument("--queries", type=int, default=2000, help="поисков по индексу в памяти")
+    venue_search.add_argument("--limit", type=int, default=20, help="заведений в выдаче")
+    venue_search.add_argument("--postgres", action="store_true",
+                              help="замерить и запрос к БД (строки вставляются в транзакции и откатываются)")
+    venue_search.add_argument("--postgres-queries", type=int, default=None,
+                              help="поисков средствами Postgres (по умолчанию 100, с --emulate-trgm — 5)")
+    venue_search.add_argument("--emulate-trgm", action="store_true",
+                              help="без pg_trgm подменить word_similarity и <% медленными SQL-функциями")
+    venue_search.add_argument("--seed", type=int, default=1)
+    venue_search.set_defaults(handler=bench_venue_search)
+
+    reviews = commands.add_parser("bench-reviews", help="отзывы и неявки после матча: запросы, время, гонки счётчиков")
+    reviews.add_argument("--rosters", default="10,20,40", help="размеры составов через запятую")
+    reviews.add_argument("--no-shows", type=int, default=3, help="неявок в каждой отправке")
+    reviews.add_argument("--queries", type=int, default=30, help="отправок на каждый состав")
+    reviews.add_argument("--concurrency", type=int, default=16, help="одновременных отправок по разным матчам")
+    reviews.set_defaults(handler=bench_reviews)
+
+    recompute = commands.add_parser("bench-recompute", help="пересчёт рейтингов: полный, инкрементальный, гонки с онлайн-отзывами")
+    recompute.add_argument("--reviews", type=int, default=300000, help="синтетических отзывов")
+    recompute.add_argument("--players", type=int, default=60, help="игроков, между которыми распределены отзывы")
+    recompute.add_argument("--roster", type=int, default=20, help="состав матча онлайн-отзывов")
+    recompute.add_argument("--matches", type=int, default=500, help="матчей с онлайн-отзывами во время полного пересчёта")
+    recompute.add_argument("--chunk-size", type=int, default=50000, help="отзывов и пользователей на пачку")
+    recompute.set_defaults(handler=bench_recompute)
+
+    ranking = commands.add_parser("bench-leaderboard", help="таблица лидеров: индекс в памяти против перебора и представления")
+    ranking.add_argument("--players", type=int, default=1000000, help="синтетических игроков")
+    ranking.add_argument("--queries", type=int, default=2000, help="запросов на каждый вид")
+    ranking.add_argument("--checks", type=int, default=20, help="случайных сверок с перебором")
+    ranking.add_argument("--changes", type=int, default=200, help="игроков, меняющихся перед обновлением индекса")
+    ranking.add_argument("--postgres", action="store_true", help="сравнить с материализованным представлением")
+    ranking.add_argument("--seed", type=int, default=1)
+    ranking.set_defaults(handler=bench_leaderboard)
+
+    uploads = commands.add_parser("bench-uploads", help="загрузки фото: пропускная способность, память, 413, медленные клиенты")
+    uploads.add_argument("--uploads", type=int, default=50, help="одновременных загрузок (и синтетических пользователей)")
+    uploads.add_argument("--size-mb", type=float, default=4, help="размер файла")
+    uploads.add_argument("--slow", type=int, default=30, help="медленных загрузок по 256 КБ")
+    uploads.add_argument("--slow-seconds", type=float, default=5, help="за сколько медленный клиент отправляет файл")
+    uploads.add_argument("--port", type=int, default=8766)
+    uploads.set_defaults(handler=bench_uploads)
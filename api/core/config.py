@@ -1,11 +1,73 @@
 from pydantic_settings import BaseSettings
+from sqlalchemy.engine import make_url
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DB_ASYNC: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
     SECRET_KEY: str
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+    PASSWORD_POOL_KIND: str = "thread"  # thread | process
+    PASSWORD_POOL_WORKERS: int = 4
+    PASSWORD_POOL_MAX_QUEUE: int = 64
+    RESPONSE_CACHE_BACKEND: str = "memory"  # memory | redis
+    RESPONSE_CACHE_TTL_SECONDS: int = 300
+    RESPONSE_CACHE_MAX_SIZE: int = 4096
+    REDIS_URL: str = "redis://localhost:6379/0"
+    INVALIDATION_BUS_ENABLED: bool = True
+    INVALIDATION_CHANNEL: str = "cache_invalidation"
+    INVALIDATION_BATCH_WINDOW_MS: int = 20
+    REALTIME_CHANNEL: str = "match_rooms"  # канал NOTIFY для дельт комнат матчей
+    REALTIME_QUEUE_SIZE: int = 32
+    REALTIME_MAX_OVERFLOWS: int = 3
+    REALTIME_HEARTBEAT_SECONDS: int = 25
+    SCHEDULE_JOB_WORKERS: int = 1
+    SCHEDULE_JOB_CHUNK_UNITS: int = 31  # (поле, день) на одну транзакцию
+    SCHEDULE_JOB_STALE_SECONDS: int = 120
+    PRICING_CACHE_TTL_SECONDS: int = 600
+    PRICING_CACHE_MAX_SIZE: int = 10000
+    SLOT_HOLD_SECONDS: int = 300
+    SLOT_PARTITIONS_AHEAD_MONTHS: int = 12
+    SLOT_RETENTION_MONTHS: int = 24  # старше — в архив, кроме забронированных слотов
+    LIFECYCLE_ENABLED: bool = True
+    LIFECYCLE_INTERVAL_SECONDS: int = 60
+    LIFECYCLE_BATCH_SIZE: int = 500
+    LIFECYCLE_MAX_BATCHES: int = 20  # пачек одной задачи за прогон
+    LIFECYCLE_DEFAULT_MATCH_MINUTES: int = 120  # длительность матча без слота
+    GEO_INDEX_ENABLED: bool = True  # false — поиск рядом через bounding box в Postgres
+    GEO_CELL_DEGREES: float = 0.05  # ~5.5 км по широте
+    GEO_DEFAULT_RADIUS_KM: float = 10.0
+    GEO_MAX_RADIUS_KM: float = 100.0
+    TEXT_SEARCH_BACKEND: str = "auto"  # auto | postgres | memory; auto — postgres при наличии pg_trgm
+    TEXT_SEARCH_SIMILARITY: float = 0.4  # порог похожести по триграммам (pg_trgm.word_similarity_threshold)
+    RATING_PRIOR_WEIGHT: float = 5.0  # «виртуальных» отзывов со средней оценкой в сглаженном рейтинге
+    RATING_DEFAULT_PRIOR: float = 3.0  # априорная средняя, пока отзывов нет совсем
+    RATING_RECOMPUTE_CHUNK: int = 50000  # отзывов (и пользователей) на пачку пересчёта рейтингов
+    RATING_REVIEW_ID_MARGIN: int = 10000  # хвост id отзывов, который пересчёт перечитывает (COMMIT не по порядку id)
+    LEADERBOARD_INDEX_ENABLED: bool = True  # false — таблица лидеров из материализованного представления
+    LEADERBOARD_MAX_POINT_INVALIDATIONS: int = 1000  # больше изменённых игроков — перечитать индекс целиком
+    LEADERBOARD_REFRESH_SECONDS: float = 1.0  # не чаще — перестановка изменённых игроков в индексе
+    RECOMMENDATIONS_MAX_POINT_INVALIDATIONS: int = 1000  # больше изменённых игроков — перечитать индекс составов
+    RECOMMENDATIONS_CO_PLAYERS_LIMIT: int = 200  # самых частых партнёров по прошлым матчам
+    RECOMMENDATIONS_CO_PLAYERS_CACHE_SIZE: int = 10000
+    RECOMMENDATIONS_CO_PLAYERS_TTL_SECONDS: int = 300
+    UPLOAD_MAX_PHOTO_BYTES: int = 5 * 1024 * 1024
+    UPLOAD_MAX_DOCUMENT_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_CHUNK_BYTES: int = 256 * 1024  # копится в памяти до записи на диск, на одну загрузку
+    UPLOAD_ORPHAN_GRACE_SECONDS: int = 3600  # моложе — файл не удаляется, даже если на него нет ссылок
+    UPLOAD_SWEEP_INTERVAL_SECONDS: int = 3600  # не чаще — уборка файлов без ссылок в планировщике
+
+    @property
+    def async_database_url(self) -> str:
+        if self.ASYNC_DATABASE_URL:
+            return self.ASYNC_DATABASE_URL
+        url = make_url(self.DATABASE_URL)
+        return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,180 @@
+"""Поиск полей рядом с точкой: индекс в памяти по ячейкам сетки широта/долгота.
+
+Ячейка — квадрат GEO_CELL_DEGREES x GEO_CELL_DEGREES градусов. Поиск обходит кольца
+ячеек вокруг точки, пока не наберёт limit ближайших полей и следующее кольцо заведомо
+не дальше уже найденных (или не выйдет за радиус); расстояния — по гаверсинусу, numpy.
+Индекс загружается целиком при первом запросе, а изменения полей (create_field_for_venue,
+update_field) точечно помечают поле устаревшим через core.invalidation — при следующем
+запросе перечитываются только эти поля.
+"""
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from . import invalidation
+from .config import settings
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def parse_point(value: str) -> Tuple[float, float]:
+    """"55.75,37.62" -> (55.75, 37.62); ValueError при неверном формате или диапазоне."""
+    lat, lon = (float(part) for part in value.split(","))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(value)
+    return lat, lon
+
+
+def distances_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1, lat2 = math.radians(lat), np.radians(lats)
+    d_lat, d_lon = lat2 - lat1, np.radians(lons - lon)
+    a = np.sin(d_lat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon), покрывающий круг радиуса radius_km.
+    Если круг задевает полюс или 180-й меридиан, долгота не ограничивается."""
+    d_lat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = lat - d_lat, lat + d_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    d_lon = d_lat / math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if lon - d_lon < -180 or lon + d_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lon - d_lon, lon + d_lon
+
+
+def rank(points: Iterable[Tuple[int, float, float]], lat: float, lon: float,
+         radius_km: float, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+    """[(field_id, км)] точек в радиусе, от ближних к дальним."""
+    points = list(points)
+    if not points:
+        return []
+    ids = np.array([point[0] for point in points], dtype=np.int64)
+    dist = distances_km(lat, lon, np.array([point[1] for point in points]), np.array([point[2] for point in points]))
+    inside = dist <= radius_km
+    ids, dist = ids[inside], dist[inside]
+    order = np.argsort(dist, kind="stable")[:limit]
+    return list(zip(ids[order].tolist(), dist[order].tolist()))
+
+
+class GeoIndex:
+    def __init__(self, cell_degrees: float, enabled: bool = True):
+        self.cell_degrees = cell_degrees
+        self.enabled = enabled
+        self._lon_cells = max(1, round(360 / cell_degrees))
+        self._points: Dict[int, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._loaded = False
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.refreshed = 0
+        self.queries = 0
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees) % self._lon_cells
+
+    def _put(self, field_id: int, lat: float, lon: float) -> None:
+        self._drop(field_id)
+        self._points[field_id] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(field_id)
+
+    def _drop(self, field_id: int) -> None:
+        point = self._points.pop(field_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(field_id)
+            if not members:
+                del self._cells[cell]
+
+    def pending(self) -> Tuple[bool, List[int]]:
+        """(нужна полная загрузка, field_id для точечного перечитывания); забирает отметки."""
+        with self._lock:
+            dirty, self._dirty = sorted(self._dirty), set()
+            return not self._loaded, dirty
+
+    def load(self, rows: Iterable[Tuple[int, Optional[float], Optional[float]]]) -> None:
+        with self._lock:
+            self._points, self._cells = {}, {}
+            for field_id, lat, lon in rows:
+                if lat is not None and lon is not None:
+                    self._put(field_id, lat, lon)
+            self._loaded = True
+            self.full_loads += 1
+
+    def refresh(self, field_ids: Iterable[int], rows: Iterable[Tuple[int, Optional[float], Optional[float]]]) -> None:
+        """Перечитанные строки полей field_ids; поля без координат (или удалённые) уходят из индекса."""
+        with self._lock:
+            for field_id in field_ids:
+                self._drop(field_id)
+                self.refreshed += 1
+            for field_id, lat, lon in rows:
+                if lat is not None and lon is not None:
+                    self._put(field_id, lat, lon)
+
+    def _ring(self, center: Tuple[int, int], ring: int) -> Iterable[Tuple[int, int]]:
+        row, col = center
+        for d_row in range(-ring, ring + 1):
+            step = 1 if abs(d_row) == ring else 2 * ring
+            for d_col in range(-ring, ring + 1, max(step, 1)):
+                yield row + d_row, (col + d_col) % self._lon_cells
+
+    def search(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """[(field_id, км)] в радиусе radius_km, от ближних к дальним, не больше limit."""
+        self.queries += 1
+        center = self._cell(lat, lon)
+        cell_km = self.cell_degrees * KM_PER_DEGREE
+        found: List[Tuple[int, float]] = []
+        with self._lock:
+            # Дальше половины окружности по долготе кольца начинают повторять ячейки.
+            for ring in range(self._lon_cells // 2 + 1):
+                candidates = [
+                    (field_id, *self._points[field_id])
+                    for cell in self._ring(center, ring) for field_id in self._cells.get(cell, ())
+                ]
+                if candidates:
+                    found.extend(rank(candidates, lat, lon, radius_km))
+                # Любая точка за кольцом ring дальше, чем ring полных ячеек по широте или долготе.
+                ring_lat = min(abs(lat) + (ring + 1) * self.cell_degrees, 89.99)
+                beyond_km = ring * cell_km * min(1.0, math.cos(math.radians(ring_lat)))
+                if beyond_km > radius_km:
+                    break
+                if limit is not None and len(found) >= limit:
+                    found.sort(key=lambda item: item[1])
+                    if found[limit - 1][1] <= beyond_km:
+                        break
+        found.sort(key=lambda item: item[1])
+        return found[:limit] if limit is not None else found
+
+    def invalidate(self, field_id: str) -> None:
+        with self._lock:
+            self._dirty.add(int(field_id))
+
+    def invalidate_on_commit(self, db, field_id: int) -> None:
+        invalidation.publish(db, f"geo:{field_id}")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._loaded = False
+            self._dirty.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loaded": self._loaded,
+            "fields": len(self._points),
+            "cells": len(self._cells),
+            "full_loads": self.full_loads,
+            "refreshed": self.refreshed,
+            "queries": self.queries,
+        }
+
+
+geo_index = GeoIndex(cell_degrees=settings.GEO_CELL_DEGREES, enabled=settings.GEO_INDEX_ENABLED)
+invalidation.register("geo", geo_index.invalidate, reset=geo_index.reset)
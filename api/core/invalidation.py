@@ -0,0 +1,300 @@
+"""Шина инвалидации кэшей между воркерами через Postgres LISTEN/NOTIFY.
+
+Запись в repository вызывает publish(db, key, ...): ключи копятся в session.info,
+перед COMMIT уходят одним pg_notify в той же транзакции (то есть доставляются только
+если транзакция зафиксирована), а после COMMIT применяются в текущем процессе.
+Остальные воркеры получают их фоновым слушателем (InvalidationListener).
+
+Ключ — "<вид>:<аргумент>", например "response:match:5" или "principal:a@b.com";
+обработчики видов регистрируют сами модули кэшей через register().
+
+События, которые не являются инвалидацией (дельты комнат core.realtime), идут тем же
+путём, но в своём канале NOTIFY: publish_event(db, channel, message), подписка — subscribe().
+Они не склеиваются и доставляются по порядку.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Optional
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+ORIGIN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_PENDING_KEY = "pending_invalidations"
+_EVENTS_KEY = "pending_events"
+# Лимит payload у NOTIFY — 8000 байт; режем пачки с запасом.
+_MAX_PAYLOAD = 7500
+
+_handlers: Dict[str, Callable[[str], None]] = {}
+_resets: Dict[str, Callable[[], None]] = {}
+_subscribers: Dict[str, Callable[[str], None]] = {}
+
+
+class BusStats:
+    def __init__(self):
+        self.published = 0
+        self.notifications_sent = 0
+        self.notifications_received = 0
+        self.keys_applied = 0
+        self.own_skipped = 0
+        self.reconnects = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self._lag_total_ms = 0.0
+        self._lag_samples = 0
+        self.connected = False
+
+    def record_lag(self, lag_ms: float) -> None:
+        self.last_lag_ms = lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self._lag_total_ms += lag_ms
+        self._lag_samples += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "connected": self.connected,
+            "published": self.published,
+            "notifications_sent": self.notifications_sent,
+            "notifications_received": self.notifications_received,
+            "keys_applied": self.keys_applied,
+            "own_skipped": self.own_skipped,
+            "reconnects": self.reconnects,
+            "lag_ms": {
+                "last": round(self.last_lag_ms, 2),
+                "max": round(self.max_lag_ms, 2),
+                "avg": round(self._lag_total_ms / self._lag_samples, 2) if self._lag_samples else 0.0,
+            },
+        }
+
+
+stats = BusStats()
+
+
+def register(kind: str, handler: Callable[[str], None], reset: Optional[Callable[[], None]] = None) -> None:
+    """handler(arg) вызывается для каждого ключа вида kind; reset() — полный сброс,
+    когда слушатель переподключился и мог пропустить события."""
+    _handlers[kind] = handler
+    if reset is not None:
+        _resets[kind] = reset
+
+
+def subscribe(channel: str, handler: Callable[[str], None], reset: Optional[Callable[[], None]] = None) -> None:
+    """handler(message) вызывается для каждого события канала channel; reset() — как в register()."""
+    _subscribers[channel] = handler
+    if reset is not None:
+        _resets[f"channel:{channel}"] = reset
+
+
+def apply(keys: Iterable[str]) -> None:
+    for key in keys:
+        kind, _, arg = key.partition(":")
+        handler = _handlers.get(kind)
+        if handler is None:
+            continue
+        try:
+            handler(arg)
+            stats.keys_applied += 1
+        except Exception:
+            logger.exception("invalidation handler failed for %s", key)
+
+
+def reset_all() -> None:
+    for reset in _resets.values():
+        reset()
+
+
+def publish(db, *keys: str) -> None:
+    """Откладывает инвалидацию до COMMIT сессии db (Session или AsyncSession)."""
+    session = getattr(db, "sync_session", db)
+    # dict, а не set: ключи не дублируются, порядок сохраняется.
+    session.info.setdefault(_PENDING_KEY, {}).update(dict.fromkeys(keys))
+    stats.published += len(keys)
+
+
+def publish_event(db, channel: str, message: str) -> None:
+    """Откладывает событие канала channel до COMMIT сессии db."""
+    session = getattr(db, "sync_session", db)
+    session.info.setdefault(_EVENTS_KEY, {}).setdefault(channel, []).append(message)
+    stats.published += 1
+
+
+def deliver(channel: str, messages: Iterable[str]) -> None:
+    handler = _subscribers.get(channel)
+    if handler is None:
+        return
+    for message in messages:
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("event handler failed for channel %s", channel)
+
+
+def _payloads(keys) -> Iterable[str]:
+    batch, size = [], 0
+    for key in keys:
+        if batch and size + len(key) + 4 > _MAX_PAYLOAD:
+            yield json.dumps({"o": ORIGIN, "t": time.time(), "k": batch})
+            batch, size = [], 0
+        batch.append(key)
+        size += len(key) + 4
+    if batch:
+        yield json.dumps({"o": ORIGIN, "t": time.time(), "k": batch})
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_before_commit(session: Session) -> None:
+    keys = session.info.get(_PENDING_KEY)
+    events = session.info.get(_EVENTS_KEY)
+    if not (keys or events) or not settings.INVALIDATION_BUS_ENABLED:
+        return
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    # События транзакции уходят пачкой: NOTIFY склеил бы одинаковые payload в одной транзакции.
+    batches = [(settings.INVALIDATION_CHANNEL, keys or ())] + list((events or {}).items())
+    for channel, items in batches:
+        for payload in _payloads(items):
+            session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+            stats.notifications_sent += 1
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session) -> None:
+    keys = session.info.pop(_PENDING_KEY, None)
+    if keys:
+        apply(keys)
+    for channel, messages in session.info.pop(_EVENTS_KEY, {}).items():
+        deliver(channel, messages)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_EVENTS_KEY, None)
+
+
+class InvalidationListener:
+    """Фоновая задача воркера: LISTEN на канале, пакетирование и склейка событий,
+    переподключение с backoff. Каналы subscribe() слушаются на том же соединении,
+    их события доставляются сразу, без окна пакетирования."""
+
+    def __init__(self, dsn: str, channel: str, batch_window: float):
+        self.dsn = dsn
+        self.channel = channel
+        self.batch_window = batch_window
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="invalidation-listener")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self._queue.put_nowait(payload)
+
+    def _on_event(self, connection, pid, channel, payload) -> None:
+        stats.notifications_received += 1
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("o") == ORIGIN:
+            stats.own_skipped += 1
+            return
+        stats.record_lag((time.time() - message.get("t", time.time())) * 1000)
+        deliver(channel, message.get("k", ()))
+
+    def _on_terminate(self, connection) -> None:
+        self._queue.put_nowait(None)
+
+    async def _run(self) -> None:
+        import asyncpg
+        backoff = 0.5
+        first = True
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self._on_notify)
+                for channel in _subscribers:
+                    await connection.add_listener(channel, self._on_event)
+                connection.add_termination_listener(self._on_terminate)
+                stats.connected = True
+                # Пока соединения не было, события могли потеряться.
+                reset_all()
+                if not first:
+                    stats.reconnects += 1
+                first = False
+                backoff = 0.5
+                await self._consume(connection)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("invalidation listener disconnected, retrying in %.1fs", backoff, exc_info=True)
+            finally:
+                stats.connected = False
+                if connection is not None:
+                    connection.remove_termination_listener(self._on_terminate)
+                    try:
+                        await connection.close(timeout=1)
+                    except Exception:
+                        pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    async def _consume(self, connection) -> None:
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=15)
+            except asyncio.TimeoutError:
+                # Проверяем, что соединение живо; иначе исключение уведёт в переподключение.
+                await connection.execute("SELECT 1")
+                continue
+            if first is None:
+                raise ConnectionError("LISTEN connection terminated")
+            payloads = [first]
+            await asyncio.sleep(self.batch_window)
+            while not self._queue.empty():
+                payloads.append(self._queue.get_nowait())
+            self._apply_batch([p for p in payloads if p is not None])
+            if None in payloads:
+                raise ConnectionError("LISTEN connection terminated")
+
+    def _apply_batch(self, payloads) -> None:
+        now = time.time()
+        keys: Dict[str, None] = {}
+        for raw in payloads:
+            stats.notifications_received += 1
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            if message.get("o") == ORIGIN:
+                stats.own_skipped += 1
+                continue
+            stats.record_lag((now - message.get("t", now)) * 1000)
+            keys.update(dict.fromkeys(message.get("k", ())))
+        apply(keys)
+
+
+def create_listener() -> Optional[InvalidationListener]:
+    if not settings.INVALIDATION_BUS_ENABLED:
+        return None
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() != "postgresql":
+        return None
+    dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    return InvalidationListener(dsn, settings.INVALIDATION_CHANNEL, settings.INVALIDATION_BATCH_WINDOW_MS / 1000)
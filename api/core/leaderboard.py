@@ -0,0 +1,296 @@
+"""Таблица лидеров: рейтинги игроков, отсортированные в памяти.
+
+По каждому виду оценки (skill, sportsmanship) — параллельные массивы numpy в порядке
+убывания сглаженной оценки (при равной оценке выше меньший id): ключ -score, id, число
+отзывов этого типа и коды позиции и уровня. Страница топа — срез с начала массивов
+(с фильтром по числу отзывов — маска по растущему префиксу), место игрока — двоичный
+поиск его ключа. Для фильтров по позиции и уровню держатся срезы тех же массивов
+(LRU на max_slices сочетаний), которые обновляются вместе с полным рейтингом.
+
+Индекс загружается из users при первом запросе; изменения рейтингов и профиля помечают
+игроков устаревшими через core.invalidation ("leaderboard:<user_id>", "leaderboard:*" —
+перечитать всё); на запросе, не чаще LEADERBOARD_REFRESH_SECONDS, их строки
+перечитываются и переставляются за один проход.
+Без индекса (LEADERBOARD_INDEX_ENABLED=false) таблица читается из материализованного
+представления leaderboard (repository.LEADERBOARD_PAGE_SQL).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from . import invalidation
+from .config import settings
+
+METRICS = ("skill", "sportsmanship")
+# Больше отметок — дешевле перечитать индекс целиком, чем переставлять строки.
+FULL_RELOAD_SHARE = 0.1
+NO_CODE = -1
+
+Row = Tuple[int, Optional[str], Optional[str], Optional[float], int, Optional[float], int]
+
+
+class _Ranking:
+    """Участники одного вида оценки по возрастанию (-score, id); неизменяем — поиск
+    работает с тем объектом, что был на момент вызова."""
+    __slots__ = FIELDS = ("keys", "ids", "counts", "positions", "levels")
+
+    def __init__(self, keys, ids, counts, positions, levels):
+        self.keys, self.ids, self.counts, self.positions, self.levels = keys, ids, counts, positions, levels
+
+    @classmethod
+    def build(cls, keys, ids, counts, positions, levels) -> "_Ranking":
+        order = np.lexsort((ids, keys))
+        return cls(keys[order], ids[order], counts[order], positions[order], levels[order])
+
+    @classmethod
+    def empty(cls) -> "_Ranking":
+        return cls(np.empty(0), *(np.empty(0, dtype=np.int32) for _ in range(4)))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def select(self, mask: np.ndarray) -> "_Ranking":
+        return _Ranking(*(getattr(self, name)[mask] for name in self.FIELDS))
+
+    def locate(self, key: float, user_id: int) -> int:
+        """Индекс строки (key, user_id) или место, куда её вставить."""
+        low = int(np.searchsorted(self.keys, key, "left"))
+        high = int(np.searchsorted(self.keys, key, "right"))
+        return low + int(np.searchsorted(self.ids[low:high], user_id))
+
+    def replace(self, drop: List[int], new: "_Ranking") -> "_Ranking":
+        """Копия без строк с индексами drop и со строками new — одним проходом по массивам."""
+        if not drop and not len(new):
+            return self
+        at = [self.locate(key, user_id) for key, user_id in zip(new.keys.tolist(), new.ids.tolist())]
+        # На одной позиции вставка идёт раньше удаления: новая строка игрока встаёт на место старой.
+        events = sorted([(position, 0, index) for index, position in enumerate(at)] + [(position, 1, 0) for position in drop])
+        pieces, kept = [], 0
+        for position, removed, index in events:
+            if position > kept:
+                pieces.append((self, kept, position))
+                kept = position
+            if removed:
+                kept = position + 1
+            else:
+                pieces.append((new, index, index + 1))
+        pieces.append((self, kept, len(self)))
+        return _Ranking(*(
+            np.concatenate([getattr(source, name)[low:high] for source, low, high in pieces])
+            for name in self.FIELDS
+        ))
+
+    def mask(self, min_reviews: int) -> Optional[np.ndarray]:
+        """Строки с числом отзывов не меньше min_reviews; None — фильтра нет (у каждого хотя бы один)."""
+        return self.counts >= min_reviews if min_reviews > 1 else None
+
+
+class LeaderboardIndex:
+    def __init__(self, enabled: bool = True, refresh_seconds: float = 1.0, max_slices: int = 32):
+        self.enabled = enabled
+        self.refresh_seconds = refresh_seconds
+        self.max_slices = max_slices
+        self._rankings: Dict[str, _Ranking] = {metric: _Ranking.empty() for metric in METRICS}
+        # Срезы по фильтрам (вид оценки, код позиции, код уровня) в порядке последнего
+        # использования: строятся при первом запросе и обновляются вместе с полным рейтингом.
+        self._slices: "OrderedDict[Tuple[str, int, int], _Ranking]" = OrderedDict()
+        # Текущий ключ игрока по виду оценки (nan — не участвует), индекс — id игрока.
+        self._keys: Dict[str, np.ndarray] = {metric: np.empty(0) for metric in METRICS}
+        self._codes: Dict[str, Dict[str, int]] = {"position": {}, "level": {}}
+        self._loaded = False
+        self._dirty: Set[int] = set()
+        self._reload = False
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.refreshed = 0
+        self.queries = 0
+
+    def _code(self, kind: str, value: Optional[str]) -> int:
+        if value is None:
+            return NO_CODE
+        codes = self._codes[kind]
+        return codes.setdefault(value, len(codes))
+
+    def _rows(self, rows: Iterable[Row]) -> Dict[str, _Ranking]:
+        rows = list(rows)
+        ids = np.array([row[0] for row in rows], dtype=np.int32)
+        positions = np.array([self._code("position", row[1]) for row in rows], dtype=np.int32)
+        levels = np.array([self._code("level", row[2]) for row in rows], dtype=np.int32)
+        rankings = {}
+        for number, metric in enumerate(METRICS):
+            scores = np.array([row[3 + 2 * number] for row in rows], dtype=np.float64)
+            counts = np.array([row[4 + 2 * number] for row in rows], dtype=np.int32)
+            rated = ~np.isnan(scores)
+            rankings[metric] = _Ranking.build(-scores[rated], ids[rated], counts[rated], positions[rated], levels[rated])
+        return rankings
+
+    @staticmethod
+    def _matches(ranking: _Ranking, position: int, level: int) -> np.ndarray:
+        mask = np.ones(len(ranking), dtype=bool)
+        if position != NO_CODE:
+            mask &= ranking.positions == position
+        if level != NO_CODE:
+            mask &= ranking.levels == level
+        return mask
+
+    def _remember(self, metric: str, ranking: _Ranking) -> None:
+        keys = self._keys[metric]
+        if len(ranking) and int(ranking.ids.max()) >= len(keys):
+            grown = np.full(max(int(ranking.ids.max()) + 1, 2 * len(keys)), np.nan)
+            grown[:len(keys)] = keys
+            keys = self._keys[metric] = grown
+        keys[ranking.ids] = ranking.keys
+
+    def _ranking(self, metric: str, position: Optional[str], level: Optional[str]) -> Optional[_Ranking]:
+        """Рейтинг под фильтры позиции и уровня; None — такого значения ни у кого нет."""
+        codes = []
+        for kind, value in (("position", position), ("level", level)):
+            code = NO_CODE if value is None else self._codes[kind].get(value)
+            if code is None:
+                return None
+            codes.append(code)
+        if codes == [NO_CODE, NO_CODE]:
+            return self._rankings[metric]
+        key = (metric, *codes)
+        with self._lock:
+            ranking = self._slices.get(key)
+            if ranking is None:
+                full = self._rankings[metric]
+                ranking = self._slices[key] = full.select(self._matches(full, *codes))
+                while len(self._slices) > self.max_slices:
+                    self._slices.popitem(last=False)
+            self._slices.move_to_end(key)
+            return ranking
+
+    def pending(self) -> Tuple[bool, List[int]]:
+        """(нужна полная загрузка, id игроков для точечного перечитывания); забирает отметки.
+        Точечные отметки копятся до refresh_seconds с прошлого обновления: перестановка
+        копирует массивы целиком, и выгоднее делать её пачкой."""
+        with self._lock:
+            full = not self._loaded or self._reload or len(self._dirty) > FULL_RELOAD_SHARE * len(self._rankings[METRICS[0]])
+            if not full and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return False, []
+            dirty, self._dirty = sorted(self._dirty), set()
+            self._reload = False
+            self._refreshed_at = time.monotonic()
+            return full, ([] if full else dirty)
+
+    def load(self, rows: Iterable[Row]) -> None:
+        rankings = self._rows(rows)
+        with self._lock:
+            for metric, ranking in rankings.items():
+                self._rankings[metric] = ranking
+                self._keys[metric] = np.full(0, np.nan)
+                self._remember(metric, ranking)
+            self._slices.clear()
+            self._loaded = True
+            self.full_loads += 1
+
+    def refresh(self, user_ids: List[int], rows: Iterable[Row]) -> None:
+        """Перечитанные строки игроков user_ids; игроки без оценки (или удалённые) уходят из таблицы."""
+        with self._lock:
+            rankings = self._rows(rows)
+            for metric, new in rankings.items():
+                full, keys = self._rankings[metric], self._keys[metric]
+                present = [user_id for user_id in user_ids if user_id < len(keys) and not np.isnan(keys[user_id])]
+                old = [(float(keys[user_id]), user_id) for user_id in present]
+                drop = [full.locate(key, user_id) for key, user_id in old]
+                # Срезы получают только свои строки: старые — по кодам из полного рейтинга.
+                for (slice_metric, position, level), ranking in list(self._slices.items()):
+                    if slice_metric != metric:
+                        continue
+                    removed = full.select(np.array(drop, dtype=np.int64)) if drop else _Ranking.empty()
+                    old_here = np.flatnonzero(self._matches(removed, position, level))
+                    self._slices[slice_metric, position, level] = ranking.replace(
+                        [ranking.locate(*old[index]) for index in old_here.tolist()],
+                        new.select(self._matches(new, position, level)),
+                    )
+                self._rankings[metric] = full.replace(drop, new)
+                keys[present] = np.nan
+                self._remember(metric, new)
+            self.refreshed += len(user_ids)
+
+    def top(self, metric: str, position: Optional[str] = None, level: Optional[str] = None,
+            min_reviews: int = 0, limit: int = 20, offset: int = 0) -> Tuple[int, List[Tuple[int, int, float, int]]]:
+        """(всего подходящих игроков, [(место, user_id, оценка, число отзывов)])."""
+        self.queries += 1
+        ranking = self._ranking(metric, position, level)
+        if ranking is None:
+            return 0, []
+        end = offset + limit
+        mask = ranking.mask(min_reviews)
+        if mask is None:
+            total, rows = len(ranking), np.arange(offset, min(end, len(ranking)))
+        else:
+            total = int(np.count_nonzero(mask))
+            # Подходящие строки ищутся в префиксе, который растёт, пока их не хватит на страницу.
+            stop = min(len(ranking), max(4 * end, 1024))
+            while True:
+                rows = np.flatnonzero(mask[:stop])
+                if len(rows) >= end or stop == len(ranking):
+                    break
+                stop = min(len(ranking), stop * 4)
+            rows = rows[offset:end]
+        return total, [
+            (offset + number + 1, user_id, -key, count)
+            for number, (user_id, key, count) in enumerate(zip(
+                ranking.ids[rows].tolist(), ranking.keys[rows].tolist(), ranking.counts[rows].tolist()
+            ))
+        ]
+
+    def rank(self, metric: str, user_id: int, position: Optional[str] = None, level: Optional[str] = None,
+             min_reviews: int = 0) -> Optional[Tuple[int, int, float, int]]:
+        """(место, всего подходящих игроков, оценка, число отзывов) или None, если игрок не проходит фильтры."""
+        self.queries += 1
+        ranking, keys = self._ranking(metric, position, level), self._keys[metric]
+        if ranking is None or user_id >= len(keys) or np.isnan(keys[user_id]):
+            return None
+        key = float(keys[user_id])
+        at = ranking.locate(key, user_id)
+        if at >= len(ranking) or ranking.ids[at] != user_id or ranking.counts[at] < min_reviews:
+            return None
+        count = int(ranking.counts[at])
+        mask = ranking.mask(min_reviews)
+        if mask is None:
+            return at + 1, len(ranking), -key, count
+        return int(np.count_nonzero(mask[:at])) + 1, int(np.count_nonzero(mask)), -key, count
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            if user_id == "*":
+                self._reload = True
+            else:
+                self._dirty.add(int(user_id))
+
+    def invalidate_on_commit(self, db, user_ids: Iterable[int]) -> None:
+        """Отметки игроков; при массовом пересчёте — одна отметка «перечитать всё»."""
+        user_ids = list(user_ids)
+        if len(user_ids) > settings.LEADERBOARD_MAX_POINT_INVALIDATIONS:
+            invalidation.publish(db, "leaderboard:*")
+        elif user_ids:
+            invalidation.publish(db, *(f"leaderboard:{user_id}" for user_id in user_ids))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._loaded = False
+            self._dirty.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loaded": self._loaded,
+            "players": {metric: len(ranking) for metric, ranking in self._rankings.items()},
+            "slices": len(self._slices),
+            "full_loads": self.full_loads,
+            "refreshed": self.refreshed,
+            "queries": self.queries,
+        }
+
+
+leaderboard_index = LeaderboardIndex(
+    enabled=settings.LEADERBOARD_INDEX_ENABLED,
+    refresh_seconds=settings.LEADERBOARD_REFRESH_SECONDS,
+)
+invalidation.register("leaderboard", leaderboard_index.invalidate, reset=leaderboard_index.reset)
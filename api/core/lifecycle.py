@@ -0,0 +1,142 @@
+"""Периодический планировщик жизненного цикла матчей и слотов.
+
+Раз в LIFECYCLE_INTERVAL_SECONDS: завершает матчи, чей слот уже закончился, переводит
+прошедшие незанятые слоты в unavailable и снимает истёкшие удержания слотов; раз в
+UPLOAD_SWEEP_INTERVAL_SECONDS ещё и удаляет загруженные файлы без ссылок (core.uploads).
+Запускается в каждом воркере, но за один прогон отвечает только тот, кто взял
+advisory lock; остальные пропускают тик. Работа идёт пачками по LIFECYCLE_BATCH_SIZE
+строк, каждая пачка — короткая транзакция с FOR UPDATE SKIP LOCKED.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+from sqlalchemy import text
+from db import repository
+from db.session import SessionLocal, engine
+from .config import settings
+from .uploads import upload_store
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_try_advisory_lock, общий для всех воркеров ("PLAY").
+ADVISORY_LOCK_KEY = 0x504C4159
+
+
+class LifecycleStats:
+    def __init__(self):
+        self.runs = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_ms = 0.0
+        self.max_run_ms = 0.0
+        self.last_rows: Dict[str, int] = {}
+        self.total_rows: Dict[str, int] = {}
+
+    def record(self, duration_ms: float, rows: Dict[str, int]) -> None:
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_run_ms = duration_ms
+        self.max_run_ms = max(self.max_run_ms, duration_ms)
+        self.last_rows = rows
+        for task, count in rows.items():
+            self.total_rows[task] = self.total_rows.get(task, 0) + count
+
+    def as_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "run_ms": {"last": round(self.last_run_ms, 2), "max": round(self.max_run_ms, 2)},
+            "last_rows": self.last_rows,
+            "total_rows": self.total_rows,
+        }
+
+
+class LifecycleScheduler:
+    def __init__(self, interval_seconds: float, batch_size: int, max_batches: int, default_match_minutes: int):
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.default_match_minutes = default_match_minutes
+        self.stats = LifecycleStats()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def _tasks(self) -> Dict[str, Callable]:
+        tasks = {
+            "matches_completed": lambda db: repository.complete_finished_matches(
+                db, self.batch_size, self.default_match_minutes
+            ),
+            "slots_expired": lambda db: repository.expire_past_slots(db, self.batch_size),
+            "holds_released": lambda db: repository.release_expired_holds(db, self.batch_size),
+        }
+        if upload_store.sweep_due():
+            tasks["uploads_swept"] = lambda db: repository.sweep_orphan_uploads(db, self.batch_size)
+        return tasks
+
+    def start(self) -> None:
+        if self._thread is not None or engine.dialect.name != "postgresql":
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="lifecycle-scheduler", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stopping.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception:
+                self.stats.errors += 1
+                logger.exception("lifecycle run failed")
+
+    def run_once(self) -> Optional[Dict[str, int]]:
+        """Один прогон; None — прогон уже выполняет другой воркер."""
+        with engine.connect() as lock_connection:
+            # Сессионная блокировка на отдельном соединении: пачки коммитятся в своих сессиях.
+            locked = lock_connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+            ).scalar()
+            lock_connection.commit()
+            if not locked:
+                self.stats.skipped += 1
+                return None
+            try:
+                started = time.perf_counter()
+                rows = {task: self._drain(run) for task, run in self._tasks().items()}
+                self.stats.record((time.perf_counter() - started) * 1000, rows)
+                return rows
+            finally:
+                lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                lock_connection.commit()
+
+    def _drain(self, run: Callable) -> int:
+        total = 0
+        db = SessionLocal()
+        try:
+            for _ in range(self.max_batches):
+                if self._stopping.is_set():
+                    break
+                touched = run(db)
+                total += touched
+                if touched < self.batch_size:
+                    break
+        finally:
+            db.close()
+        return total
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=self.interval_seconds)
+
+
+lifecycle_scheduler = LifecycleScheduler(
+    interval_seconds=settings.LIFECYCLE_INTERVAL_SECONDS,
+    batch_size=settings.LIFECYCLE_BATCH_SIZE,
+    max_batches=settings.LIFECYCLE_MAX_BATCHES,
+    default_match_minutes=settings.LIFECYCLE_DEFAULT_MATCH_MINUTES,
+)
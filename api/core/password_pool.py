@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from typing import Optional
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
+from .config import settings
+
+
+class PasswordPoolSaturated(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис перегружен, попробуйте позже",
+            headers={"Retry-After": "1"},
+        )
+
+
+def _hash(password: str) -> str:
+    from .security import pwd_context
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    from .security import pwd_context
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordPool:
+    """Отдельный пул для bcrypt с ограниченной очередью: при переполнении сразу отказывает."""
+
+    def __init__(self, kind: str, max_workers: int, max_queue: int):
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordPoolSaturated()
+            self.in_flight += 1
+            self.submitted += 1
+            executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def hash(self, password: str) -> str:
+        return self._submit(_hash, password).result()
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._submit(_verify, plain_password, hashed_password).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(_hash, password))
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self._submit(_verify, plain_password, hashed_password))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        capacity = self.max_workers + self.max_queue
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": max(self.in_flight - self.max_workers, 0),
+            "utilization": round(min(self.in_flight, self.max_workers) / self.max_workers, 4),
+            "saturation": round(self.in_flight / capacity, 4),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_pool = PasswordPool(
+    kind=settings.PASSWORD_POOL_KIND,
+    max_workers=settings.PASSWORD_POOL_WORKERS,
+    max_queue=settings.PASSWORD_POOL_MAX_QUEUE,
+)
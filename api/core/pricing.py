@@ -0,0 +1,139 @@
+"""Правила цен слотов: компиляция по полю и расчёт цены пачки слотов одним векторным проходом.
+
+Цена слота: price_override слота, иначе цена первого подходящего правила поля
+(по priority по убыванию, затем более новое правило), иначе field.price_per_hour.
+Скомпилированные наборы правил кэшируются по field_id и сбрасываются через
+core.invalidation при изменении правил (во всех воркерах). Поколение поля растёт при
+каждой инвалидации: набор, прочитанный до неё, в кэш уже не попадает.
+"""
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from . import invalidation
+from .cache import TTLCache
+from .config import settings
+
+_EPOCH = date(1970, 1, 1)
+_DAY_MIN, _DAY_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+class CompiledRules:
+    """Правила одного поля в виде параллельных массивов, уже упорядоченные по приоритету."""
+
+    __slots__ = ("weekday_mask", "start_minute", "end_minute", "start_day", "end_day", "price")
+
+    def __init__(self, rules: Sequence):
+        rules = sorted(rules, key=lambda rule: (-rule.priority, -rule.id))
+        self.weekday_mask = np.array([rule.weekday_mask for rule in rules], dtype=np.int64)
+        self.start_minute = np.array([_minute(rule.start_time, 0) for rule in rules], dtype=np.int64)
+        self.end_minute = np.array([_minute(rule.end_time, 24 * 60) for rule in rules], dtype=np.int64)
+        self.start_day = np.array([_day(rule.start_date, _DAY_MIN) for rule in rules], dtype=np.int64)
+        self.end_day = np.array([_day(rule.end_date, _DAY_MAX) for rule in rules], dtype=np.int64)
+        self.price = np.array([rule.price for rule in rules], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def apply(self, starts: np.ndarray, base: np.ndarray) -> np.ndarray:
+        """starts — datetime64[m] начала слотов, base — цена поля для каждого слота."""
+        if not len(self) or not len(starts):
+            return base
+        days = starts.astype("datetime64[D]")
+        minutes = (starts - days).astype(np.int64)[:, None]
+        day_numbers = days.astype(np.int64)[:, None]
+        # 1970-01-01 — четверг; приводим к 0 = понедельник, как date.weekday().
+        weekdays = (day_numbers + 3) % 7
+        matches = (
+            ((self.weekday_mask >> weekdays) & 1).astype(bool)
+            & (minutes >= self.start_minute) & (minutes < self.end_minute)
+            & (day_numbers >= self.start_day) & (day_numbers <= self.end_day)
+        )
+        first = matches.argmax(axis=1)
+        return np.where(matches.any(axis=1), self.price[first], base)
+
+
+def _minute(value, default: int) -> int:
+    return value.hour * 60 + value.minute if value is not None else default
+
+
+def _day(value, default: int) -> int:
+    return (value - _EPOCH).days if value is not None else default
+
+
+class PricingEngine:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._compiled = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0  # растёт при reset(): сбрасывает поколения всех полей разом
+        self._lock = threading.Lock()
+        self.stale_loads = 0
+
+    def lookup(self, field_ids: Iterable[int]) -> Tuple[Dict[int, CompiledRules], Dict[int, tuple]]:
+        """(скомпилированные наборы из кэша, {field_id: поколение} тех, которых в кэше нет).
+        Поколение берётся до чтения правил из БД и передаётся в load()."""
+        found, missing = {}, {}
+        for field_id in set(field_ids):
+            compiled = self._compiled.get(field_id)
+            if compiled is None:
+                missing[field_id] = (self._epoch, self._generations.get(field_id, 0))
+            else:
+                found[field_id] = compiled
+        return found, missing
+
+    def load(self, missing: Dict[int, tuple], rules: Iterable) -> Dict[int, CompiledRules]:
+        """Компилирует правила полей из lookup() (поле без правил — пустой набор) и кэширует
+        те, чьё поколение не изменилось с lookup(): иначе правила могли быть прочитаны до записи."""
+        by_field = {field_id: [] for field_id in missing}
+        for rule in rules:
+            by_field.setdefault(rule.field_id, []).append(rule)
+        compiled = {field_id: CompiledRules(field_rules) for field_id, field_rules in by_field.items()}
+        with self._lock:
+            for field_id, rule_set in compiled.items():
+                if missing.get(field_id) == (self._epoch, self._generations.get(field_id, 0)):
+                    self._compiled.set(field_id, rule_set)
+                else:
+                    self.stale_loads += 1
+        return compiled
+
+    @staticmethod
+    def price(compiled: Dict[int, CompiledRules], field_ids: Sequence[int], starts: Sequence,
+              base: Sequence[int], overrides: Sequence[Optional[int]]) -> List[int]:
+        """Цены пачки слотов: один проход по массивам на каждое поле с правилами."""
+        if not len(field_ids):
+            return []
+        field_array = np.asarray(field_ids, dtype=np.int64)
+        start_array = np.asarray(starts, dtype="datetime64[m]")
+        prices = np.asarray(base, dtype=np.int64).copy()
+        for field_id, rule_set in compiled.items():
+            if not len(rule_set):
+                continue
+            mask = field_array == field_id
+            if mask.any():
+                prices[mask] = rule_set.apply(start_array[mask], prices[mask])
+        override_array = np.array([-1 if value is None else value for value in overrides], dtype=np.int64)
+        return np.where(override_array >= 0, override_array, prices).tolist()
+
+    def invalidate(self, field_id: str) -> None:
+        field_id = int(field_id)
+        with self._lock:
+            self._generations[field_id] = self._generations.get(field_id, 0) + 1
+            self._compiled.pop(field_id)
+
+    def invalidate_on_commit(self, db, field_id: int) -> None:
+        invalidation.publish(db, f"pricing:{field_id}")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._compiled.clear()
+
+    def stats(self) -> dict:
+        return {**self._compiled.stats(), "stale_loads": self.stale_loads}
+
+
+pricing_engine = PricingEngine(
+    max_size=settings.PRICING_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PRICING_CACHE_TTL_SECONDS,
+)
+invalidation.register("pricing", pricing_engine.invalidate, reset=pricing_engine.reset)
@@ -0,0 +1,86 @@
+"""Рейтинги игроков по отзывам: суммы по типам, средние и байесовское сглаживание.
+
+Сглаженная оценка — (prior_weight * prior + сумма оценок) / (prior_weight + число отзывов):
+у игрока с парой отзывов она близка к средней по всем отзывам (prior), с ростом
+числа отзывов — к его собственной средней. prior — средняя всех отзывов этого типа,
+её и prior_weight фиксирует полный пересчёт в строке rating_state; онлайн-обработка
+отзывов (repository.PROCESS_REVIEWS_SQL) сглаживает с теми же параметрами.
+
+RatingTotals копит суммы и числа отзывов по типам в плотных массивах numpy,
+индексированных id игрока: память зависит от числа пользователей, а не отзывов,
+поэтому player_reviews читается пачками (repository.recompute_ratings).
+"""
+from typing import Iterable, Tuple
+import numpy as np
+from .config import settings
+
+# Код типа отзыва в массивах (repository выбирает review_type = 'sportsmanship' как 0/1).
+SKILL, SPORTSMANSHIP = 0, 1
+REVIEW_TYPES = ("skill", "sportsmanship")
+
+PRIOR_WEIGHT = settings.RATING_PRIOR_WEIGHT
+DEFAULT_PRIOR = settings.RATING_DEFAULT_PRIOR
+REVIEW_ID_MARGIN = settings.RATING_REVIEW_ID_MARGIN
+
+
+class RatingTotals:
+    def __init__(self, size: int = 0):
+        self.counts = np.zeros((len(REVIEW_TYPES), size), dtype=np.int64)
+        self.sums = np.zeros((len(REVIEW_TYPES), size), dtype=np.int64)
+        self.reviews = 0
+
+    def _grow(self, size: int) -> None:
+        if size <= self.counts.shape[1]:
+            return
+        size = max(size, self.counts.shape[1] * 2)
+        for name in ("counts", "sums"):
+            current = getattr(self, name)
+            grown = np.zeros((len(REVIEW_TYPES), size), dtype=np.int64)
+            grown[:, :current.shape[1]] = current
+            setattr(self, name, grown)
+
+    def add(self, subject_ids: np.ndarray, kinds: np.ndarray, ratings: np.ndarray) -> None:
+        """Пачка отзывов: id игрока, код типа (SKILL/SPORTSMANSHIP) и оценка каждого."""
+        if not len(subject_ids):
+            return
+        size = int(subject_ids.max()) + 1
+        self._grow(size)
+        for kind in range(len(REVIEW_TYPES)):
+            mask = kinds == kind
+            self.counts[kind, :size] += np.bincount(subject_ids[mask], minlength=size)
+            self.sums[kind, :size] += np.bincount(subject_ids[mask], weights=ratings[mask], minlength=size).astype(np.int64)
+        self.reviews += len(subject_ids)
+
+    def add_grouped(self, rows: Iterable[Tuple[int, int, int, int]]) -> None:
+        """Строки (subject_id, kind, count, sum) — готовые агрегаты из SQL."""
+        for subject_id, kind, count, total in rows:
+            self._grow(subject_id + 1)
+            self.counts[kind, subject_id] += count
+            self.sums[kind, subject_id] += total
+            self.reviews += count
+
+    def priors(self) -> Tuple[float, float]:
+        """Средняя оценка по всем отзывам каждого типа (DEFAULT_PRIOR, если отзывов нет)."""
+        counts, sums = self.counts.sum(axis=1), self.sums.sum(axis=1)
+        return tuple(float(sums[kind] / counts[kind]) if counts[kind] else DEFAULT_PRIOR for kind in range(len(REVIEW_TYPES)))
+
+    def rated_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.counts.sum(axis=0))
+
+    def columns(self, user_ids: np.ndarray, priors: Tuple[float, float], prior_weight: float) -> dict:
+        """Значения колонок users для user_ids, списками для unnest: числа, средние
+        (0 без отзывов, как и раньше) и сглаженные оценки (None без отзывов)."""
+        inside = user_ids < self.counts.shape[1]
+        columns = {"ids": user_ids.tolist()}
+        for kind, name in enumerate(REVIEW_TYPES):
+            counts = np.zeros(len(user_ids), dtype=np.int64)
+            sums = np.zeros(len(user_ids), dtype=np.int64)
+            counts[inside] = self.counts[kind, user_ids[inside]]
+            sums[inside] = self.sums[kind, user_ids[inside]]
+            rated = counts > 0
+            means = np.divide(sums, counts, out=np.zeros(len(user_ids)), where=rated)
+            scores = (prior_weight * priors[kind] + sums) / (prior_weight + counts)
+            columns[f"{name}_counts"] = counts.tolist()
+            columns[f"{name}_ratings"] = means.tolist()
+            columns[f"{name}_scores"] = [score if has else None for score, has in zip(scores.tolist(), rated.tolist())]
+        return columns
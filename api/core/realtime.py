@@ -0,0 +1,205 @@
+"""Комнаты матчей поверх WebSocket: in-process pub/sub с рассылкой по комнатам.
+
+Repository после COMMIT публикует маленькие дельты (publish_on_commit). Они идут через
+core.invalidation в своём канале NOTIFY (REALTIME_CHANNEL), поэтому доходят и до комнат
+в других воркерах. Каждый подписчик имеет ограниченную очередь: медленный клиент не
+тормозит рассылку — его очередь сбрасывается и заменяется одним {"type": "resync"},
+после чего клиент перечитывает матч. Если клиент переполняется снова и снова, соединение
+закрывается.
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, Optional, Set
+from fastapi import WebSocket
+from . import invalidation
+from .config import settings
+
+PING = '{"type":"ping"}'
+RESYNC = '{"type":"resync"}'
+
+
+class Subscriber:
+    __slots__ = ("queue", "overflows")
+
+    def __init__(self, queue_size: int):
+        self.queue: "asyncio.Queue" = asyncio.Queue(maxsize=queue_size)
+        self.overflows = 0
+
+
+class MatchRoomHub:
+    def __init__(self, queue_size: int, max_overflows: int, heartbeat_seconds: float):
+        self.queue_size = queue_size
+        self.max_overflows = max_overflows
+        self.heartbeat_seconds = heartbeat_seconds
+        self._rooms: Dict[int, Set[Subscriber]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.peak_connections = 0
+        self.published = 0
+        self.delivered = 0
+        self.resyncs = 0
+        self.evicted = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._latency_total_ms = 0.0
+        self._latency_samples = 0
+
+    def subscribe(self, match_id: int) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(self.queue_size)
+        self._rooms.setdefault(match_id, set()).add(subscriber)
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+        return subscriber
+
+    def unsubscribe(self, match_id: int, subscriber: Subscriber) -> None:
+        room = self._rooms.get(match_id)
+        if room is None or subscriber not in room:
+            return
+        room.discard(subscriber)
+        if not room:
+            del self._rooms[match_id]
+        self.connections -= 1
+
+    def publish(self, match_id: int, message: str) -> None:
+        """Можно вызывать из любого потока: рассылка всегда выполняется в цикле событий."""
+        loop = self._loop
+        if loop is None or match_id not in self._rooms:
+            return
+        published_at = time.monotonic()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(match_id, message, published_at)
+        else:
+            loop.call_soon_threadsafe(self._fanout, match_id, message, published_at)
+
+    def _fanout(self, match_id: int, message: str, published_at: float) -> None:
+        self.published += 1
+        # Сообщение сериализовано один раз; все очереди держат ссылку на одну строку.
+        item = (message, published_at)
+        for subscriber in tuple(self._rooms.get(match_id, ())):
+            try:
+                subscriber.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self._overflow(subscriber)
+
+    def _overflow(self, subscriber: Subscriber) -> None:
+        subscriber.overflows += 1
+        self._drain(subscriber)
+        if subscriber.overflows > self.max_overflows:
+            self.evicted += 1
+            subscriber.queue.put_nowait(None)
+        else:
+            self.resyncs += 1
+            subscriber.queue.put_nowait((RESYNC, None))
+
+    @staticmethod
+    def _drain(subscriber: Subscriber) -> None:
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+
+    def resync_all(self) -> None:
+        """Шина переподключилась и могла пропустить дельты — все клиенты перечитывают матч."""
+        loop = self._loop
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(self._resync_all)
+
+    def _resync_all(self) -> None:
+        for room in self._rooms.values():
+            for subscriber in room:
+                self._drain(subscriber)
+                subscriber.queue.put_nowait((RESYNC, None))
+                self.resyncs += 1
+
+    def _record_delivery(self, published_at: Optional[float]) -> None:
+        self.delivered += 1
+        if published_at is None:
+            return
+        latency_ms = (time.monotonic() - published_at) * 1000
+        with self._lock:
+            self.last_latency_ms = latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+            self._latency_total_ms += latency_ms
+            self._latency_samples += 1
+
+    async def serve(self, websocket: WebSocket, subscriber: Subscriber) -> None:
+        """Отдаёт очередь подписчика в сокет, пока клиент не отключится."""
+        sender = asyncio.create_task(self._send_loop(websocket, subscriber))
+        receiver = asyncio.create_task(self._receive_loop(websocket))
+        try:
+            await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (sender, receiver):
+                task.cancel()
+            await asyncio.gather(sender, receiver, return_exceptions=True)
+
+    async def _send_loop(self, websocket: WebSocket, subscriber: Subscriber) -> None:
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat_seconds)
+            except asyncio.TimeoutError:
+                await websocket.send_text(PING)
+                continue
+            if item is None:
+                # 1013 Try Again Later: клиент не успевает читать.
+                await websocket.close(code=1013)
+                return
+            message, published_at = item
+            await websocket.send_text(message)
+            self._record_delivery(published_at)
+
+    async def _receive_loop(self, websocket: WebSocket) -> None:
+        # Клиент отвечает на ping; тишина дольше трёх интервалов — соединение мёртвое.
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive(), timeout=self.heartbeat_seconds * 3)
+            except asyncio.TimeoutError:
+                await websocket.close(code=1001)
+                return
+            if message["type"] == "websocket.disconnect":
+                return
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "connections": self.connections,
+            "peak_connections": self.peak_connections,
+            "published": self.published,
+            "delivered": self.delivered,
+            "resyncs": self.resyncs,
+            "evicted": self.evicted,
+            "latency_ms": {
+                "last": round(self.last_latency_ms, 2),
+                "max": round(self.max_latency_ms, 2),
+                "avg": round(self._latency_total_ms / self._latency_samples, 2) if self._latency_samples else 0.0,
+            },
+        }
+
+
+match_rooms = MatchRoomHub(
+    queue_size=settings.REALTIME_QUEUE_SIZE,
+    max_overflows=settings.REALTIME_MAX_OVERFLOWS,
+    heartbeat_seconds=settings.REALTIME_HEARTBEAT_SECONDS,
+)
+
+
+def publish_on_commit(db, match_id: int, event: dict) -> None:
+    """Отправляет дельту в комнату матча после COMMIT db (во всех воркерах)."""
+    message = json.dumps({**event, "match_id": match_id}, separators=(",", ":"), default=str)
+    # Номер комнаты впереди: воркеры маршрутизируют событие, не разбирая JSON.
+    invalidation.publish_event(db, settings.REALTIME_CHANNEL, f"{match_id}:{message}")
+
+
+def _on_room_event(event: str) -> None:
+    match_id, _, message = event.partition(":")
+    match_rooms.publish(int(match_id), message)
+
+
+invalidation.subscribe(settings.REALTIME_CHANNEL, _on_room_event, reset=match_rooms.resync_all)
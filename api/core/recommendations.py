@@ -0,0 +1,258 @@
+"""Рекомендации матчей игроку: индекс составов активных публичных матчей в памяти.
+
+На каждый будущий активный публичный матч — строка плотных массивов numpy: начало,
+лимит и число подтверждённых игроков, средний skill_rating игроков с отзывами,
+доля неявок состава и счётчики позиций; агрегаты считаются при записи состава, а
+не при запросе. Рекомендация — один векторный проход по всем строкам: свободные места, близость среднего уровня состава к уровню игрока,
+нужна ли матчу его позиция, похожая надёжность (неявки), знакомые по прошлым матчам
+игроки и близость начала — взвешенная сумма WEIGHTS.
+
+Индекс загружается при первом запросе; вступление, выход, смена статуса матча и
+изменения рейтингов/позиции игроков помечают матчи устаревшими через core.invalidation
+("roster:match:<id>", "roster:player:<id>", "roster:*"), при следующем запросе
+перечитываются только их составы.
+"""
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from . import invalidation
+from .cache import TTLCache
+from .config import settings
+
+WEIGHTS = {"skill": 0.45, "position": 0.2, "co_players": 0.15, "reliability": 0.1, "soon": 0.1}
+# Разница среднего уровня, при которой соответствие падает в e раз.
+SKILL_SCALE = 1.0
+# Сколько знакомых в составе дают полный вклад co_players.
+CO_PLAYERS_CAP = 3
+# Матчи дальше этого срока не получают вклада soon.
+SOON_HOURS = 72
+# Столбцов счётчиков позиций; редкие значения сверх лимита делят последний столбец.
+MAX_POSITIONS = 32
+# Оценка признака, когда сравнивать не с чем (игрок без отзывов, состав без позиции...).
+NEUTRAL = 0.5
+# Больше отметок — дешевле перечитать индекс целиком.
+FULL_RELOAD_SHARE = 0.25
+
+# (match_id, starts_at, max_players, confirmed_count, id всех участников,
+#  позиции подтверждённых, skill_rating подтверждённых с отзывами, сумма их неявок)
+RosterRow = Tuple[int, datetime, int, int, Sequence[int], Sequence[Optional[str]], Sequence[float], int]
+
+
+class Player:
+    """То, что рекомендации знают об игроке, для которого подбираются матчи."""
+    __slots__ = ("user_id", "skill_rating", "position", "no_show_count")
+
+    def __init__(self, user_id: int, skill_rating: Optional[float], position: Optional[str], no_show_count: int):
+        self.user_id = user_id
+        self.skill_rating = skill_rating  # None — отзывов о навыках ещё нет
+        self.position = position
+        self.no_show_count = no_show_count
+
+
+class RosterIndex:
+    def __init__(self, capacity: int = 1024):
+        self._allocate(capacity)
+        self._rows: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self._rosters: Dict[int, Tuple[int, ...]] = {}
+        self._members: Dict[int, Set[int]] = {}
+        self._codes: Dict[str, int] = {}
+        self._loaded = False
+        self._reload = False
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.refreshed = 0
+        self.queries = 0
+
+    def _allocate(self, capacity: int) -> None:
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._starts = np.zeros(capacity)
+        self._max_players = np.zeros(capacity, dtype=np.int32)
+        self._confirmed = np.zeros(capacity, dtype=np.int32)
+        self._averages = np.full(capacity, np.nan)  # NaN — в составе нет игроков с отзывами
+        self._no_show_rates = np.zeros(capacity)  # log1p(неявок на подтверждённого)
+        # По столбцу на позицию: срез одной позиции по всем матчам непрерывен.
+        self._positions = np.zeros((MAX_POSITIONS, capacity), dtype=np.int16)
+        self._alive = np.zeros(capacity, dtype=bool)
+
+    def _grow(self) -> None:
+        arrays = ("_ids", "_starts", "_max_players", "_confirmed", "_averages", "_no_show_rates", "_positions", "_alive")
+        current = {name: getattr(self, name) for name in arrays}
+        self._allocate(2 * len(self._ids))
+        for name, values in current.items():
+            getattr(self, name)[..., :values.shape[-1]] = values
+
+    def _code(self, position: str) -> int:
+        return self._codes.setdefault(position, min(len(self._codes), MAX_POSITIONS - 1))
+
+    def _drop(self, match_id: int) -> None:
+        row = self._rows.pop(match_id, None)
+        if row is None:
+            return
+        self._alive[row] = False
+        self._free.append(row)
+        for user_id in self._rosters.pop(match_id, ()):
+            matches = self._members.get(user_id)
+            if matches is not None:
+                matches.discard(match_id)
+                if not matches:
+                    del self._members[user_id]
+
+    def _put(self, row_data: RosterRow) -> None:
+        match_id, starts_at, max_players, confirmed, member_ids, positions, ratings, no_shows = row_data
+        self._drop(match_id)
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._size == len(self._ids):
+                self._grow()
+            row, self._size = self._size, self._size + 1
+        self._rows[match_id] = row
+        self._ids[row] = match_id
+        self._starts[row] = starts_at.timestamp()
+        self._max_players[row] = max_players
+        self._confirmed[row] = confirmed
+        self._averages[row] = sum(ratings) / len(ratings) if ratings else np.nan
+        self._no_show_rates[row] = math.log1p(no_shows / max(confirmed, 1))
+        self._positions[:, row] = 0
+        for position in positions:
+            if position:
+                self._positions[self._code(position), row] += 1
+        self._alive[row] = True
+        self._rosters[match_id] = tuple(member_ids)
+        for user_id in member_ids:
+            self._members.setdefault(user_id, set()).add(match_id)
+
+    def pending(self) -> Tuple[bool, List[int]]:
+        """(нужна полная загрузка, id матчей для точечного перечитывания); забирает отметки."""
+        with self._lock:
+            dirty, self._dirty = sorted(self._dirty), set()
+            full = not self._loaded or self._reload or len(dirty) > FULL_RELOAD_SHARE * max(len(self._rows), 1000)
+            self._reload = False
+            return full, ([] if full else dirty)
+
+    def load(self, rows: Iterable[RosterRow]) -> None:
+        with self._lock:
+            self._allocate(len(self._ids))
+            self._rows, self._free, self._size = {}, [], 0
+            self._rosters, self._members = {}, {}
+            for row in rows:
+                self._put(row)
+            self._loaded = True
+            self.full_loads += 1
+
+    def refresh(self, match_ids: Iterable[int], rows: Iterable[RosterRow]) -> None:
+        """Перечитанные составы матчей match_ids; матчи без строки (не активны, частные,
+        прошли) уходят из индекса."""
+        with self._lock:
+            for match_id in match_ids:
+                self._drop(match_id)
+                self.refreshed += 1
+            for row in rows:
+                self._put(row)
+
+    def recommend(self, player: Player, co_players: Dict[int, int], limit: int,
+                  now: Optional[float] = None) -> List[Tuple[int, float, Optional[float], int]]:
+        """[(match_id, оценка, средний skill_rating состава, знакомых в составе)] по убыванию оценки.
+        co_players — {user_id: сколько матчей сыграно вместе} из прошлых матчей игрока."""
+        self.queries += 1
+        now = datetime.now().timestamp() if now is None else now
+        with self._lock:
+            size = self._size
+            starts, confirmed = self._starts[:size], self._confirmed[:size]
+            candidates = self._alive[:size] & (starts > now) & (confirmed < self._max_players[:size])
+            for match_id in self._members.get(player.user_id, ()):
+                candidates[self._rows[match_id]] = False
+            familiar = np.zeros(size, dtype=np.int32)
+            for user_id in co_players:
+                for match_id in self._members.get(user_id, ()):
+                    familiar[self._rows[match_id]] += 1
+            position_code = self._codes.get(player.position) if player.position else None
+            # Строки не переиспользуются под замком, но массивы можно заменить при _grow — берём копии.
+            averages, no_show_rates = self._averages[:size].copy(), self._no_show_rates[:size].copy()
+            taken = self._positions[position_code, :size].copy() if position_code is not None else None
+            match_ids, starts, confirmed = self._ids[:size].copy(), starts.copy(), confirmed.copy()
+        total = int(np.count_nonzero(candidates))
+        if not total:
+            return []
+
+        # Признаки считаются по всем строкам сразу: выборка кандидатов дороже самих формул.
+        if player.skill_rating is not None:
+            skill = np.exp(-np.abs(averages - player.skill_rating) / SKILL_SCALE)
+            skill[np.isnan(averages)] = NEUTRAL
+        else:
+            skill = NEUTRAL
+        if not player.position:
+            position = NEUTRAL
+        elif taken is None:
+            position = np.where(confirmed > 0, 1.0, NEUTRAL)
+        else:
+            position = np.where(confirmed > 0, 1.0 - taken / np.maximum(confirmed, 1), NEUTRAL)
+        reliability = 1.0 / (1.0 + np.abs(no_show_rates - math.log1p(player.no_show_count)))
+        soon = np.clip(1.0 - (starts - now) / (SOON_HOURS * 3600), 0.0, 1.0)
+        score = (
+            WEIGHTS["skill"] * skill + WEIGHTS["position"] * position
+            + WEIGHTS["reliability"] * reliability + WEIGHTS["soon"] * soon
+        )
+        familiar_rows = np.flatnonzero(familiar)
+        score[familiar_rows] += WEIGHTS["co_players"] * np.minimum(familiar[familiar_rows], CO_PLAYERS_CAP) / CO_PLAYERS_CAP
+        score[~candidates] = -np.inf
+        limit = min(limit, total)
+        top = np.argpartition(-score, limit - 1)[:limit] if size > limit else np.arange(size)
+        top = top[np.lexsort((match_ids[top], -score[top]))]
+        return [
+            (match_id, round(value, 4), None if math.isnan(average) else round(average, 2), count)
+            for match_id, value, average, count in zip(
+                match_ids[top].tolist(), score[top].tolist(), averages[top].tolist(), familiar[top].tolist(),
+            )
+        ]
+
+    def invalidate(self, key: str) -> None:
+        kind, _, object_id = key.partition(":")
+        with self._lock:
+            if kind == "*":
+                self._reload = True
+            elif kind == "player":
+                # Рейтинг или позиция игрока входят в агрегаты всех его матчей.
+                self._dirty.update(self._members.get(int(object_id), ()))
+            else:
+                self._dirty.add(int(object_id))
+
+    def invalidate_on_commit(self, db, match_ids: Iterable[int] = (), user_ids: Iterable[int] = ()) -> None:
+        keys = [f"roster:match:{match_id}" for match_id in match_ids]
+        user_ids = list(user_ids)
+        if len(user_ids) > settings.RECOMMENDATIONS_MAX_POINT_INVALIDATIONS:
+            keys.append("roster:*")
+        else:
+            keys.extend(f"roster:player:{user_id}" for user_id in user_ids)
+        if keys:
+            invalidation.publish(db, *keys)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._loaded = False
+            self._dirty.clear()
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._loaded,
+            "matches": len(self._rows),
+            "players": len(self._members),
+            "full_loads": self.full_loads,
+            "refreshed": self.refreshed,
+            "queries": self.queries,
+            "co_players_cache": co_players_cache.stats(),
+        }
+
+
+roster_index = RosterIndex()
+# Знакомые игрока по завершённым матчам: меняются только с завершением матчей.
+co_players_cache = TTLCache(
+    max_size=settings.RECOMMENDATIONS_CO_PLAYERS_CACHE_SIZE,
+    ttl_seconds=settings.RECOMMENDATIONS_CO_PLAYERS_TTL_SECONDS,
+)
+invalidation.register("roster", roster_index.invalidate, reset=roster_index.reset)
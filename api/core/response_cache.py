@@ -0,0 +1,197 @@
+"""Кэш ответов публичных GET-эндпоинтов со строгими ETag.
+
+Инвалидация — через версии тегов: ключ записи включает текущие версии своих тегов,
+поэтому invalidate(tag) просто увеличивает версию, и старые записи больше не находятся
+(а затем вытесняются по LRU/TTL). Это одинаково работает для локального и общего бэкенда.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional, Sequence, Tuple
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+from . import invalidation
+from .cache import TTLCache
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """LRU в памяти процесса."""
+
+    blocking = False
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._entries = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._versions: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        return self._entries.get(key)
+
+    def set(self, key: str, value: Tuple[str, bytes]) -> None:
+        self._entries.set(key, value)
+
+    def tag_versions(self, tags: Sequence[str]) -> list:
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags: Iterable[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def size(self) -> int:
+        return self._entries.stats()["size"]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisBackend:
+    """Общий для всех воркеров бэкенд. client — redis.Redis или любой совместимый
+    (get / set(ex=) / mget / incr), например локальная заглушка в тестах.
+    Вызовы сетевые и синхронные: ResponseCache выполняет их в threadpool, а не в event loop."""
+
+    prefix = "respcache:"
+    blocking = True
+
+    def __init__(self, client: Any, ttl_seconds: float):
+        self.client = client
+        self.ttl_seconds = int(ttl_seconds)
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        etag, _, body = raw.partition(b"\n")
+        return etag.decode(), body
+
+    def set(self, key: str, value: Tuple[str, bytes]) -> None:
+        etag, body = value
+        self.client.set(self.prefix + key, etag.encode() + b"\n" + body, ex=self.ttl_seconds)
+
+    def tag_versions(self, tags: Sequence[str]) -> list:
+        values = self.client.mget([self.prefix + "tag:" + tag for tag in tags])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def bump(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            self.client.incr(self.prefix + "tag:" + tag)
+
+    def size(self) -> int:
+        return -1
+
+    def clear(self) -> None:
+        # Общий бэкенд не теряет инвалидации при обрыве LISTEN у отдельного воркера.
+        pass
+
+
+@dataclass
+class CacheLookup:
+    key: str
+    if_none_match: Optional[str]
+    response: Optional[Response] = None
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        # bump блокирующего бэкенда, отправленные в поток из event loop и ещё не завершённые.
+        self._bumps: set = set()
+
+    @staticmethod
+    def _etag(body: bytes) -> str:
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def _response(self, etag: str, body: bytes, if_none_match: Optional[str]) -> Response:
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking:
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    async def lookup(self, request: Request, *tags: str) -> CacheLookup:
+        if self._bumps:
+            # Свои инвалидации воркера видны его же следующим запросам (запись, затем чтение).
+            await asyncio.gather(*self._bumps, return_exceptions=True)
+        versions = await self._call(self.backend.tag_versions, tags)
+        key = request.url.path + "?" + str(request.query_params) + "|" + json.dumps(dict(zip(tags, versions)))
+        if_none_match = request.headers.get("if-none-match")
+        cached = await self._call(self.backend.get, key)
+        if cached is None:
+            self.misses += 1
+            return CacheLookup(key=key, if_none_match=if_none_match)
+        self.hits += 1
+        etag, body = cached
+        return CacheLookup(key=key, if_none_match=if_none_match, response=self._response(etag, body, if_none_match))
+
+    async def store(self, lookup: CacheLookup, body) -> Response:
+        if isinstance(body, str):
+            body = body.encode()
+        etag = self._etag(body)
+        await self._call(self.backend.set, lookup.key, (etag, body))
+        return self._response(etag, body, lookup.if_none_match)
+
+    def invalidate(self, *tags: str) -> None:
+        """Вызывается после COMMIT: из потока threadpool (синхронная сессия) или из event loop
+        (AsyncSession, слушатель шины). Во втором случае блокирующий bump уходит в поток."""
+        self.invalidations += len(tags)
+        if self.backend.blocking:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                bump = asyncio.ensure_future(run_in_threadpool(self.backend.bump, tags))
+                self._bumps.add(bump)
+                bump.add_done_callback(self._bump_done)
+                return
+        self.backend.bump(tags)
+
+    def _bump_done(self, bump: asyncio.Future) -> None:
+        self._bumps.discard(bump)
+        if not bump.cancelled() and bump.exception() is not None:
+            logger.error("response cache invalidation failed", exc_info=bump.exception())
+
+    def invalidate_on_commit(self, db, *tags: str) -> None:
+        """Инвалидирует теги после COMMIT db во всех воркерах (через core.invalidation)."""
+        invalidation.publish(db, *(f"response:{tag}" for tag in tags))
+
+    def reset(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def _create_backend():
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        import redis
+        return RedisBackend(redis.Redis.from_url(settings.REDIS_URL), settings.RESPONSE_CACHE_TTL_SECONDS)
+    return MemoryBackend(settings.RESPONSE_CACHE_MAX_SIZE, settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+response_cache = ResponseCache(_create_backend())
+invalidation.register("response", response_cache.invalidate, reset=response_cache.reset)
@@ -0,0 +1,77 @@
+"""Исполнитель фоновых задач генерации расписания (schedule_jobs).
+
+Задачи выполняются в отдельном пуле потоков, а не в воркере запросов. Состояние
+и прогресс хранятся в таблице, поэтому после рестарта незавершённые задачи
+подхватываются заново (resume), причём claim атомарен — между воркерами задача не дублируется.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from db import models, repository
+from db.session import SessionLocal
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleJobRunner:
+    def __init__(self, max_workers: int, chunk_units: int, stale_seconds: int):
+        self.max_workers = max_workers
+        self.chunk_units = chunk_units
+        self.stale_seconds = stale_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="schedule-job")
+            return self._executor
+
+    def submit(self, job_id: int) -> None:
+        self._get_executor().submit(self._run, job_id)
+
+    def resume(self) -> None:
+        """Подхватывает pending и зависшие running задачи (вызывается при старте приложения)."""
+        self._get_executor().submit(self._resume)
+
+    def _resume(self) -> None:
+        db = SessionLocal()
+        try:
+            job_ids = repository.find_resumable_schedule_jobs(db, self.stale_seconds)
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self.submit(job_id)
+
+    def _run(self, job_id: int) -> None:
+        db = SessionLocal()
+        try:
+            if not repository.claim_schedule_job(db, job_id, self.stale_seconds):
+                return
+            job = repository.run_schedule_job(db, job_id, self.chunk_units, should_stop=self._stopping.is_set)
+            if job.status == models.ScheduleJobStatus.running:
+                # Остановка приложения: возвращаем задачу в очередь, прогресс уже зафиксирован.
+                repository.set_schedule_job_status(db, job_id, models.ScheduleJobStatus.pending)
+        except Exception as exc:
+            logger.exception("schedule job %s failed", job_id)
+            db.rollback()
+            repository.set_schedule_job_status(db, job_id, models.ScheduleJobStatus.failed, error=str(exc))
+        finally:
+            db.close()
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+schedule_job_runner = ScheduleJobRunner(
+    max_workers=settings.SCHEDULE_JOB_WORKERS,
+    chunk_units=settings.SCHEDULE_JOB_CHUNK_UNITS,
+    stale_seconds=settings.SCHEDULE_JOB_STALE_SECONDS,
+)
@@ -4,9 +4,12 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 from db import models
-from db.session import SessionLocal
+from db.session import SessionLocal, AsyncSessionLocal
+from . import invalidation
+from .cache import TTLCache
 from .config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -14,6 +17,12 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 1 week
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Кэш аутентифицированных пользователей: токен -> (email, отсоединённый снимок строки users).
+principal_cache = TTLCache(
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -36,12 +45,47 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """AsyncSession при DB_ASYNC=true, иначе обычная Session (db.async_repository уводит её в threadpool)."""
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _snapshot_user(user: models.User) -> models.User:
+    """Копирует колонки пользователя в отдельный объект, не привязанный ни к одной сессии."""
+    snapshot = models.User(**{
+        attr.key: getattr(user, attr.key) for attr in inspect(models.User).column_attrs
+    })
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+def invalidate_principal(email: str) -> int:
+    """Удаляет из кэша все токены пользователя после изменения его строки."""
+    return principal_cache.pop_where(lambda token, entry: entry[0] == email)
+
+def invalidate_principal_on_commit(db: Session, email: str) -> None:
+    """То же, но после COMMIT db и во всех воркерах (через core.invalidation)."""
+    invalidation.publish(db, f"principal:{email}")
+
+invalidation.register("principal", invalidate_principal, reset=principal_cache.clear)
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = principal_cache.get(token)
+    if cached is not None:
+        # merge(load=False) привязывает снимок к сессии запроса без SELECT.
+        return db.merge(cached[1], load=False)
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -54,4 +98,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+
+    expires_in = payload.get("exp", 0) - datetime.now(timezone.utc).timestamp()
+    principal_cache.set(token, (email, _snapshot_user(user)), ttl_seconds=expires_in)
+    return user
@@ -0,0 +1,232 @@
+"""Полнотекстовый поиск по заведениям и полям.
+
+В Postgres ищут генерируемые колонки search_vector (tsvector, префиксный to_tsquery) и
+search_text (pg_trgm, word_similarity для опечаток) — см. repository.search_venues.
+Без Postgres или без расширения pg_trgm работает TextSearchIndex — инвертированный
+индекс в памяти с той же семантикой: каждое слово запроса должно совпасть со словом
+документа точно, как префикс или по триграммам. Индекс загружается при первом запросе,
+записи заведений и полей помечают документы устаревшими через core.invalidation.
+"""
+import bisect
+import heapq
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from . import invalidation
+from .config import settings
+
+_WORD = re.compile(r"\w+")
+MAX_QUERY_TERMS = 8
+
+# Вес колонки документа (как setweight A/B/C/D в search_vector) и множители совпадений.
+WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+EXACT, PREFIX, FUZZY = 1.0, 0.7, 0.5
+# Совпадение по полю заведения весит чуть меньше совпадения по самому заведению.
+FIELD_FACTOR = 0.8
+
+
+def terms(query: str) -> List[str]:
+    return list(dict.fromkeys(_WORD.findall(query.lower())))[:MAX_QUERY_TERMS]
+
+
+def prefix_tsquery(words: List[str]) -> str:
+    """['мини', 'футб'] -> "мини:* & футб:*" (слова уже без спецсимволов to_tsquery)."""
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TextSearchIndex:
+    def __init__(self, backend: str, similarity_threshold: float):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self._postgres_ready: Optional[bool] = None
+        # Документ — int: id заведения или минус id поля. Только int, float и кортежи строк:
+        # такие контейнеры сборщик мусора не отслеживает, и большой индекс не даёт пауз GC.
+        self._doc_venue: Dict[int, int] = {}
+        self._doc_tokens: Dict[int, Tuple[str, ...]] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._sorted: List[str] = []
+        self._sorted_stale = False
+        self._loaded = False
+        self._dirty: Set[Tuple[str, int]] = set()
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.refreshed = 0
+        self.queries = 0
+
+    def use_postgres(self, connection) -> bool:
+        """Искать ли средствами Postgres: TEXT_SEARCH_BACKEND или (auto) наличие pg_trgm."""
+        if self.backend != "auto":
+            return self.backend == "postgres"
+        if self._postgres_ready is None:
+            self._postgres_ready = connection.dialect.name == "postgresql" and bool(connection.exec_driver_sql(
+                "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+            ).scalar())
+        return self._postgres_ready
+
+    def _put(self, key: int, venue_id: int, columns: Iterable[Tuple[str, Optional[str]]]) -> None:
+        self._drop(key)
+        tokens: Dict[str, float] = {}
+        for weight, value in columns:
+            for token in _WORD.findall((value or "").lower()):
+                tokens[token] = max(tokens.get(token, 0.0), WEIGHTS[weight])
+        self._doc_venue[key] = venue_id
+        self._doc_tokens[key] = tuple(tokens)
+        for token, weight in tokens.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                for gram in trigrams(token):
+                    self._trigrams.setdefault(gram, set()).add(token)
+                self._sorted_stale = True
+            posting[key] = weight
+
+    def _drop(self, key: int) -> None:
+        tokens = self._doc_tokens.pop(key, None)
+        if tokens is None:
+            return
+        del self._doc_venue[key]
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(key, None)
+            if not posting:
+                del self._postings[token]
+                for gram in trigrams(token):
+                    members = self._trigrams.get(gram)
+                    if members is not None:
+                        members.discard(token)
+                        if not members:
+                            del self._trigrams[gram]
+                self._sorted_stale = True
+
+    def _add_rows(self, venue_rows, field_rows) -> None:
+        for venue_id, title, description in venue_rows:
+            self._put(venue_id, venue_id, (("A", title), ("B", description)))
+        for field_id, venue_id, sport, address, amenities, description in field_rows:
+            self._put(-field_id, venue_id, (
+                ("A", sport), ("B", address), ("C", amenities), ("D", description),
+            ))
+
+    def pending(self) -> Tuple[bool, List[int], List[int]]:
+        """(нужна полная загрузка, id заведений, id полей для перечитывания); забирает отметки."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return (
+                not self._loaded,
+                sorted(key for kind, key in dirty if kind == "venue"),
+                sorted(key for kind, key in dirty if kind == "field"),
+            )
+
+    def load(self, venue_rows, field_rows) -> None:
+        with self._lock:
+            self._doc_venue, self._doc_tokens, self._postings, self._trigrams = {}, {}, {}, {}
+            self._add_rows(venue_rows, field_rows)
+            self._sorted_stale = True
+            self._loaded = True
+            self.full_loads += 1
+
+    def refresh(self, venue_ids: List[int], field_ids: List[int], venue_rows, field_rows) -> None:
+        """Перечитанные строки; документы из venue_ids/field_ids без строки (удалены) уходят из индекса."""
+        with self._lock:
+            for key in list(venue_ids) + [-field_id for field_id in field_ids]:
+                self._drop(key)
+                self.refreshed += 1
+            self._add_rows(venue_rows, field_rows)
+
+    def _matches(self, term: str) -> Dict[int, float]:
+        """Документы, в которых есть слово, совпадающее с term, и лучший вес совпадения."""
+        found: Dict[int, float] = {}
+
+        def add(token: str, factor: float) -> None:
+            for key, weight in self._postings[token].items():
+                if weight * factor > found.get(key, 0.0):
+                    found[key] = weight * factor
+
+        for position in range(bisect.bisect_left(self._sorted, term), len(self._sorted)):
+            token = self._sorted[position]
+            if not token.startswith(term):
+                break
+            add(token, EXACT if token == term else PREFIX)
+        grams = trigrams(term)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for token in self._trigrams.get(gram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        for token, common in shared.items():
+            similarity = common / (len(grams) + len(trigrams(token)) - common)
+            if similarity >= self.similarity_threshold and not token.startswith(term):
+                add(token, FUZZY * similarity)
+        return found
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float, List[int]]]:
+        """[(venue_id, score, id совпавших полей)] по убыванию score."""
+        self.queries += 1
+        words = terms(query)
+        if not words:
+            return []
+        with self._lock:
+            if self._sorted_stale:
+                self._sorted = sorted(self._postings)
+                self._sorted_stale = False
+            scores: Optional[Dict[int, float]] = None
+            for word in words:
+                matched = self._matches(word)
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {key: score + matched[key] for key, score in scores.items() if key in matched}
+                if not scores:
+                    return []
+            doc_venue, best = self._doc_venue, {}
+            for key, score in scores.items():
+                venue_id = doc_venue[key]
+                if key < 0:
+                    score *= FIELD_FACTOR
+                if score > best.get(venue_id, 0.0):
+                    best[venue_id] = score
+            ranked = heapq.nsmallest(limit, best.items(), key=lambda item: (-item[1], item[0]))
+            # Совпавшие поля собираются только для попавших в выдачу заведений.
+            field_ids: Dict[int, List[int]] = {venue_id: [] for venue_id, _ in ranked}
+            for key in scores:
+                if key < 0 and doc_venue[key] in field_ids:
+                    field_ids[doc_venue[key]].append(-key)
+        return [(venue_id, round(score, 4), sorted(field_ids[venue_id])) for venue_id, score in ranked]
+
+    def invalidate(self, key: str) -> None:
+        kind, _, object_id = key.partition(":")
+        with self._lock:
+            self._dirty.add((kind, int(object_id)))
+
+    def invalidate_on_commit(self, db, kind: str, object_id: int) -> None:
+        invalidation.publish(db, f"textsearch:{kind}:{object_id}")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._loaded = False
+            self._dirty.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend if self.backend != "auto" or self._postgres_ready is None
+            else ("postgres" if self._postgres_ready else "memory"),
+            "loaded": self._loaded,
+            "documents": len(self._doc_tokens),
+            "tokens": len(self._postings),
+            "full_loads": self.full_loads,
+            "refreshed": self.refreshed,
+            "queries": self.queries,
+        }
+
+
+text_search_index = TextSearchIndex(
+    backend=settings.TEXT_SEARCH_BACKEND,
+    similarity_threshold=settings.TEXT_SEARCH_SIMILARITY,
+)
+invalidation.register("textsearch", text_search_index.invalidate, reset=text_search_index.reset)
@@ -0,0 +1,326 @@
+"""Загрузка файлов пользователей в static/: потоково, с лимитом размера и дедупликацией.
+
+Тело multipart читается из request.stream() по мере поступления, без буферизации всего
+файла: данные части "file" копятся до UPLOAD_CHUNK_BYTES и пачкой уходят в поток, где
+дописываются во временный файл и в sha256. Превышение лимита обрывает приём сразу
+(413). Готовый файл кладётся под именем по содержимому —
+<вид>/<первые 2 символа sha256>/<sha256>.<расширение>, — так что одинаковые файлы
+хранятся один раз, а повторная загрузка только обновляет mtime существующего.
+
+Старые файлы после замены фото не удаляются сразу (тот же файл может быть у других
+пользователей): их убирает фоновая уборка sweep_orphans из core.lifecycle — файлы старше
+UPLOAD_ORPHAN_GRACE_SECONDS, на которые не ссылается ни один пользователь.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+import anyio
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+from .config import settings
+
+# Заголовки multipart и прочие поля сверх самого файла, байт.
+MULTIPART_OVERHEAD = 16 * 1024
+INCOMING_DIR = ".incoming"
+# Недописанные временные файлы (оборванные загрузки, падение воркера) старше — мусор.
+INCOMING_STALE_SECONDS = 3600
+_EXTENSION = re.compile(r"^[a-z0-9]{1,10}$")
+# Поле User, в котором хранится ссылка на файл каждого вида.
+UPLOAD_COLUMNS = {"avatars": "photo_url", "docs": "achievements_doc"}
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StoredUpload(NamedTuple):
+    url: str  # "/static/<вид>/<xx>/<sha256>.<ext>"
+    sha256: str
+    size: int
+    deduplicated: bool
+
+
+def _extension(filename: Optional[str], default: str) -> str:
+    extension = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else default
+    return extension if _EXTENSION.match(extension) else default
+
+
+class _Receiver:
+    """Колбэки MultipartParser: данные части field_name копятся в pending до записи."""
+
+    def __init__(self, field_name: str, max_bytes: int):
+        self.field_name = field_name
+        self.max_bytes = max_bytes
+        self.pending: List[bytes] = []
+        self.pending_bytes = 0
+        self.size = 0
+        self.filename: Optional[str] = None
+        self.found = False
+        self.done = False
+        self._capturing = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self) -> None:
+        self._capturing = False
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        # Берём первую файловую часть с нужным именем; остальные части пропускаются.
+        if not self.found and options.get(b"name") == self.field_name.encode() and b"filename" in options:
+            self.found = self._capturing = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._capturing:
+            return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise UploadError(413, f"Файл больше {self.max_bytes // (1024 * 1024)} МБ")
+        self.pending.append(data[start:end])
+        self.pending_bytes += end - start
+
+    def on_part_end(self) -> None:
+        if self._capturing:
+            self._capturing = False
+            self.done = True
+
+    def take(self) -> bytes:
+        data, self.pending, self.pending_bytes = b"".join(self.pending), [], 0
+        return data
+
+
+class UploadStats:
+    def __init__(self):
+        self.stored = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.failed = 0
+        self.bytes_received = 0
+        self.in_progress = 0
+        self.max_in_progress = 0
+        self.sweeps = 0
+        self.swept = 0
+        self.last_sweep_ms = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "bytes_received": self.bytes_received,
+            "in_progress": self.in_progress,
+            "max_in_progress": self.max_in_progress,
+            "sweeps": self.sweeps,
+            "swept": self.swept,
+            "last_sweep_ms": round(self.last_sweep_ms, 2),
+        }
+
+
+class UploadStore:
+    def __init__(self, root: str, max_bytes: Dict[str, int], chunk_bytes: int,
+                 orphan_grace_seconds: float, sweep_interval_seconds: float):
+        self.root = root
+        self.max_bytes = max_bytes  # вид ("avatars", "docs") -> лимит размера файла
+        self.chunk_bytes = chunk_bytes
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.stats = UploadStats()
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        for kind in max_bytes:
+            os.makedirs(os.path.join(root, kind, INCOMING_DIR), exist_ok=True)
+
+    def url(self, kind: str, relative_path: str) -> str:
+        return f"/{self.root}/{kind}/{relative_path}"
+
+    async def receive(self, request: Request, kind: str, default_extension: str,
+                      field_name: str = "file") -> StoredUpload:
+        """Принимает multipart-тело запроса и сохраняет часть field_name; UploadError — отказ."""
+        max_bytes = self.max_bytes[kind]
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise UploadError(400, "Ожидается multipart/form-data")
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+            self.stats.rejected += 1
+            raise UploadError(413, f"Файл больше {max_bytes // (1024 * 1024)} МБ")
+
+        receiver = _Receiver(field_name, max_bytes)
+        parser = MultipartParser(options[b"boundary"], receiver.callbacks())
+        incoming = os.path.join(self.root, kind, INCOMING_DIR, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        body_bytes = 0
+        self.stats.in_progress += 1
+        self.stats.max_in_progress = max(self.stats.max_in_progress, self.stats.in_progress)
+        file = None
+        try:
+            file = await anyio.to_thread.run_sync(open, incoming, "wb")
+            async for chunk in request.stream():
+                body_bytes += len(chunk)
+                if body_bytes > max_bytes + MULTIPART_OVERHEAD:
+                    raise UploadError(413, f"Файл больше {max_bytes // (1024 * 1024)} МБ")
+                parser.write(chunk)
+                if receiver.pending_bytes >= self.chunk_bytes:
+                    # sha256 и запись отпускают GIL: считаем их в потоке, а не в цикле событий.
+                    await anyio.to_thread.run_sync(_write, file, digest, receiver.take())
+            parser.finalize()
+            if not receiver.done:
+                raise UploadError(400, "Файл не передан")
+            await anyio.to_thread.run_sync(_write, file, digest, receiver.take())
+            await anyio.to_thread.run_sync(file.close)
+            sha256 = digest.hexdigest()
+            relative_path = f"{sha256[:2]}/{sha256}.{_extension(receiver.filename, default_extension)}"
+            deduplicated = await anyio.to_thread.run_sync(self._place, incoming, kind, relative_path)
+        except BaseException as exc:
+            if file is not None:
+                file.close()
+            _remove(incoming)
+            if isinstance(exc, UploadError):
+                self.stats.rejected += 1
+            elif isinstance(exc, FormParserError):
+                self.stats.rejected += 1
+                raise UploadError(400, "Некорректное multipart-тело") from exc
+            else:
+                self.stats.failed += 1
+            raise
+        finally:
+            self.stats.in_progress -= 1
+            self.stats.bytes_received += body_bytes
+        if deduplicated:
+            self.stats.deduplicated += 1
+        else:
+            self.stats.stored += 1
+        return StoredUpload(self.url(kind, relative_path), sha256, receiver.size, deduplicated)
+
+    def _place(self, incoming: str, kind: str, relative_path: str) -> bool:
+        """Переносит готовый файл на место по содержимому; True — такой файл уже был."""
+        target = os.path.join(self.root, kind, relative_path)
+        if os.path.exists(target):
+            os.remove(incoming)
+            # Свежий mtime защищает файл от уборки, пока новая ссылка на него не закоммичена.
+            os.utime(target)
+            return True
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(incoming, target)
+        return False
+
+    def sweep_due(self) -> bool:
+        """Пора ли очередной уборке; отмечает начало, чтобы следующая была через интервал."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_sweep:
+                return False
+            self._next_sweep = now + self.sweep_interval_seconds
+            return True
+
+    def candidates(self, kind: str, now: Optional[float] = None) -> Iterator[Tuple[str, str, float]]:
+        """(url, путь, mtime) файлов вида kind старше периода ожидания; недописанные
+        временные файлы удаляются здесь же."""
+        now = time.time() if now is None else now
+        base = os.path.join(self.root, kind)
+        for directory, subdirectories, files in os.walk(base):
+            if os.path.basename(directory) == INCOMING_DIR:
+                for name in files:
+                    path = os.path.join(directory, name)
+                    if _mtime(path) < now - INCOMING_STALE_SECONDS:
+                        _remove(path)
+                continue
+            for name in files:
+                path = os.path.join(directory, name)
+                mtime = _mtime(path)
+                if mtime < now - self.orphan_grace_seconds:
+                    yield self.url(kind, os.path.relpath(path, base).replace(os.sep, "/")), path, mtime
+
+    def sweep_orphans(self, referenced: Callable[[str, List[str]], Set[str]], batch_size: int,
+                      dry_run: bool = False) -> int:
+        """Удаляет файлы без ссылок; referenced(kind, urls) — какие из urls ещё используются."""
+        started = time.perf_counter()
+        removed = 0
+        for kind in self.max_bytes:
+            for batch in _batches(self.candidates(kind), batch_size):
+                used = referenced(kind, [url for url, _, _ in batch])
+                for url, path, mtime in batch:
+                    # Файл могли загрузить повторно (дедупликация обновляет mtime) после обхода.
+                    if url in used or _mtime(path) != mtime:
+                        continue
+                    if not dry_run:
+                        _remove(path)
+                    removed += 1
+        self.stats.sweeps += 1
+        self.stats.swept += 0 if dry_run else removed
+        self.stats.last_sweep_ms = (time.perf_counter() - started) * 1000
+        return removed
+
+
+def _write(file, digest, data: bytes) -> None:
+    if data:
+        digest.update(data)
+        file.write(data)
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return -1.0
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+upload_store = UploadStore(
+    root="static",
+    max_bytes={"avatars": settings.UPLOAD_MAX_PHOTO_BYTES, "docs": settings.UPLOAD_MAX_DOCUMENT_BYTES},
+    chunk_bytes=settings.UPLOAD_CHUNK_BYTES,
+    orphan_grace_seconds=settings.UPLOAD_ORPHAN_GRACE_SECONDS,
+    sweep_interval_seconds=settings.UPLOAD_SWEEP_INTERVAL_SECONDS,
+)
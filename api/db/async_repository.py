@@ -0,0 +1,184 @@
+"""Асинхронные версии горячих функций repository (AsyncSession + asyncpg).
+
+Каждая функция принимает либо AsyncSession, либо обычную Session: во втором случае
+(DB_ASYNC=false) вызывается синхронная реализация из repository в threadpool,
+так что роутеры не зависят от выбранного режима.
+"""
+import functools
+from datetime import date, time, datetime
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
+from core.pricing import pricing_engine
+from core.geo import geo_index
+from core.recommendations import co_players_cache, roster_index
+from core import geo
+from . import models, repository
+
+
+def _sync_fallback(sync_fn):
+    def decorator(async_fn):
+        @functools.wraps(async_fn)
+        async def wrapper(db, *args, **kwargs):
+            if isinstance(db, AsyncSession):
+                return await async_fn(db, *args, **kwargs)
+            return await run_in_threadpool(sync_fn, db, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@_sync_fallback(repository.get_active_matches)
+async def get_active_matches(db: AsyncSession, skip: int = 0, limit: int = 100, after: Optional[tuple] = None):
+    stmt = repository.active_matches_query(after)
+    if after is None and skip:
+        stmt = stmt.offset(skip)
+    return (await db.execute(stmt.limit(limit))).scalars().all()
+
+
+@_sync_fallback(repository.refresh_geo_index)
+async def refresh_geo_index(db: AsyncSession) -> None:
+    full, dirty = geo_index.pending()
+    if full:
+        geo_index.load((await db.execute(repository.geo_points_query())).all())
+    elif dirty:
+        geo_index.refresh(dirty, (await db.execute(repository.geo_points_query(dirty))).all())
+
+
+@_sync_fallback(repository.nearby_field_ids)
+async def nearby_field_ids(db: AsyncSession, lat: float, lon: float, radius_km: float, limit: Optional[int] = None):
+    if geo_index.enabled:
+        await refresh_geo_index(db)
+        return geo_index.search(lat, lon, radius_km, limit)
+    rows = (await db.execute(repository.geo_bbox_query(lat, lon, radius_km))).all()
+    return geo.rank(rows, lat, lon, radius_km, limit)
+
+
+@_sync_fallback(repository.search_matches)
+async def search_matches(db: AsyncSession, params, limit: int = 50, after: Optional[tuple] = None):
+    near_field_ids = None
+    if params.near is not None:
+        near_field_ids = [field_id for field_id, _ in await nearby_field_ids(db, *params.near, params.radius_km)]
+    items, facets = repository.match_search_statements(params, limit, after, near_field_ids)
+    return repository.match_search_page(
+        params, (await db.execute(items)).scalars().all(), (await db.execute(facets)).all(), limit
+    )
+
+
+
+@_sync_fallback(repository.refresh_roster_index)
+async def refresh_roster_index(db: AsyncSession) -> None:
+    full, dirty = roster_index.pending()
+    if full:
+        roster_index.load((await db.execute(repository.ROSTER_ROWS_SQL, {"match_ids": None})).all())
+    elif dirty:
+        roster_index.refresh(dirty, (await db.execute(repository.ROSTER_ROWS_SQL, {"match_ids": dirty})).all())
+
+
+@_sync_fallback(repository.co_players_for)
+async def co_players_for(db: AsyncSession, user_id: int, limit: int) -> dict:
+    co_players = co_players_cache.get(user_id)
+    if co_players is None:
+        co_players = dict((await db.execute(repository.CO_PLAYERS_SQL, {"user_id": user_id, "limit": limit})).all())
+        co_players_cache.set(user_id, co_players)
+    return co_players
+
+
+@_sync_fallback(repository.recommend_matches)
+async def recommend_matches(db: AsyncSession, user: models.User, limit: int, co_players_limit: int) -> list:
+    await refresh_roster_index(db)
+    recommended = roster_index.recommend(
+        repository.recommendation_player(user), await co_players_for(db, user.id, co_players_limit), limit,
+    )
+    if not recommended:
+        return []
+    matches = (await db.execute(repository.recommended_matches_query([row[0] for row in recommended]))).scalars().all()
+    return repository.order_by_recommendation(matches, recommended)
+
+@_sync_fallback(repository.get_match_by_id)
+async def get_match_by_id(db: AsyncSession, match_id: int):
+    stmt = select(models.Match)\
+        .options(
+            joinedload(models.Match.captain), joinedload(models.Match.field),
+            joinedload(models.Match.players).joinedload(models.MatchPlayer.user)
+        ).filter(models.Match.id == match_id)\
+        .execution_options(populate_existing=True)
+    return (await db.execute(stmt)).unique().scalars().first()
+
+
+@_sync_fallback(repository.get_match_row)
+async def get_match_row(db: AsyncSession, match_id: int):
+    return await db.get(models.Match, match_id)
+
+
+@_sync_fallback(repository.get_match_details_json)
+async def get_match_details_json(db: AsyncSession, match_id: int) -> Optional[str]:
+    if db.get_bind().dialect.name == "postgresql":
+        return (await db.execute(repository.MATCH_DETAILS_JSON_SQL, {"match_id": match_id})).scalar()
+    match = await get_match_by_id(db, match_id)
+    return repository.match_details_from_orm(match) if match else None
+
+
+@_sync_fallback(repository.add_player_to_match)
+async def add_player_to_match(db: AsyncSession, user: models.User, match: models.Match, details: bool = False):
+    row = (await db.execute(repository.JOIN_MATCH_SQL, {"match_id": match.id, "user_id": user.id})).one()
+    result = repository.join_outcome(db, user, match, row)
+    if details:
+        result = await get_match_details_json(db, match.id)
+    await db.commit()
+    return result
+
+
+@_sync_fallback(repository.remove_player_from_match)
+async def remove_player_from_match(db: AsyncSession, user: models.User, match: models.Match, details: bool = False):
+    if match.captain_id == user.id: return None
+    await db.execute(repository.LOCK_MATCH_SQL, {"match_id": match.id})
+    row = (await db.execute(repository.LEAVE_MATCH_SQL, {"match_id": match.id, "user_id": user.id})).one()
+    repository.leave_outcome(db, user, match, row)
+    result = await get_match_details_json(db, match.id) if details else match
+    await db.commit()
+    return result
+
+
+@_sync_fallback(repository.get_slots_for_field_on_date)
+async def get_slots_for_field_on_date(db: AsyncSession, field_id: int, on_date: date):
+    start_of_day = datetime.combine(on_date, time.min)
+    end_of_day = datetime.combine(on_date, time.max)
+    stmt = select(models.TimeSlot)\
+        .options(joinedload(models.TimeSlot.field))\
+        .filter(models.TimeSlot.field_id == field_id)\
+        .filter(models.TimeSlot.start_time.between(start_of_day, end_of_day))\
+        .order_by(models.TimeSlot.start_time.asc())
+    slots = (await db.execute(stmt)).scalars().all()
+    return repository.apply_slot_prices(await compiled_pricing(db, [field_id]), slots)
+
+
+async def compiled_pricing(db: AsyncSession, field_ids) -> dict:
+    compiled, missing = pricing_engine.lookup(field_ids)
+    if missing:
+        rules = (await db.execute(repository.pricing_rules_query(missing))).scalars().all()
+        compiled.update(pricing_engine.load(missing, rules))
+    return compiled
+
+
+@_sync_fallback(repository.get_availability)
+async def get_availability(db: AsyncSession, field_ids: list, start_date: date, days: int) -> dict:
+    rows = (await db.execute(repository.availability_query(field_ids, start_date, days))).all()
+    rows = repository.price_availability_rows(await compiled_pricing(db, field_ids), rows)
+    return repository.encode_availability(rows, field_ids, start_date, days)
+
+
+@_sync_fallback(repository.get_venue_field_ids)
+async def get_venue_field_ids(db: AsyncSession, venue_id: int) -> list:
+    stmt = select(models.Field.id).where(models.Field.venue_id == venue_id).order_by(models.Field.id)
+    return (await db.execute(stmt)).scalars().all()
+
+
+@_sync_fallback(repository.get_venues)
+async def get_venues(db: AsyncSession, skip: int = 0, limit: int = 100):
+    stmt = select(models.VenueProfile)\
+        .options(selectinload(models.VenueProfile.fields))\
+        .order_by(models.VenueProfile.id)\
+        .offset(skip).limit(limit)
+    return (await db.execute(stmt)).scalars().all()
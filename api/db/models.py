@@ -2,9 +2,12 @@ import enum
 import secrets
 import string
 from sqlalchemy import (
-    Column, Integer, String, DateTime, Date, Float, Text, Enum as SQLAlchemyEnum, func, ForeignKey, Boolean
+    Column, Integer, String, DateTime, Date, Time, Float, Text, Enum as SQLAlchemyEnum, func, ForeignKey, Boolean,
+    Index, JSON, PrimaryKeyConstraint, text, Computed, UniqueConstraint, DDL, FetchedValue, event
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from .session import Base
 
 def generate_invite_code(length=8):
@@ -31,6 +34,12 @@ class TimeSlotStatus(enum.Enum):
     booked = "booked"
     unavailable = "unavailable"
 
+class ScheduleJobStatus(enum.Enum):
+    pending = "pending"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
 class ReviewType(enum.Enum):
     sportsmanship = "sportsmanship"
     skill = "skill"
@@ -49,7 +58,12 @@ class User(Base):
     sportsmanship_rating = Column(Float, default=0, nullable=False)
     skill_rating = Column(Float, default=0, nullable=False)
     no_show_count = Column(Integer, default=0, nullable=False)
-    reviews_count = Column(Integer, default=0, nullable=False)
+    reviews_count = Column(Integer, default=0, nullable=False)  # всего отзывов обоих типов
+    skill_reviews_count = Column(Integer, default=0, server_default='0', nullable=False)
+    sportsmanship_reviews_count = Column(Integer, default=0, server_default='0', nullable=False)
+    # Сглаженные оценки (core/ratings.py); NULL, пока отзывов этого типа нет.
+    skill_score = Column(Float)
+    sportsmanship_score = Column(Float)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
     venue_profile = relationship("VenueProfile", back_populates="owner", uselist=False)
@@ -58,6 +72,31 @@ class User(Base):
     reviews_given = relationship("PlayerReview", back_populates="reviewer", foreign_keys='PlayerReview.reviewer_id')
     reviews_received = relationship("PlayerReview", back_populates="subject", foreign_keys='PlayerReview.subject_id')
 
+    __table_args__ = (
+        # Уборка загруженных файлов ищет, у кого ещё есть ссылка (core/uploads.py).
+        Index("ix_users_photo_url_uploaded", "photo_url", postgresql_where=text("photo_url LIKE '/static/%'")),
+        Index("ix_users_achievements_doc_uploaded", "achievements_doc",
+              postgresql_where=text("achievements_doc LIKE '/static/%'")),
+    )
+
+SEARCH_VECTOR = TSVECTOR().with_variant(Text, "sqlite")
+
+
+@compiles(Computed, "sqlite")
+def _sqlite_computed(computed, compiler, **kw):
+    """Генерируемые колонки поиска считаются функциями Postgres (to_tsvector, setweight),
+    на SQLite колонка остаётся обычной и пустой."""
+    return ""
+
+
+def _has_pg_trgm(ddl, target, bind, **kw) -> bool:
+    """Триграммный индекс создаётся, только если есть pg_trgm — как в миграции 8f3b6d2e0a94;
+    без расширения поиск работает индексом в памяти."""
+    if bind is None or bind.dialect.name != "postgresql":
+        return True
+    return bool(bind.exec_driver_sql("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')").scalar())
+
+
 class VenueProfile(Base):
     __tablename__ = "venue_profiles"
     id = Column(Integer, primary_key=True, index=True)
@@ -66,21 +105,65 @@ class VenueProfile(Base):
     title = Column(String(255), nullable=False)
     description = Column(Text)
     phone_number = Column(String(50))
+    # Поиск (core/text_search.py): колонки генерирует Postgres, ORM их не загружает и не пишет.
+    # На SQLite это обычные пустые колонки (см. _sqlite_computed) — там ищет индекс в памяти.
+    search_vector = deferred(Column(SEARCH_VECTOR, Computed(
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')", persisted=True
+    )))
+    search_text = deferred(Column(Text, Computed(
+        "lower(coalesce(title, '') || ' ' || coalesce(description, ''))", persisted=True
+    )))
     owner = relationship("User", back_populates="venue_profile")
     fields = relationship("Field", back_populates="venue", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_venue_profiles_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_venue_profiles_search_text", "search_text", postgresql_using="gin",
+              postgresql_ops={"search_text": "gin_trgm_ops"}).ddl_if(callable_=_has_pg_trgm),
+    )
+
+# pg_trgm из contrib ставится, если он доступен серверу (иначе триграммных индексов нет).
+event.listen(VenueProfile.__table__, "before_create", DDL(
+    "DO $$ BEGIN "
+    "IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') "
+    "THEN CREATE EXTENSION IF NOT EXISTS pg_trgm; END IF; "
+    "END $$"
+).execute_if(dialect="postgresql"))
+
 class Field(Base):
     __tablename__ = "fields"
     id = Column(Integer, primary_key=True, index=True)
-    venue_id = Column(Integer, ForeignKey("venue_profiles.id"), nullable=False)
-    sport = Column(String(100), nullable=False)
+    venue_id = Column(Integer, ForeignKey("venue_profiles.id"), nullable=False, index=True)
+    sport = Column(String(100), nullable=False, index=True)
     address = Column(String(512), nullable=False)
     price_per_hour = Column(Integer, nullable=False)
     description = Column(Text)
     amenities = Column(String(512))
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    search_vector = deferred(Column(SEARCH_VECTOR, Computed(
+        "setweight(to_tsvector('simple', sport), 'A') || "
+        "setweight(to_tsvector('simple', address), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(amenities, '')), 'C') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'D')", persisted=True
+    )))
+    search_text = deferred(Column(Text, Computed(
+        "lower(sport || ' ' || address || ' ' || coalesce(amenities, '') || ' ' || coalesce(description, ''))",
+        persisted=True
+    )))
     venue = relationship("VenueProfile", back_populates="fields")
     matches = relationship("Match", back_populates="field")
     slots = relationship("TimeSlot", back_populates="field", cascade="all, delete-orphan")
+    pricing_rules = relationship("PricingRule", back_populates="field", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Bounding box поиска рядом, когда индекс в памяти (core/geo.py) выключен.
+        Index("ix_fields_lat_lon", "latitude", "longitude", postgresql_where=text("latitude IS NOT NULL")),
+        Index("ix_fields_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_fields_search_text", "search_text", postgresql_using="gin",
+              postgresql_ops={"search_text": "gin_trgm_ops"}).ddl_if(callable_=_has_pg_trgm),
+    )
 
 class Match(Base):
     __tablename__ = "matches"
@@ -93,12 +176,35 @@ class Match(Base):
     status = Column(SQLAlchemyEnum(MatchStatus), default=MatchStatus.active, nullable=False)
     is_private = Column(Boolean, default=False)
     waitlist_enabled = Column(Boolean, nullable=False, server_default='true')
-    slot_id = Column(Integer, ForeignKey("time_slots.id"), nullable=True, unique=True)
+    # Без внешнего ключа: у партиционированной time_slots id уникален только вместе с start_time.
+    slot_id = Column(Integer, nullable=True, unique=True)
     invite_code = Column(String(10), unique=True, index=True, default=generate_invite_code)
+    # Денормализованные счётчики match_players; меняются только атомарными UPDATE в repository.
+    confirmed_count = Column(Integer, nullable=False, default=0, server_default='0')
+    waitlist_count = Column(Integer, nullable=False, default=0, server_default='0')
     captain = relationship("User", back_populates="matches_as_captain", foreign_keys=[captain_id])
     field = relationship("Field", back_populates="matches")
     players = relationship("MatchPlayer", back_populates="match", cascade="all, delete-orphan")
-    slot = relationship("TimeSlot", back_populates="match")
+    slot = relationship("TimeSlot", primaryjoin="foreign(Match.slot_id) == TimeSlot.id")
+
+    @property
+    def players_count(self) -> int:
+        return self.confirmed_count or 0
+
+    __table_args__ = (
+        # Покрывает keyset-пагинацию публичной ленты: WHERE active AND NOT private ORDER BY starts_at, id.
+        Index(
+            "ix_matches_feed", "starts_at", "id",
+            postgresql_where=text("status = 'active' AND is_private = false"),
+        ),
+        # Поиск (routers/matches.py /search): фильтры по полю сводятся к field_id IN (...).
+        Index(
+            "ix_matches_search", "field_id", "starts_at",
+            postgresql_where=text("status = 'active' AND is_private = false"),
+        ),
+        # Поиск завершившихся активных матчей планировщиком жизненного цикла.
+        Index("ix_matches_active_starts", "starts_at", postgresql_where=text("status = 'active'")),
+    )
 
 class MatchPlayer(Base):
     __tablename__ = "match_players"
@@ -110,17 +216,126 @@ class MatchPlayer(Base):
     match = relationship("Match", back_populates="players")
     user = relationship("User", back_populates="match_participations")
 
+    __table_args__ = (
+        # Игрок в матче один раз; на индекс опирается ON CONFLICT при вступлении.
+        Index("uq_match_players_match_user", "match_id", "user_id", unique=True),
+        # Матчи игрока: знакомые по прошлым матчам для рекомендаций.
+        Index("ix_match_players_user_id", "user_id"),
+    )
+
 class TimeSlot(Base):
+    """Слот поля. Таблица партиционирована помесячно по start_time (см. db.partitions),
+    поэтому первичный ключ в БД — (id, start_time); для ORM идентичность по-прежнему id."""
     __tablename__ = "time_slots"
-    id = Column(Integer, primary_key=True, index=True)
+    # Значение выдаёт БД: на Postgres — nextval('time_slots_id_seq') (см. ниже), на SQLite — rowid.
+    id = Column(Integer, primary_key=True, autoincrement=False, server_default=FetchedValue(), index=True)
     field_id = Column(Integer, ForeignKey("fields.id"), nullable=False)
-    start_time = Column(DateTime, nullable=False)
+    start_time = Column(DateTime, primary_key=True)
     end_time = Column(DateTime, nullable=False)
     price_override = Column(Integer)
     status = Column(SQLAlchemyEnum(TimeSlotStatus), default=TimeSlotStatus.available, nullable=False)
     match_id = Column(Integer, ForeignKey("matches.id"), nullable=True)
+    # Короткое удержание слота капитаном, пока он заполняет форму матча.
+    held_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    held_until = Column(DateTime, nullable=True)
     field = relationship("Field", back_populates="slots")
-    match = relationship("Match", back_populates="slot", uselist=False)
+    match = relationship("Match", foreign_keys=[match_id])
+
+    __table_args__ = (
+        # Один слот на поле и время начала; на него опирается ON CONFLICT в генерации расписания.
+        Index("uq_time_slots_field_start", "field_id", "start_time", unique=True),
+        Index("ix_time_slots_held_by", "held_by", postgresql_where=text("held_by IS NOT NULL")),
+        Index("ix_time_slots_available_start", "start_time", postgresql_where=text("status = 'available'")),
+        # Проверка внешнего ключа при удалении матча: без индекса — проход по всем партициям.
+        Index("ix_time_slots_match_id", "match_id", postgresql_where=text("match_id IS NOT NULL")),
+        {"postgresql_partition_by": "RANGE (start_time)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_primary_key(constraint, compiler, **kw):
+    """На SQLite партиций нет: ключ time_slots — один id, тогда он становится rowid
+    и нумеруется сам (в составном ключе SQLite id не выдаёт)."""
+    if constraint.table.name == TimeSlot.__tablename__:
+        return "PRIMARY KEY (id)"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+# Последовательность и default только для Postgres: SQLite последовательностей не знает.
+event.listen(TimeSlot.__table__, "before_create", DDL(
+    "CREATE SEQUENCE IF NOT EXISTS time_slots_id_seq"
+).execute_if(dialect="postgresql"))
+event.listen(TimeSlot.__table__, "after_create", DDL(
+    "ALTER TABLE time_slots ALTER COLUMN id SET DEFAULT nextval('time_slots_id_seq'); "
+    "ALTER SEQUENCE time_slots_id_seq OWNED BY time_slots.id"
+).execute_if(dialect="postgresql"))
+
+class PricingRule(Base):
+    """Правило цены слотов поля; пустые окна времени и дат означают «без ограничения»."""
+    __tablename__ = "pricing_rules"
+    ALL_WEEKDAYS = 0b1111111
+
+    id = Column(Integer, primary_key=True, index=True)
+    field_id = Column(Integer, ForeignKey("fields.id", ondelete="CASCADE"), nullable=False, index=True)
+    name = Column(String(255))
+    price = Column(Integer, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    weekday_mask = Column(Integer, nullable=False, default=ALL_WEEKDAYS)  # бит 0 — понедельник
+    start_time = Column(Time)
+    end_time = Column(Time)
+    start_date = Column(Date)
+    end_date = Column(Date)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    field = relationship("Field", back_populates="pricing_rules")
+
+    @property
+    def weekdays(self) -> list:
+        return [day for day in range(7) if self.weekday_mask >> day & 1]
+
+    @staticmethod
+    def mask_from_weekdays(weekdays) -> int:
+        mask = 0
+        for day in weekdays:
+            mask |= 1 << day
+        return mask
+
+class RatingState(Base):
+    """Единственная строка (id = 1): параметры сглаживания рейтингов и high-water mark
+    пересчёта по player_reviews (core/ratings.py)."""
+    __tablename__ = "rating_state"
+    id = Column(Integer, primary_key=True)
+    last_review_id = Column(Integer, nullable=False, default=0)
+    prior_weight = Column(Float, nullable=False)
+    skill_prior = Column(Float, nullable=False)
+    sportsmanship_prior = Column(Float, nullable=False)
+    recomputed_at = Column(DateTime)
+
+class ScheduleJob(Base):
+    """Фоновая генерация расписания заведения; единица работы — (поле, день)."""
+    __tablename__ = "schedule_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    venue_id = Column(Integer, ForeignKey("venue_profiles.id"), nullable=False, index=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(SQLAlchemyEnum(ScheduleJobStatus), default=ScheduleJobStatus.pending, nullable=False)
+    params = Column(JSON, nullable=False)
+    total_units = Column(Integer, nullable=False, default=0)
+    processed_units = Column(Integer, nullable=False, default=0)
+    created_slots = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = Column(DateTime)
+
+    @property
+    def progress(self) -> float:
+        return round(self.processed_units / self.total_units, 4) if self.total_units else 1.0
+
+    __table_args__ = (
+        Index(
+            "ix_schedule_jobs_unfinished", "updated_at",
+            postgresql_where=text("status IN ('pending', 'running')"),
+        ),
+    )
 
 class PlayerReview(Base):
     __tablename__ = "player_reviews"
@@ -132,4 +347,13 @@ class PlayerReview(Base):
     rating = Column(Integer, nullable=False)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     reviewer = relationship("User", back_populates="reviews_given", foreign_keys=[reviewer_id])
-    subject = relationship("User", back_populates="reviews_received", foreign_keys=[subject_id])
\ No newline at end of file
+    subject = relationship("User", back_populates="reviews_received", foreign_keys=[subject_id])
+
+    __table_args__ = (
+        # Один отзыв каждого типа от автора об игроке за матч; повтор отбрасывает ON CONFLICT.
+        UniqueConstraint(
+            "match_id", "reviewer_id", "subject_id", "review_type",
+            name="uq_player_reviews_match_reviewer_subject_type",
+        ),
+        Index("ix_player_reviews_subject_id", "subject_id"),
+    )
\ No newline at end of file
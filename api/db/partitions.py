@@ -0,0 +1,180 @@
+"""Помесячные партиции time_slots (PARTITION BY RANGE (start_time)), только Postgres.
+
+Партиция месяца называется time_slots_yYYYYmMM. Строки вне месячных партиций
+(в том числе сохранённые забронированные слоты из архивированных месяцев)
+попадают в time_slots_default.
+
+Удержание: партиции старше срока отсоединяются (DETACH), забронированные слоты и слоты,
+на которые ссылается matches.slot_id, возвращаются в time_slots (в default-партицию),
+а остаток партиции переносится в схему archive (или удаляется).
+"""
+import logging
+import re
+from datetime import date
+from typing import Iterable, List, Optional, Set
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+PARENT = "time_slots"
+DEFAULT_PARTITION = "time_slots_default"
+ARCHIVE_SCHEMA = "archive"
+PARTITION_LOCK_TIMEOUT = "2s"
+# Слоты, которые удержание сохраняет: забронированные и те, на которые ссылается матч.
+# Прошедшие свободные слоты lifecycle переводит в unavailable — они уходят в архив.
+RETAINED_SLOTS = "status = 'booked' OR id IN (SELECT slot_id FROM matches WHERE slot_id IS NOT NULL)"
+_NAME = re.compile(r"^time_slots_y(\d{4})m(\d{2})$")
+
+# Месяцы, партиции которых уже точно есть: повторная проверка не ходит в БД.
+_known_months: Set[date] = set()
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def months_between(start: date, end: date) -> List[date]:
+    """Первые числа всех месяцев, задетых диапазоном [start, end]."""
+    months, current, last = [], month_start(start), month_start(end)
+    while current <= last:
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = _NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:parent))"
+    ), {"parent": PARENT}).scalar())
+
+
+def list_partitions(connection: Connection) -> List[str]:
+    return list(connection.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:parent) ORDER BY c.relname
+    """), {"parent": PARENT}).scalars())
+
+
+def create_partition(connection: Connection, month: date) -> bool:
+    """Создаёт партицию месяца, если её нет. True — партиция создана сейчас."""
+    name = partition_name(month)
+    # Проверка через to_regclass не берёт блокировок: CREATE ... PARTITION OF берёт
+    # ACCESS EXCLUSIVE на родителя, поэтому выполняем его только когда партиции нет.
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+    return True
+
+
+def default_has_rows(connection: Connection, month: date) -> bool:
+    """Есть ли в default-партиции строки месяца: тогда CREATE ... PARTITION OF не пройдёт."""
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar() is None:
+        return False
+    return bool(connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE start_time >= :start AND start_time < :end)"
+    ), {"start": month, "end": add_months(month, 1)}).scalar())
+
+
+def attach_from_default(connection: Connection, month: date) -> int:
+    """Создаёт партицию месяца из строк, осевших в default-партиции: переносит их в новую
+    таблицу и присоединяет её (ATTACH). Возвращает число перенесённых строк."""
+    name, start, end = partition_name(month), month.isoformat(), add_months(month, 1).isoformat()
+    # Пока строки переносятся, новые слоты месяца не должны снова лечь в default:
+    # иначе ATTACH найдёт их там и откажет.
+    connection.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = connection.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE start_time >= '{start}' AND start_time < '{end}' RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """)).rowcount
+    # CHECK с границами избавляет ATTACH от проверочного прохода по таблице под блокировкой.
+    connection.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK (start_time >= '{start}' AND start_time < '{end}')"
+    ))
+    connection.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    connection.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+    return moved
+
+
+def ensure_partitions(engine: Engine, months: Iterable[date]) -> List[date]:
+    """Создаёт недостающие партиции в отдельной короткой транзакции, чтобы блокировка
+    родителя не держалась до конца вызывающей транзакции. Строки месяца, уже лежащие
+    в default-партиции, переносятся в новую партицию. Возвращает созданные месяцы."""
+    missing = sorted(set(months) - _known_months)
+    if not missing or engine.dialect.name != "postgresql":
+        return []
+    created = []
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            return []
+        # Не ждём долгих транзакций над time_slots: пока CREATE ждёт блокировку, в очереди
+        # за ним стоят все запросы к таблице. Не дождались — слоты лягут в default-партицию.
+        connection.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+        for month in missing:
+            try:
+                with connection.begin_nested():
+                    exists = connection.execute(
+                        text("SELECT to_regclass(:name)"), {"name": partition_name(month)}
+                    ).scalar() is not None
+                    if not exists and default_has_rows(connection, month):
+                        moved = attach_from_default(connection, month)
+                        logger.info("partition %s attached with %d rows moved from %s",
+                                    partition_name(month), moved, DEFAULT_PARTITION)
+                        created.append(month)
+                    elif create_partition(connection, month):
+                        created.append(month)
+                _known_months.add(month)
+            except DBAPIError as exc:
+                # Обычно таймаут блокировки: слоты месяца пока лягут в default-партицию,
+                # следующий вызов перенесёт их в партицию месяца.
+                logger.warning("could not create partition %s: %s", partition_name(month), exc.orig)
+    return created
+
+
+def archive_partition(connection: Connection, month: date, drop: bool = False) -> dict:
+    """Отсоединяет партицию месяца: нужные слоты возвращает в time_slots, остальное
+    переносит в схему archive (drop=True — удаляет). Выполняется в транзакции connection."""
+    name = partition_name(month)
+    connection.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+    kept = connection.execute(text(
+        f"INSERT INTO {PARENT} SELECT * FROM {name} WHERE {RETAINED_SLOTS}"
+    )).rowcount
+    connection.execute(text(f"DELETE FROM {name} WHERE {RETAINED_SLOTS}"))
+    archived = connection.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+    # Пустую партицию архивировать незачем — просто удаляем.
+    drop = drop or not archived
+    if drop:
+        connection.execute(text(f"DROP TABLE {name}"))
+    else:
+        # Внешние ключи архиву не нужны и мешали бы удалять поля и матчи.
+        for constraint in connection.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:name) AND contype = 'f'"
+        ), {"name": name}).scalars().all():
+            connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+        connection.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+    _known_months.discard(month)
+    return {"partition": name, "kept": kept, "archived": archived, "dropped": drop}
@@ -1,26 +1,77 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from sqlalchemy import Date, Time, cast, func, literal, select, text, tuple_, union_all, update
+from sqlalchemy.exc import IntegrityError
 from datetime import date, time, timedelta, datetime
-from . import models, schemas
-from core.security import hash_password
+from time import perf_counter
+from typing import List, Optional, Tuple
+from . import models, partitions, schemas
+from core.security import invalidate_principal_on_commit
+from core.password_pool import password_pool
+from core.response_cache import response_cache
+from core.pricing import pricing_engine
+from core.geo import geo_index
+from core.text_search import text_search_index
+from core.leaderboard import leaderboard_index
+from core.recommendations import co_players_cache, roster_index
+from core.uploads import UPLOAD_COLUMNS, upload_store
+from core import geo, leaderboard, ratings, realtime, recommendations, text_search
+import base64
+import binascii
 import uuid
+import numpy as np
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = hash_password(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = password_pool.hash(user.password)
     db_user = models.User(email=user.email, pass_hash=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def invalidate_user_matches_on_commit(db: Session, user_ids) -> None:
+    """Профиль пользователя входит в закэшированные детали каждого его активного матча,
+    а профиль капитана — ещё и в ленту и поиск (тег matches)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    match, player = models.Match, models.MatchPlayer
+    captained = select(match.id, literal(True)).where(
+        match.status == models.MatchStatus.active, match.captain_id.in_(user_ids)
+    )
+    played = select(player.match_id, literal(False)).join(match, match.id == player.match_id).where(
+        match.status == models.MatchStatus.active, player.user_id.in_(user_ids)
+    )
+    rows = db.execute(union_all(captained, played)).all()
+    tags = dict.fromkeys(f"match:{match_id}" for match_id, _ in rows)
+    if any(is_captain for _, is_captain in rows):
+        tags["matches"] = None
+    if tags:
+        response_cache.invalidate_on_commit(db, *tags)
+
 def update_user(db: Session, db_user: models.User, user_update: schemas.UserUpdate):
     update_data = user_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_user, key, value)
     db.add(db_user)
+    invalidate_principal_on_commit(db, db_user.email)
+    invalidate_user_matches_on_commit(db, [db_user.id])
+    if "position" in update_data or "level" in update_data:
+        leaderboard_index.invalidate_on_commit(db, [db_user.id])
+        roster_index.invalidate_on_commit(db, user_ids=[db_user.id])
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+def set_user_upload(db: Session, db_user: models.User, kind: str, url: str):
+    """Ссылка на загруженный файл; прежний файл уберёт уборка файлов без ссылок."""
+    setattr(db_user, UPLOAD_COLUMNS[kind], url)
+    db.add(db_user)
+    invalidate_principal_on_commit(db, db_user.email)
+    invalidate_user_matches_on_commit(db, [db_user.id])
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -28,7 +79,7 @@ def update_user(db: Session, db_user: models.User, user_update: schemas.UserUpda
 def get_or_create_oauth_user(db: Session, user_info: dict):
     user = db.query(models.User).filter(models.User.email == user_info['email']).first()
     if not user:
-        random_password = hash_password(str(uuid.uuid4()))
+        random_password = password_pool.hash(str(uuid.uuid4()))
         user = models.User(
             email=user_info['email'],
             full_name=user_info.get('name'),
@@ -45,12 +96,93 @@ def get_venue(db: Session, venue_id: int):
 
 def get_venues(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.VenueProfile).options(joinedload(models.VenueProfile.fields)).offset(skip).limit(limit).all()
+
+# Заведения по совпадению в самом заведении или в его полях: префиксный tsquery по
+# search_vector или похожесть по триграммам (pg_trgm) по search_text — для опечаток.
+VENUE_SEARCH_SQL = text("""
+WITH q AS (SELECT to_tsquery('simple', :tsquery) AS query),
+hits AS (
+    SELECT v.id AS venue_id, NULL::integer AS field_id,
+           ts_rank(v.search_vector, q.query) + word_similarity(:phrase, v.search_text) AS score
+    FROM venue_profiles v, q
+    WHERE v.search_vector @@ q.query OR :phrase <% v.search_text
+    UNION ALL
+    SELECT f.venue_id, f.id,
+           (ts_rank(f.search_vector, q.query) + word_similarity(:phrase, f.search_text)) * :field_factor
+    FROM fields f, q
+    WHERE f.search_vector @@ q.query OR :phrase <% f.search_text
+)
+SELECT venue_id, max(score) AS score,
+       coalesce(array_agg(field_id ORDER BY field_id) FILTER (WHERE field_id IS NOT NULL), '{}') AS field_ids
+FROM hits
+GROUP BY venue_id
+ORDER BY score DESC, venue_id
+LIMIT :limit
+""")
+
+def text_search_venue_rows_query(venue_ids: Optional[list] = None):
+    venue = models.VenueProfile
+    stmt = select(venue.id, venue.title, venue.description)
+    return stmt.where(venue.id.in_(venue_ids)) if venue_ids is not None else stmt
+
+def text_search_field_rows_query(field_ids: Optional[list] = None):
+    field = models.Field
+    stmt = select(field.id, field.venue_id, field.sport, field.address, field.amenities, field.description)
+    return stmt.where(field.id.in_(field_ids)) if field_ids is not None else stmt
+
+def refresh_text_search_index(db: Session) -> None:
+    full, venue_ids, field_ids = text_search_index.pending()
+    if full:
+        text_search_index.load(
+            db.execute(text_search_venue_rows_query()).all(), db.execute(text_search_field_rows_query()).all()
+        )
+    elif venue_ids or field_ids:
+        text_search_index.refresh(
+            venue_ids, field_ids,
+            db.execute(text_search_venue_rows_query(venue_ids)).all() if venue_ids else [],
+            db.execute(text_search_field_rows_query(field_ids)).all() if field_ids else [],
+        )
+
+def _venue_search_hits(db: Session, query: str, limit: int) -> List[Tuple[int, float, List[int]]]:
+    words = text_search.terms(query)
+    if not words:
+        return []
+    if not text_search_index.use_postgres(db.connection()):
+        refresh_text_search_index(db)
+        return text_search_index.search(query, limit)
+    db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"), {
+        "threshold": str(text_search_index.similarity_threshold),
+    })
+    rows = db.execute(VENUE_SEARCH_SQL, {
+        "tsquery": text_search.prefix_tsquery(words), "phrase": " ".join(words),
+        "field_factor": text_search.FIELD_FACTOR, "limit": limit,
+    }).all()
+    return [(row.venue_id, round(float(row.score), 4), list(row.field_ids)) for row in rows]
+
+def search_venues(db: Session, query: str, limit: int = 20) -> list:
+    """Заведения по убыванию релевантности; у каждого score и matched_field_ids."""
+    hits = _venue_search_hits(db, query, limit)
+    venues = {
+        venue.id: venue for venue in db.query(models.VenueProfile).options(joinedload(models.VenueProfile.fields))
+        .filter(models.VenueProfile.id.in_([venue_id for venue_id, _, _ in hits])).all()
+    }
+    ordered = []
+    for venue_id, score, field_ids in hits:
+        venue = venues.get(venue_id)
+        if venue is not None:
+            venue.score, venue.matched_field_ids = score, field_ids
+            ordered.append(venue)
+    return ordered
     
 def create_venue_profile(db: Session, owner: models.User, venue: schemas.VenueProfileCreate):
     owner.role = models.UserRole.venue
     db.add(owner)
     db_venue = models.VenueProfile(**venue.model_dump(), owner_id=owner.id)
     db.add(db_venue)
+    db.flush()
+    text_search_index.invalidate_on_commit(db, "venue", db_venue.id)
+    response_cache.invalidate_on_commit(db, "venues")
+    invalidate_principal_on_commit(db, owner.email)
     db.commit()
     db.refresh(db_venue)
     return db_venue
@@ -60,6 +192,8 @@ def update_venue_profile(db: Session, db_venue: models.VenueProfile, venue_updat
     for key, value in update_data.items():
         setattr(db_venue, key, value)
     db.add(db_venue)
+    text_search_index.invalidate_on_commit(db, "venue", db_venue.id)
+    response_cache.invalidate_on_commit(db, "venues")
     db.commit()
     db.refresh(db_venue)
     return db_venue
@@ -70,9 +204,80 @@ def get_field_by_id(db: Session, field_id: int):
 def get_all_fields(db: Session):
     return db.query(models.Field).all()
 
+def geo_points_query(field_ids: Optional[list] = None):
+    stmt = select(models.Field.id, models.Field.latitude, models.Field.longitude)\
+        .where(models.Field.latitude.is_not(None), models.Field.longitude.is_not(None))
+    if field_ids is not None:
+        stmt = stmt.where(models.Field.id.in_(field_ids))
+    return stmt
+
+def geo_bbox_query(lat: float, lon: float, radius_km: float):
+    """Кандидаты из прямоугольника вокруг круга (по ix_fields_lat_lon); точный радиус — geo.rank."""
+    min_lat, max_lat, min_lon, max_lon = geo.bounding_box(lat, lon, radius_km)
+    return geo_points_query().where(
+        models.Field.latitude.between(min_lat, max_lat), models.Field.longitude.between(min_lon, max_lon)
+    )
+
+def refresh_geo_index(db: Session) -> None:
+    full, dirty = geo_index.pending()
+    if full:
+        geo_index.load(db.execute(geo_points_query()).all())
+    elif dirty:
+        geo_index.refresh(dirty, db.execute(geo_points_query(dirty)).all())
+
+def nearby_field_ids(db: Session, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+    """[(field_id, км)] от ближних к дальним: по индексу в памяти, без него — bounding box в БД."""
+    if geo_index.enabled:
+        refresh_geo_index(db)
+        return geo_index.search(lat, lon, radius_km, limit)
+    return geo.rank(db.execute(geo_bbox_query(lat, lon, radius_km)).all(), lat, lon, radius_km, limit)
+
+def order_by_distance(fields: list, nearby: List[Tuple[int, float]]) -> list:
+    by_id = {field.id: field for field in fields}
+    ordered = []
+    for field_id, distance in nearby:
+        field = by_id.get(field_id)
+        if field is not None:
+            field.distance_km = round(distance, 3)
+            ordered.append(field)
+    return ordered
+
+def get_fields_near(db: Session, lat: float, lon: float, radius_km: float, limit: int):
+    nearby = nearby_field_ids(db, lat, lon, radius_km, limit)
+    fields = db.query(models.Field).filter(models.Field.id.in_([field_id for field_id, _ in nearby])).all()
+    return order_by_distance(fields, nearby)
+
+def set_field_coordinates(db: Session, coordinates: List[Tuple[int, float, float]]) -> int:
+    """Массовая запись координат (field_id, широта, долгота) одним executemany по PK."""
+    existing = set(db.scalars(select(models.Field.id).where(models.Field.id.in_([row[0] for row in coordinates]))))
+    values = [
+        {"id": field_id, "latitude": lat, "longitude": lon}
+        for field_id, lat, lon in coordinates if field_id in existing
+    ]
+    if not values:
+        return 0
+    db.execute(update(models.Field), values)
+    for row in values:
+        geo_index.invalidate_on_commit(db, row["id"])
+    response_cache.invalidate_on_commit(db, "fields", "venues")
+    db.commit()
+    return len(values)
+
+def field_ids_by_address(db: Session, addresses) -> dict:
+    found = {}
+    for field_id, address in db.execute(
+        select(models.Field.id, models.Field.address).where(models.Field.address.in_(set(addresses)))
+    ):
+        found.setdefault(address, []).append(field_id)
+    return found
+
 def create_field_for_venue(db: Session, venue_id: int, field: schemas.FieldCreate):
     db_field = models.Field(**field.model_dump(), venue_id=venue_id)
     db.add(db_field)
+    db.flush()
+    geo_index.invalidate_on_commit(db, db_field.id)
+    text_search_index.invalidate_on_commit(db, "field", db_field.id)
+    response_cache.invalidate_on_commit(db, "fields", "venues")
     db.commit()
     db.refresh(db_field)
     return db_field
@@ -82,104 +287,561 @@ def update_field(db: Session, db_field: models.Field, field_update: schemas.Fiel
     for key, value in update_data.items():
         setattr(db_field, key, value)
     db.add(db_field)
+    if update_data.keys() & {"latitude", "longitude"}:
+        geo_index.invalidate_on_commit(db, db_field.id)
+    text_search_index.invalidate_on_commit(db, "field", db_field.id)
+    response_cache.invalidate_on_commit(db, "fields", "venues")
     db.commit()
     db.refresh(db_field)
     return db_field
 
+def slot_free_for(user_id: int):
+    """Слот можно занять: он available и не удерживается другим пользователем."""
+    slot = models.TimeSlot
+    return (slot.status == models.TimeSlotStatus.available) & (
+        slot.held_until.is_(None) | (slot.held_until < func.now()) | (slot.held_by == user_id)
+    )
+
+def book_slot_stmt(slot_id: int, user_id: int):
+    """Условное занятие слота: ровно одна из конкурентных транзакций получит строку."""
+    slot = models.TimeSlot
+    return update(slot).where(slot.id == slot_id, slot_free_for(user_id))\
+        .values(status=models.TimeSlotStatus.booked, held_by=None, held_until=None)\
+        .returning(slot.field_id, slot.start_time)\
+        .execution_options(synchronize_session=False)
+
+def _slot_failure(db: Session, slot_id: int) -> str:
+    exists = db.execute(select(models.TimeSlot.id).filter(models.TimeSlot.id == slot_id)).first()
+    db.rollback()
+    return "slot_not_available" if exists else "slot_not_found"
+
 def create_match(db: Session, captain: models.User, match_data: schemas.MatchCreate):
-    slot = db.query(models.TimeSlot).filter(models.TimeSlot.id == match_data.slot_id).first()
-    if not slot: return "slot_not_found"
-    if slot.status != models.TimeSlotStatus.available: return "slot_not_available"
+    """Слот, матч и капитан в составе — одна транзакция и один COMMIT."""
+    booked = db.execute(book_slot_stmt(match_data.slot_id, captain.id)).first()
+    if booked is None:
+        return _slot_failure(db, match_data.slot_id)
     db_match = models.Match(
         title=match_data.title, max_players=match_data.max_players,
         waitlist_enabled=match_data.waitlist_enabled, is_private=match_data.is_private,
-        captain_id=captain.id, slot_id=slot.id, field_id=slot.field_id, starts_at=slot.start_time
+        captain_id=captain.id, slot_id=match_data.slot_id, field_id=booked.field_id, starts_at=booked.start_time,
+        confirmed_count=1, players=[models.MatchPlayer(user_id=captain.id)]
     )
     db.add(db_match)
-    db.commit()
-    slot.status = models.TimeSlotStatus.booked
-    slot.match_id = db_match.id
-    db.add(slot)
-    db_match_player = models.MatchPlayer(match_id=db_match.id, user_id=captain.id)
-    db.add(db_match_player)
+    try:
+        db.flush()
+    except IntegrityError:
+        # matches.slot_id уникален: слот уже числится за другим матчем.
+        db.rollback()
+        return "slot_not_available"
+    db.execute(
+        update(models.TimeSlot)
+        .where(models.TimeSlot.id == match_data.slot_id, models.TimeSlot.start_time == booked.start_time)
+        .values(match_id=db_match.id)
+        .execution_options(synchronize_session=False)
+    )
+    response_cache.invalidate_on_commit(db, "matches", f"match:{db_match.id}", f"slots:{booked.field_id}")
+    roster_index.invalidate_on_commit(db, [db_match.id])
     db.commit()
     db.refresh(db_match)
     return db_match
 
-def get_active_matches(db: Session, skip: int = 0, limit: int = 100):
-    player_count_subquery = db.query(
-        models.MatchPlayer.match_id, func.count(models.MatchPlayer.id).label("players_count")
-    ).group_by(models.MatchPlayer.match_id).subquery()
-    matches_query = db.query(models.Match, player_count_subquery.c.players_count)\
-        .outerjoin(player_count_subquery, models.Match.id == player_count_subquery.c.match_id)\
+def hold_slot(db: Session, slot_id: int, user: models.User, ttl_seconds: int):
+    """Удерживает слот за пользователем на ttl_seconds; прежнее удержание пользователя снимается.
+    Удержание видно в списке слотов (held_until), поэтому кэш слотов полей сбрасывается."""
+    slot = models.TimeSlot
+    released = db.execute(
+        update(slot).where(slot.held_by == user.id, slot.id != slot_id)
+        .values(held_by=None, held_until=None).returning(slot.field_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    held = db.execute(
+        update(slot).where(slot.id == slot_id, slot_free_for(user.id))
+        .values(held_by=user.id, held_until=func.now() + timedelta(seconds=ttl_seconds))
+        .returning(slot.id, slot.field_id, slot.held_until)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if held is None:
+        return _slot_failure(db, slot_id)
+    response_cache.invalidate_on_commit(db, *{f"slots:{field_id}" for field_id in [*released, held.field_id]})
+    db.commit()
+    return held
+
+def release_slot_hold(db: Session, slot_id: int, user: models.User) -> bool:
+    slot = models.TimeSlot
+    released = db.execute(
+        update(slot).where(slot.id == slot_id, slot.held_by == user.id)
+        .values(held_by=None, held_until=None).returning(slot.field_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    response_cache.invalidate_on_commit(db, *(f"slots:{field_id}" for field_id in set(released)))
+    db.commit()
+    return bool(released)
+
+def encode_match_cursor(match: models.Match) -> str:
+    raw = f"{match.starts_at.isoformat()}|{match.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_match_cursor(cursor: str):
+    """Возвращает (starts_at, id) из непрозрачного курсора; ValueError, если курсор испорчен."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        starts_at, match_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(starts_at), int(match_id)
+    except (UnicodeDecodeError, binascii.Error, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+
+def active_matches_query(after: Optional[tuple] = None):
+    """Публичная лента по индексу ix_matches_feed: (starts_at, id) строго после курсора."""
+    stmt = select(models.Match)\
         .options(joinedload(models.Match.captain), joinedload(models.Match.field))\
         .filter(models.Match.status == models.MatchStatus.active)\
         .filter(models.Match.is_private == False)\
-        .order_by(models.Match.starts_at.asc())
-    matches = matches_query.offset(skip).limit(limit).all()
-    result = []
-    for match, count in matches:
-        match.players_count = count if count is not None else 0
-        result.append(match)
-    return result
+        .order_by(models.Match.starts_at.asc(), models.Match.id.asc())
+    if after is not None:
+        stmt = stmt.filter(tuple_(models.Match.starts_at, models.Match.id) > tuple_(*after))
+    return stmt
+
+def get_active_matches(db: Session, skip: int = 0, limit: int = 100, after: Optional[tuple] = None):
+    stmt = active_matches_query(after)
+    if after is None and skip:
+        stmt = stmt.offset(skip)
+    return db.execute(stmt.limit(limit)).scalars().all()
+
+def _match_search_conditions(params: schemas.MatchSearchParams, with_sport: bool = True,
+                             near_field_ids: Optional[list] = None) -> list:
+    """Условия поиска по matches. Фильтры по полю (вид спорта, заведение, цена, near) сводятся
+    к field_id IN (...), чтобы работал индекс ix_matches_search (field_id, starts_at)."""
+    match = models.Match
+    conditions = [match.status == models.MatchStatus.active, match.is_private == False]
+    if near_field_ids is not None:
+        conditions.append(match.field_id.in_(near_field_ids))
+    field_filters = []
+    if with_sport and params.sports:
+        field_filters.append(models.Field.sport.in_(params.sports))
+    if params.venue_id is not None:
+        field_filters.append(models.Field.venue_id == params.venue_id)
+    if params.price_min is not None:
+        field_filters.append(models.Field.price_per_hour >= params.price_min)
+    if params.price_max is not None:
+        field_filters.append(models.Field.price_per_hour <= params.price_max)
+    if field_filters:
+        conditions.append(match.field_id.in_(select(models.Field.id).where(*field_filters)))
+    if params.date_from is not None:
+        conditions.append(match.starts_at >= datetime.combine(params.date_from, time.min))
+    if params.date_to is not None:
+        conditions.append(match.starts_at < datetime.combine(params.date_to + timedelta(days=1), time.min))
+    if params.time_from is not None:
+        conditions.append(cast(match.starts_at, Time) >= params.time_from)
+    if params.time_to is not None:
+        conditions.append(cast(match.starts_at, Time) <= params.time_to)
+    if params.min_free_spots is not None:
+        conditions.append(match.max_players - match.confirmed_count >= params.min_free_spots)
+    if params.waitlist is not None:
+        conditions.append(match.waitlist_enabled == params.waitlist)
+    return conditions
+
+def match_search_statements(params: schemas.MatchSearchParams, limit: int, after: Optional[tuple] = None,
+                            near_field_ids: Optional[list] = None):
+    """(страница матчей, счётчики (вид спорта, день)). Оба фасета считаются одним проходом
+    без фильтра по виду спорта: по дням он применяется уже к сгруппированным строкам.
+    Группировка по (field_id, день) идёт до соединения с fields — по index-only scan."""
+    items = active_matches_query(after).filter(*_match_search_conditions(params, near_field_ids=near_field_ids)).limit(limit)
+    day_column = cast(models.Match.starts_at, Date)
+    per_field = select(models.Match.field_id, day_column.label("day"), func.count().label("matches"))\
+        .where(*_match_search_conditions(params, with_sport=False, near_field_ids=near_field_ids))\
+        .group_by(models.Match.field_id, day_column).subquery()
+    facets = select(models.Field.sport, per_field.c.day, func.sum(per_field.c.matches))\
+        .join(per_field, per_field.c.field_id == models.Field.id)\
+        .group_by(models.Field.sport, per_field.c.day)
+    return items, facets
+
+def match_search_page(params: schemas.MatchSearchParams, items, facet_rows, limit: int) -> schemas.MatchSearchPage:
+    sport_counts, day_counts = {}, {}
+    for sport, day, count in facet_rows:
+        count = int(count)
+        sport_counts[sport] = sport_counts.get(sport, 0) + count
+        if not params.sports or sport in params.sports:
+            day_counts[day.isoformat()] = day_counts.get(day.isoformat(), 0) + count
+    return schemas.MatchSearchPage(
+        items=items,
+        next_cursor=encode_match_cursor(items[-1]) if len(items) == limit else None,
+        total=sum(day_counts.values()),
+        facets=schemas.MatchSearchFacets(sport=dict(sorted(sport_counts.items())), day=dict(sorted(day_counts.items()))),
+    )
+
+def search_matches(db: Session, params: schemas.MatchSearchParams, limit: int = 50, after: Optional[tuple] = None):
+    near_field_ids = None
+    if params.near is not None:
+        near_field_ids = [field_id for field_id, _ in nearby_field_ids(db, *params.near, params.radius_km)]
+    items, facets = match_search_statements(params, limit, after, near_field_ids)
+    return match_search_page(params, db.execute(items).scalars().all(), db.execute(facets).all(), limit)
 
 def get_match_by_id(db: Session, match_id: int):
-    match = db.query(models.Match)\
+    return db.query(models.Match)\
         .options(
             joinedload(models.Match.captain), joinedload(models.Match.field),
             joinedload(models.Match.players).joinedload(models.MatchPlayer.user)
         ).filter(models.Match.id == match_id).first()
-    if match:
-        match.players_count = len(match.players)
+
+def get_match_row(db: Session, match_id: int):
+    """Только строка matches по PK, без связей: для проверок прав перед записью."""
+    return db.get(models.Match, match_id)
+
+_USER_JSON = """json_build_object(
+    'id', u.id, 'email', u.email, 'role', u.role, 'full_name', u.full_name,
+    'photo_url', u.photo_url, 'level', u.level, 'position', u.position,
+    'achievements_doc', u.achievements_doc, 'sportsmanship_rating', u.sportsmanship_rating,
+    'skill_rating', u.skill_rating, 'sportsmanship_score', u.sportsmanship_score,
+    'skill_score', u.skill_score, 'sportsmanship_reviews_count', u.sportsmanship_reviews_count,
+    'skill_reviews_count', u.skill_reviews_count, 'no_show_count', u.no_show_count
+)"""
+
+# Весь MatchDetailsPublic одним запросом: Postgres сам собирает JSON, ORM и Pydantic не участвуют.
+MATCH_DETAILS_JSON_SQL = text(f"""
+SELECT json_build_object(
+    'id', m.id, 'title', m.title, 'starts_at', m.starts_at, 'max_players', m.max_players,
+    'status', m.status, 'waitlist_enabled', m.waitlist_enabled,
+    'is_private', coalesce(m.is_private, false), 'invite_code', m.invite_code,
+    'players_count', m.confirmed_count,
+    'captain', (SELECT {_USER_JSON} FROM users u WHERE u.id = m.captain_id),
+    'field', (
+        SELECT json_build_object(
+            'id', f.id, 'sport', f.sport, 'address', f.address, 'price_per_hour', f.price_per_hour,
+            'description', f.description, 'amenities', f.amenities,
+            'latitude', f.latitude, 'longitude', f.longitude, 'venue_id', f.venue_id
+        ) FROM fields f WHERE f.id = m.field_id
+    ),
+    'players', coalesce((
+        SELECT json_agg({_USER_JSON} ORDER BY mp.joined_at, mp.id)
+        FROM match_players mp JOIN users u ON u.id = mp.user_id
+        WHERE mp.match_id = m.id AND mp.status IN ('confirmed', 'noshow')
+    ), '[]'::json),
+    'waitlist', coalesce((
+        SELECT json_agg({_USER_JSON} ORDER BY mp.joined_at, mp.id)
+        FROM match_players mp JOIN users u ON u.id = mp.user_id
+        WHERE mp.match_id = m.id AND mp.status = 'waitlist'
+    ), '[]'::json)
+)::text
+FROM matches m
+WHERE m.id = :match_id
+""")
+
+def match_details_from_orm(match: models.Match) -> str:
+    """Та же форма ответа через ORM — для диалектов без json_build_object (SQLite)."""
+    roster = sorted(match.players, key=lambda mp: (mp.joined_at, mp.id))
+    details = schemas.MatchDetailsPublic.model_validate(match).model_copy(update={
+        "players": [schemas.UserBase.model_validate(mp.user) for mp in roster if mp.status != models.MatchPlayerStatus.waitlist],
+        "waitlist": [schemas.UserBase.model_validate(mp.user) for mp in roster if mp.status == models.MatchPlayerStatus.waitlist],
+    })
+    return details.model_dump_json()
+
+def get_match_details_json(db: Session, match_id: int) -> Optional[str]:
+    if db.get_bind().dialect.name == "postgresql":
+        return db.execute(MATCH_DETAILS_JSON_SQL, {"match_id": match_id}).scalar()
+    match = get_match_by_id(db, match_id)
+    return match_details_from_orm(match) if match else None
+
+def player_joined_event(user: models.User, status: models.MatchPlayerStatus) -> dict:
+    return {
+        "type": "player_joined",
+        "status": status.value,
+        "user": schemas.PlayerPublic.model_validate(user).model_dump(mode="json"),
+    }
+
+def player_left_event(user_id: int, promoted_user_id: Optional[int]) -> dict:
+    """promoted_user_id — игрок, переведённый из листа ожидания на освободившееся место."""
+    return {"type": "player_left", "user_id": user_id, "promoted_user_id": promoted_user_id}
+
+# Вступление одним запросом: строка матча блокируется (FOR UPDATE перечитывает свежие
+# счётчики после ожидания), решение confirmed/waitlist, вставка с ON CONFLICT по
+# uq_match_players_match_user и сдвиг счётчика — всё в одном операторе.
+JOIN_MATCH_SQL = text("""
+WITH m AS (
+    SELECT id, confirmed_count, max_players, waitlist_enabled
+    FROM matches WHERE id = :match_id
+    FOR UPDATE
+), decision AS (
+    SELECT id, CASE
+        WHEN confirmed_count < max_players THEN 'confirmed'
+        WHEN waitlist_enabled THEN 'waitlist'
+    END AS status
+    FROM m
+), ins AS (
+    INSERT INTO match_players (match_id, user_id, status, joined_at)
+    SELECT id, :user_id, CAST(status AS matchplayerstatus), now() FROM decision WHERE status IS NOT NULL
+    ON CONFLICT (match_id, user_id) DO NOTHING
+    RETURNING status
+), counters AS (
+    UPDATE matches SET
+        confirmed_count = confirmed_count + (SELECT count(*) FROM ins WHERE status = 'confirmed'),
+        waitlist_count = waitlist_count + (SELECT count(*) FROM ins WHERE status = 'waitlist')
+    WHERE id = :match_id AND EXISTS (SELECT 1 FROM ins)
+)
+SELECT
+    (SELECT CAST(status AS text) FROM ins) AS status,
+    (SELECT status FROM decision) AS decided,
+    EXISTS (SELECT 1 FROM match_players WHERE match_id = :match_id AND user_id = :user_id) AS joined_before
+""")
+
+# Строка матча блокируется отдельным оператором до выхода. Внутри одного WITH блокировка
+# не помогла бы: выборка листа ожидания идёт по снимку начала оператора и не увидела бы
+# игрока, которого параллельное вступление только что записало в лист ожидания, — место
+# осталось бы свободным при непустом листе. Следующий оператор после блокировки берёт новый
+# снимок, а вступления и выходы одного матча идут строго по очереди.
+LOCK_MATCH_SQL = text("SELECT id FROM matches WHERE id = :match_id FOR UPDATE")
+
+# Выход одним запросом (после LOCK_MATCH_SQL): удаление, перевод первого из листа
+# ожидания на освободившееся место и счётчики.
+LEAVE_MATCH_SQL = text("""
+WITH gone AS (
+    DELETE FROM match_players WHERE match_id = :match_id AND user_id = :user_id
+    RETURNING status
+), next_in_line AS (
+    SELECT mp.id, mp.user_id
+    FROM match_players mp JOIN matches m ON m.id = mp.match_id
+    WHERE mp.match_id = :match_id AND mp.status = 'waitlist' AND m.waitlist_enabled
+      AND EXISTS (SELECT 1 FROM gone WHERE status = 'confirmed')
+    ORDER BY mp.joined_at, mp.id
+    LIMIT 1
+), promoted AS (
+    UPDATE match_players mp SET status = 'confirmed'
+    FROM next_in_line WHERE mp.id = next_in_line.id
+    RETURNING mp.user_id
+), counters AS (
+    UPDATE matches SET
+        confirmed_count = confirmed_count
+            - (SELECT count(*) FROM gone WHERE status = 'confirmed') + (SELECT count(*) FROM promoted),
+        waitlist_count = waitlist_count
+            - (SELECT count(*) FROM gone WHERE status = 'waitlist') - (SELECT count(*) FROM promoted)
+    WHERE id = :match_id AND EXISTS (SELECT 1 FROM gone)
+)
+SELECT (SELECT CAST(status AS text) FROM gone) AS status, (SELECT user_id FROM promoted) AS promoted_user_id
+""")
+
+def join_outcome(db, user: models.User, match: models.Match, row) -> Optional[models.Match]:
+    """Разбирает строку JOIN_MATCH_SQL: None — мест нет и лист ожидания выключен.
+    Для нового участника ставит инвалидацию и событие комнаты на COMMIT."""
+    if row.status is None:
+        # Уже в матче (в том числе параллельный повторный запрос того же игрока).
+        return match if row.joined_before or row.decided else None
+    response_cache.invalidate_on_commit(db, "matches", f"match:{match.id}")
+    roster_index.invalidate_on_commit(db, [match.id])
+    realtime.publish_on_commit(db, match.id, player_joined_event(user, models.MatchPlayerStatus(row.status)))
     return match
 
-def add_player_to_match(db: Session, user: models.User, match: models.Match):
-    existing_entry = db.query(models.MatchPlayer).filter_by(user_id=user.id, match_id=match.id).first()
-    if existing_entry: return match
-    confirmed_players_count = db.query(models.MatchPlayer).filter_by(match_id=match.id, status=models.MatchPlayerStatus.confirmed).count()
-    status_to_set = models.MatchPlayerStatus.confirmed
-    if confirmed_players_count >= match.max_players:
-        if match.waitlist_enabled: status_to_set = models.MatchPlayerStatus.waitlist
-        else: return None
-    db_match_player = models.MatchPlayer(match_id=match.id, user_id=user.id, status=status_to_set)
-    db.add(db_match_player)
+def leave_outcome(db, user: models.User, match: models.Match, row) -> bool:
+    """Разбирает строку LEAVE_MATCH_SQL; True — игрок был в матче и удалён."""
+    if row.status is None:
+        return False
+    response_cache.invalidate_on_commit(db, "matches", f"match:{match.id}")
+    roster_index.invalidate_on_commit(db, [match.id])
+    realtime.publish_on_commit(db, match.id, player_left_event(user.id, row.promoted_user_id))
+    return True
+
+# details=True: вместо матча вернуть JSON MatchDetailsPublic, прочитанный той же транзакцией
+# сразу после записи, до COMMIT. В самом операторе записи его не собрать: все части WITH
+# видят снимок до изменений, и в составе и счётчиках не было бы только что изменённой строки.
+# Строка матча ещё заблокирована записью, поэтому ответ отражает ровно это изменение,
+# а отдельная транзакция на чтение (BEGIN, SELECT, ROLLBACK при закрытии) не нужна.
+def add_player_to_match(db: Session, user: models.User, match: models.Match, details: bool = False):
+    row = db.execute(JOIN_MATCH_SQL, {"match_id": match.id, "user_id": user.id}).one()
+    result = join_outcome(db, user, match, row)
+    if details:
+        result = get_match_details_json(db, match.id)
     db.commit()
-    return match
+    return result
 
-def remove_player_from_match(db: Session, user: models.User, match: models.Match):
-    if match.captain_id == user.id: return None 
-    player_entry = db.query(models.MatchPlayer).filter_by(match_id=match.id, user_id=user.id).first()
-    if player_entry:
-        was_confirmed = player_entry.status == models.MatchPlayerStatus.confirmed
-        db.delete(player_entry)
-        db.commit()
-        if was_confirmed and match.waitlist_enabled:
-            waitlist_player = db.query(models.MatchPlayer)\
-                .filter_by(match_id=match.id, status=models.MatchPlayerStatus.waitlist)\
-                .order_by(models.MatchPlayer.joined_at.asc()).first()
-            if waitlist_player:
-                waitlist_player.status = models.MatchPlayerStatus.confirmed
-                db.add(waitlist_player)
-                db.commit()
-    return match
+def remove_player_from_match(db: Session, user: models.User, match: models.Match, details: bool = False):
+    if match.captain_id == user.id: return None
+    db.execute(LOCK_MATCH_SQL, {"match_id": match.id})
+    row = db.execute(LEAVE_MATCH_SQL, {"match_id": match.id, "user_id": user.id}).one()
+    leave_outcome(db, user, match, row)
+    result = get_match_details_json(db, match.id) if details else match
+    db.commit()
+    return result
+
+def find_match_counter_drift(db: Session):
+    """Матчи, у которых confirmed_count/waitlist_count расходятся с фактическими строками match_players."""
+    actual = select(
+        models.MatchPlayer.match_id,
+        func.count().filter(models.MatchPlayer.status == models.MatchPlayerStatus.confirmed).label("confirmed"),
+        func.count().filter(models.MatchPlayer.status == models.MatchPlayerStatus.waitlist).label("waitlist"),
+    ).group_by(models.MatchPlayer.match_id).subquery()
+    confirmed = func.coalesce(actual.c.confirmed, 0)
+    waitlist = func.coalesce(actual.c.waitlist, 0)
+    stmt = select(
+        models.Match.id, models.Match.confirmed_count, models.Match.waitlist_count,
+        confirmed.label("actual_confirmed"), waitlist.label("actual_waitlist"),
+    ).outerjoin(actual, actual.c.match_id == models.Match.id)\
+        .filter((models.Match.confirmed_count != confirmed) | (models.Match.waitlist_count != waitlist))\
+        .order_by(models.Match.id)
+    return db.execute(stmt).all()
+
+def fix_match_counters(db: Session, drift) -> int:
+    for row in drift:
+        db.execute(
+            update(models.Match).where(models.Match.id == row.id)
+            .values(confirmed_count=row.actual_confirmed, waitlist_count=row.actual_waitlist)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    return len(drift)
+
+SCHEDULE_INSERT_BATCH = 10000
+
+# Кандидаты уходят двумя массивами: одна вставка на пачку, без построчных параметров.
+SCHEDULE_INSERT_SQL = text("""
+INSERT INTO time_slots (field_id, start_time, end_time, status)
+SELECT :field_id, c.start_time, c.end_time, 'available'
+FROM unnest(CAST(:starts AS timestamp[]), CAST(:ends AS timestamp[])) AS c(start_time, end_time)
+ON CONFLICT (field_id, start_time) DO NOTHING
+""")
+
+def day_offsets(start_time: time, end_time: time, slot_duration_minutes: int) -> list:
+    """Сетка одного дня: (start, end) как смещения от полуночи."""
+    duration = timedelta(minutes=slot_duration_minutes)
+    current = datetime.combine(date.min, start_time)
+    day_end = datetime.combine(date.min, end_time)
+    offsets = []
+    while current + duration <= day_end:
+        offsets.append((current - datetime.min, current + duration - datetime.min))
+        current += duration
+    return offsets
+
+def schedule_candidates(schedule_data: schemas.ScheduleGenerationRequest) -> list:
+    """Все (start, end) диапазона: сетка дня считается один раз и сдвигается по датам."""
+    offsets = day_offsets(schedule_data.start_time, schedule_data.end_time, schedule_data.slot_duration_minutes)
+    days = (schedule_data.end_date - schedule_data.start_date).days + 1
+    base = datetime.combine(schedule_data.start_date, time.min)
+    return [
+        (day + start, day + end)
+        for day in (base + timedelta(days=n) for n in range(days))
+        for start, end in offsets
+    ]
+
+def _ensure_slot_partitions(db: Session, starts) -> None:
+    """Создаёт месячные партиции под starts. Вызывать до первой вставки в транзакции:
+    партиция создаётся отдельным соединением, а своя открытая вставка заблокировала бы его."""
+    if starts:
+        partitions.ensure_partitions(db.get_bind(), partitions.months_between(min(starts), max(starts)))
+
+def _insert_slot_batch(db: Session, field_id: int, batch: list) -> int:
+    if db.get_bind().dialect.name == "postgresql":
+        starts, ends = zip(*batch)
+        return db.execute(SCHEDULE_INSERT_SQL, {
+            "field_id": field_id, "starts": list(starts), "ends": list(ends),
+        }).rowcount
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(models.TimeSlot.__table__).on_conflict_do_nothing(index_elements=["field_id", "start_time"])
+    return db.execute(stmt, [
+        {"field_id": field_id, "start_time": start, "end_time": end, "status": models.TimeSlotStatus.available}
+        for start, end in batch
+    ]).rowcount
 
 def generate_schedule_for_field(db: Session, field: models.Field, schedule_data: schemas.ScheduleGenerationRequest):
-    new_slots = []
-    current_date = schedule_data.start_date
-    while current_date <= schedule_data.end_date:
-        current_time = datetime.combine(current_date, schedule_data.start_time)
-        end_of_day = datetime.combine(current_date, schedule_data.end_time)
-        while current_time < end_of_day:
-            end_time = current_time + timedelta(minutes=schedule_data.slot_duration_minutes)
-            if end_time > end_of_day: break
-            exists = db.query(models.TimeSlot).filter_by(field_id=field.id, start_time=current_time).first()
-            if not exists:
-                new_slots.append(models.TimeSlot(field_id=field.id, start_time=current_time, end_time=end_time))
-            current_time = end_time
-        current_date += timedelta(days=1)
-    db.add_all(new_slots)
-    db.commit()
-    return len(new_slots)
+    if schedule_data.slot_duration_minutes <= 0:
+        return 0
+    candidates = schedule_candidates(schedule_data)
+    _ensure_slot_partitions(db, [start for start, _ in candidates[:1] + candidates[-1:]])
+    created = 0
+    for offset in range(0, len(candidates), SCHEDULE_INSERT_BATCH):
+        created += _insert_slot_batch(db, field.id, candidates[offset:offset + SCHEDULE_INSERT_BATCH])
+    response_cache.invalidate_on_commit(db, f"slots:{field.id}")
+    db.commit()
+    return created
+
+def recurring_schedule_days(schedule: schemas.RecurringScheduleRequest) -> list:
+    """[(день, сетка)] по правилам дней недели без blackout-дат; дни без слотов пропускаются."""
+    grids = {}
+    for weekday in range(7):
+        offsets = set()
+        for rule in schedule.rules:
+            if weekday in rule.weekdays:
+                offsets.update(day_offsets(rule.start_time, rule.end_time, schedule.slot_duration_minutes))
+        grids[weekday] = sorted(offsets)
+    blackout = set(schedule.blackout_dates)
+    days = []
+    current = schedule.start_date
+    while current <= schedule.end_date:
+        if current not in blackout and grids[current.weekday()]:
+            days.append((current, grids[current.weekday()]))
+        current += timedelta(days=1)
+    return days
+
+def create_schedule_job(db: Session, venue: models.VenueProfile, created_by: models.User,
+                        schedule: schemas.RecurringScheduleRequest, field_ids: list):
+    params = schedule.model_dump(mode="json")
+    params["field_ids"] = field_ids
+    db_job = models.ScheduleJob(
+        venue_id=venue.id, created_by=created_by.id, params=params,
+        total_units=len(field_ids) * len(recurring_schedule_days(schedule)),
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_schedule_job(db: Session, job_id: int):
+    return db.get(models.ScheduleJob, job_id)
+
+def _stale_job_cutoff(db: Session, stale_seconds: int) -> datetime:
+    return db.scalar(select(func.now())) - timedelta(seconds=stale_seconds)
+
+def claim_schedule_job(db: Session, job_id: int, stale_seconds: int) -> bool:
+    """Атомарно переводит задачу в running; running-задачу без прогресса дольше stale_seconds
+    (упавший воркер) можно забрать повторно."""
+    job = models.ScheduleJob
+    result = db.execute(
+        update(job).where(job.id == job_id).where(
+            (job.status == models.ScheduleJobStatus.pending)
+            | ((job.status == models.ScheduleJobStatus.running) & (job.updated_at < _stale_job_cutoff(db, stale_seconds)))
+        ).values(status=models.ScheduleJobStatus.running, updated_at=func.now())
+    )
+    db.commit()
+    return result.rowcount == 1
+
+def find_resumable_schedule_jobs(db: Session, stale_seconds: int) -> list:
+    job = models.ScheduleJob
+    stmt = select(job.id).where(
+        (job.status == models.ScheduleJobStatus.pending)
+        | ((job.status == models.ScheduleJobStatus.running) & (job.updated_at < _stale_job_cutoff(db, stale_seconds)))
+    ).order_by(job.id)
+    return db.scalars(stmt).all()
+
+def run_schedule_job(db: Session, job_id: int, chunk_units: int, should_stop=lambda: False) -> models.ScheduleJob:
+    """Продолжает задачу с processed_units. Каждая пачка — отдельная короткая транзакция,
+    в которой вместе со слотами фиксируется и прогресс, так что повтор после сбоя точен."""
+    db_job = db.get(models.ScheduleJob, job_id)
+    schedule = schemas.RecurringScheduleRequest.model_validate(db_job.params)
+    days = recurring_schedule_days(schedule)
+    units = [(field_id, day) for field_id in db_job.params["field_ids"] for day in days]
+    while db_job.processed_units < len(units):
+        if should_stop():
+            return db_job
+        chunk = units[db_job.processed_units:db_job.processed_units + chunk_units]
+        by_field = {}
+        for field_id, (day, offsets) in chunk:
+            base = datetime.combine(day, time.min)
+            by_field.setdefault(field_id, []).extend((base + start, base + end) for start, end in offsets)
+        _ensure_slot_partitions(db, [datetime.combine(day, time.min) for _, (day, _) in chunk])
+        for field_id, candidates in by_field.items():
+            for offset in range(0, len(candidates), SCHEDULE_INSERT_BATCH):
+                db_job.created_slots += _insert_slot_batch(db, field_id, candidates[offset:offset + SCHEDULE_INSERT_BATCH])
+        db_job.processed_units += len(chunk)
+        response_cache.invalidate_on_commit(db, *(f"slots:{field_id}" for field_id in by_field))
+        db.commit()
+    db_job.status = models.ScheduleJobStatus.completed
+    db_job.finished_at = func.now()
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def set_schedule_job_status(db: Session, job_id: int, status: models.ScheduleJobStatus, error: Optional[str] = None):
+    values = {"status": status, "error": error}
+    if status == models.ScheduleJobStatus.failed:
+        values["finished_at"] = func.now()
+    db.execute(update(models.ScheduleJob).where(models.ScheduleJob.id == job_id).values(**values))
+    db.commit()
 
 def get_slots_for_field_on_date(db: Session, field_id: int, on_date: date):
     start_of_day = datetime.combine(on_date, time.min)
@@ -188,66 +850,652 @@ def get_slots_for_field_on_date(db: Session, field_id: int, on_date: date):
         .filter(models.TimeSlot.field_id == field_id)\
         .filter(models.TimeSlot.start_time.between(start_of_day, end_of_day))\
         .order_by(models.TimeSlot.start_time.asc()).all()
-    for slot in slots:
-        slot.price = slot.price_override if slot.price_override is not None else slot.field.price_per_hour
+    return apply_slot_prices(compiled_pricing(db, [field_id]), slots)
+
+def pricing_rules_query(field_ids):
+    return select(models.PricingRule).where(models.PricingRule.field_id.in_(list(field_ids)))
+
+def compiled_pricing(db: Session, field_ids) -> dict:
+    compiled, missing = pricing_engine.lookup(field_ids)
+    if missing:
+        compiled.update(pricing_engine.load(missing, db.scalars(pricing_rules_query(missing)).all()))
+    return compiled
+
+def apply_slot_prices(compiled: dict, slots: list) -> list:
+    prices = pricing_engine.price(
+        compiled,
+        [slot.field_id for slot in slots], [slot.start_time for slot in slots],
+        [slot.field.price_per_hour for slot in slots], [slot.price_override for slot in slots],
+    )
+    for slot, price in zip(slots, prices):
+        slot.price = price
     return slots
 
-def update_match_status(db: Session, match: models.Match, status: models.MatchStatus):
+def get_pricing_rules(db: Session, field_id: int):
+    return db.query(models.PricingRule).filter(models.PricingRule.field_id == field_id)\
+        .order_by(models.PricingRule.priority.desc(), models.PricingRule.id.desc()).all()
+
+def get_pricing_rule(db: Session, rule_id: int):
+    return db.get(models.PricingRule, rule_id)
+
+def _pricing_rule_values(rule: schemas.PricingRuleCreate) -> dict:
+    values = rule.model_dump(exclude={"weekdays"})
+    values["weekday_mask"] = models.PricingRule.mask_from_weekdays(rule.weekdays)
+    return values
+
+def _invalidate_field_pricing(db: Session, field_id: int) -> None:
+    pricing_engine.invalidate_on_commit(db, field_id)
+    response_cache.invalidate_on_commit(db, f"slots:{field_id}")
+
+def create_pricing_rule(db: Session, field_id: int, rule: schemas.PricingRuleCreate):
+    db_rule = models.PricingRule(field_id=field_id, **_pricing_rule_values(rule))
+    db.add(db_rule)
+    _invalidate_field_pricing(db, field_id)
+    db.commit()
+    db.refresh(db_rule)
+    return db_rule
+
+def update_pricing_rule(db: Session, db_rule: models.PricingRule, rule: schemas.PricingRuleCreate):
+    for key, value in _pricing_rule_values(rule).items():
+        setattr(db_rule, key, value)
+    db.add(db_rule)
+    _invalidate_field_pricing(db, db_rule.field_id)
+    db.commit()
+    db.refresh(db_rule)
+    return db_rule
+
+def delete_pricing_rule(db: Session, db_rule: models.PricingRule):
+    db.delete(db_rule)
+    _invalidate_field_pricing(db, db_rule.field_id)
+    db.commit()
+
+AVAILABILITY_STATUSES = list(models.TimeSlotStatus)
+
+def get_venue_field_ids(db: Session, venue_id: int) -> list:
+    return db.scalars(select(models.Field.id).where(models.Field.venue_id == venue_id).order_by(models.Field.id)).all()
+
+def availability_query(field_ids: list, start_date: date, days: int):
+    """Только нужные колонки; цену по правилам считает pricing_engine."""
+    start = datetime.combine(start_date, time.min)
+    slot = models.TimeSlot
+    return select(
+        slot.field_id, slot.id, slot.start_time, slot.end_time, slot.status,
+        models.Field.price_per_hour, slot.price_override,
+    ).join(models.Field, models.Field.id == slot.field_id)\
+        .where(slot.field_id.in_(field_ids))\
+        .where(slot.start_time >= start, slot.start_time < start + timedelta(days=days))\
+        .order_by(slot.field_id, slot.start_time)
+
+def price_availability_rows(compiled: dict, rows) -> list:
+    """Строки availability_query -> (field_id, id, start, end, status, цена)."""
+    prices = pricing_engine.price(
+        compiled, [row[0] for row in rows], [row[2] for row in rows],
+        [row[5] for row in rows], [row[6] for row in rows],
+    )
+    return [(*row[:5], price) for row, price in zip(rows, prices)]
+
+def encode_availability(rows, field_ids: list, start_date: date, days: int) -> dict:
+    """Сетка доступности: по полю и дню — RLE-отрезки [начало в минутах, длительность, количество,
+    код статуса, индекс ценовой полосы, id первого слота]. Отрезок продолжается, пока слоты идут
+    встык с той же длительностью, статусом и ценой и с id подряд, поэтому id k-го слота = первый id + k."""
+    status_codes = {status: code for code, status in enumerate(AVAILABILITY_STATUSES)}
+    bands = {}
+    grid = {field_id: {} for field_id in field_ids}
+    for field_id, slot_id, start, end, status, price in rows:
+        band = bands.setdefault(price, len(bands))
+        minute = start.hour * 60 + start.minute
+        duration = int((end - start).total_seconds() // 60)
+        code = status_codes[status]
+        runs = grid[field_id].setdefault(start.date().isoformat(), [])
+        if runs:
+            last = runs[-1]
+            if (last[1] == duration and last[3] == code and last[4] == band
+                    and last[0] + last[1] * last[2] == minute and last[5] + last[2] == slot_id):
+                last[2] += 1
+                continue
+        runs.append([minute, duration, 1, code, band, slot_id])
+    return {
+        "start_date": start_date.isoformat(),
+        "days": days,
+        "statuses": [status.value for status in AVAILABILITY_STATUSES],
+        "price_bands": list(bands),
+        "fields": [{"field_id": field_id, "days": grid[field_id]} for field_id in field_ids],
+    }
+
+def get_availability(db: Session, field_ids: list, start_date: date, days: int) -> dict:
+    rows = db.execute(availability_query(field_ids, start_date, days)).all()
+    rows = price_availability_rows(compiled_pricing(db, field_ids), rows)
+    return encode_availability(rows, field_ids, start_date, days)
+
+def update_match_status(db: Session, match: models.Match, status: models.MatchStatus, details: bool = False):
+    """details=True — см. add_player_to_match."""
     match.status = status
     db.add(match)
     if status == models.MatchStatus.cancelled and match.slot:
         match.slot.status = models.TimeSlotStatus.available
         match.slot.match_id = None
         db.add(match.slot)
+    response_cache.invalidate_on_commit(db, "matches", f"match:{match.id}", f"slots:{match.field_id}")
+    roster_index.invalidate_on_commit(db, [match.id])
+    realtime.publish_on_commit(db, match.id, {"type": "status_changed", "status": status.value})
+    if details:
+        db.flush()  # текстовый запрос деталей не сбрасывает изменения ORM сам
+        details_json = get_match_details_json(db, match.id)
+        db.commit()
+        return details_json
     db.commit()
     db.refresh(match)
     return match
 
+# Задачи планировщика жизненного цикла (core.lifecycle). Каждая обрабатывает одну
+# ограниченную пачку; SKIP LOCKED пропускает строки, которые сейчас держат запросы пользователей.
+COMPLETE_FINISHED_MATCHES_SQL = text("""
+WITH due AS (
+    SELECT m.id
+    FROM matches m
+    LEFT JOIN time_slots s ON s.id = m.slot_id AND s.start_time = m.starts_at
+    WHERE m.status = 'active' AND m.starts_at < LOCALTIMESTAMP
+      AND COALESCE(s.end_time, m.starts_at + make_interval(mins => :default_minutes)) < LOCALTIMESTAMP
+    ORDER BY m.starts_at, m.id
+    LIMIT :limit
+    FOR UPDATE OF m SKIP LOCKED
+)
+UPDATE matches m SET status = 'completed'
+FROM due WHERE m.id = due.id
+RETURNING m.id, m.field_id
+""")
+
+# Прошедшие свободные слоты закрываются для брони. Удержание сохраняет только
+# partitions.RETAINED_SLOTS (booked и слоты матчей), так что unavailable-слоты отсюда
+# вместе с партицией месяца уходят в архив.
+EXPIRE_PAST_SLOTS_SQL = text("""
+WITH due AS (
+    SELECT id, start_time
+    FROM time_slots
+    WHERE status = 'available' AND start_time < LOCALTIMESTAMP AND end_time < LOCALTIMESTAMP
+    ORDER BY start_time
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE time_slots s SET status = 'unavailable', held_by = NULL, held_until = NULL
+FROM due WHERE s.id = due.id AND s.start_time = due.start_time
+RETURNING s.field_id
+""")
+
+RELEASE_EXPIRED_HOLDS_SQL = text("""
+WITH due AS (
+    SELECT id, start_time
+    FROM time_slots
+    WHERE held_by IS NOT NULL AND held_until < now()
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE time_slots s SET held_by = NULL, held_until = NULL
+FROM due WHERE s.id = due.id AND s.start_time = due.start_time
+RETURNING s.field_id
+""")
+
+def complete_finished_matches(db: Session, limit: int, default_minutes: int) -> int:
+    """Завершает активные матчи, у которых закончился слот (без слота — starts_at + default_minutes)."""
+    rows = db.execute(COMPLETE_FINISHED_MATCHES_SQL, {"limit": limit, "default_minutes": default_minutes}).all()
+    if rows:
+        response_cache.invalidate_on_commit(db, "matches", *(f"match:{row.id}" for row in rows))
+        roster_index.invalidate_on_commit(db, [row.id for row in rows])
+        for row in rows:
+            realtime.publish_on_commit(db, row.id, {"type": "status_changed", "status": models.MatchStatus.completed.value})
+    db.commit()
+    return len(rows)
+
+def expire_past_slots(db: Session, limit: int) -> int:
+    """Прошедшие незанятые слоты становятся unavailable."""
+    field_ids = db.execute(EXPIRE_PAST_SLOTS_SQL, {"limit": limit}).scalars().all()
+    response_cache.invalidate_on_commit(db, *(f"slots:{field_id}" for field_id in set(field_ids)))
+    db.commit()
+    return len(field_ids)
+
+def release_expired_holds(db: Session, limit: int) -> int:
+    field_ids = db.execute(RELEASE_EXPIRED_HOLDS_SQL, {"limit": limit}).scalars().all()
+    response_cache.invalidate_on_commit(db, *(f"slots:{field_id}" for field_id in set(field_ids)))
+    db.commit()
+    return len(field_ids)
+
 def get_match_by_invite_code(db: Session, invite_code: str):
     return db.query(models.Match).filter(models.Match.invite_code == invite_code).first()
 
+# Отзывы и неявки матча одним оператором при любом размере состава. Дубли отбрасывает
+# ON CONFLICT по uq_player_reviews_match_reviewer_subject_type (из повторов в самом запросе
+# берётся первый). Строки неявок блокируются до перевода в noshow, чтобы счётчики матча
+# уменьшились по актуальному статусу. Рейтинги меняются относительно текущей строки users
+# (после ожидания её блокировки), поэтому параллельные отправки не теряют обновлений.
+# Средние ведутся по отдельным счётчикам типов, сглаженные оценки — с параметрами из
+# rating_state (см. core/ratings.py); reviews_count — общее число отзывов.
+PROCESS_REVIEWS_SQL = text("""
+WITH incoming AS (
+    SELECT DISTINCT ON (r.subject_id, r.review_type) r.subject_id, r.review_type, r.rating
+    FROM unnest(CAST(:subject_ids AS integer[]), CAST(:review_types AS text[]), CAST(:ratings AS integer[]))
+        WITH ORDINALITY AS r(subject_id, review_type, rating, position)
+    WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = r.subject_id)
+    ORDER BY r.subject_id, r.review_type, r.position
+), inserted AS (
+    INSERT INTO player_reviews (match_id, reviewer_id, subject_id, review_type, rating)
+    SELECT :match_id, :reviewer_id, subject_id, CAST(review_type AS reviewtype), rating FROM incoming
+    ON CONFLICT ON CONSTRAINT uq_player_reviews_match_reviewer_subject_type DO NOTHING
+    RETURNING subject_id, review_type, rating
+), absent AS (
+    SELECT id, user_id, status FROM match_players
+    WHERE match_id = :match_id AND user_id = ANY(CAST(:no_show_ids AS integer[])) AND status <> 'noshow'
+    FOR UPDATE
+), marked AS (
+    UPDATE match_players mp SET status = 'noshow'
+    FROM absent WHERE mp.id = absent.id
+    RETURNING mp.user_id, absent.status AS previous
+), counters AS (
+    UPDATE matches SET
+        confirmed_count = confirmed_count - (SELECT count(*) FROM marked WHERE previous = 'confirmed'),
+        waitlist_count = waitlist_count - (SELECT count(*) FROM marked WHERE previous = 'waitlist')
+    WHERE id = :match_id AND EXISTS (SELECT 1 FROM marked)
+), deltas AS (
+    SELECT user_id,
+           sum(skill_n) AS skill_n, sum(skill_sum) AS skill_sum,
+           sum(sportsmanship_n) AS sportsmanship_n, sum(sportsmanship_sum) AS sportsmanship_sum,
+           sum(no_shows) AS no_shows
+    FROM (
+        SELECT subject_id AS user_id,
+               count(*) FILTER (WHERE review_type = 'skill') AS skill_n,
+               coalesce(sum(rating) FILTER (WHERE review_type = 'skill'), 0) AS skill_sum,
+               count(*) FILTER (WHERE review_type = 'sportsmanship') AS sportsmanship_n,
+               coalesce(sum(rating) FILTER (WHERE review_type = 'sportsmanship'), 0) AS sportsmanship_sum,
+               0 AS no_shows
+        FROM inserted GROUP BY subject_id
+        UNION ALL
+        SELECT user_id, 0, 0, 0, 0, 1 FROM marked
+    ) changes
+    GROUP BY user_id
+), prior AS (
+    SELECT coalesce(max(prior_weight), :prior_weight) AS weight,
+           coalesce(max(skill_prior), :default_prior) AS skill,
+           coalesce(max(sportsmanship_prior), :default_prior) AS sportsmanship
+    FROM rating_state WHERE id = 1
+), rated AS (
+    UPDATE users u SET
+        skill_rating = CASE WHEN d.skill_n > 0
+            THEN (u.skill_rating * u.skill_reviews_count + d.skill_sum) / (u.skill_reviews_count + d.skill_n)
+            ELSE u.skill_rating END,
+        skill_score = CASE WHEN d.skill_n > 0
+            THEN (p.weight * p.skill + u.skill_rating * u.skill_reviews_count + d.skill_sum)
+                 / (p.weight + u.skill_reviews_count + d.skill_n)
+            ELSE u.skill_score END,
+        skill_reviews_count = u.skill_reviews_count + d.skill_n,
+        sportsmanship_rating = CASE WHEN d.sportsmanship_n > 0
+            THEN (u.sportsmanship_rating * u.sportsmanship_reviews_count + d.sportsmanship_sum)
+                 / (u.sportsmanship_reviews_count + d.sportsmanship_n)
+            ELSE u.sportsmanship_rating END,
+        sportsmanship_score = CASE WHEN d.sportsmanship_n > 0
+            THEN (p.weight * p.sportsmanship + u.sportsmanship_rating * u.sportsmanship_reviews_count + d.sportsmanship_sum)
+                 / (p.weight + u.sportsmanship_reviews_count + d.sportsmanship_n)
+            ELSE u.sportsmanship_score END,
+        sportsmanship_reviews_count = u.sportsmanship_reviews_count + d.sportsmanship_n,
+        reviews_count = u.reviews_count + d.skill_n + d.sportsmanship_n,
+        no_show_count = u.no_show_count + d.no_shows,
+        updated_at = now()
+    FROM deltas d CROSS JOIN prior p WHERE u.id = d.user_id
+    RETURNING u.id, u.email
+)
+SELECT
+    (SELECT count(*) FROM inserted) AS reviews_added,
+    (SELECT count(*) FROM marked) AS no_shows_marked,
+    (SELECT coalesce(array_agg(id), '{}') FROM rated) AS user_ids,
+    (SELECT coalesce(array_agg(email), '{}') FROM rated) AS emails
+""")
+
 def process_reviews_and_no_shows(db: Session, match_id: int, reviewer_id: int, data: schemas.BulkReviewRequest):
-    for review_data in data.reviews:
-        existing_review = db.query(models.PlayerReview).filter_by(
-            match_id=match_id,
-            reviewer_id=reviewer_id,
-            subject_id=review_data.subject_id,
-            review_type=models.ReviewType[review_data.review_type]
-        ).first()
-        
-        if not existing_review:
-            new_review = models.PlayerReview(
-                match_id=match_id,
-                reviewer_id=reviewer_id,
-                subject_id=review_data.subject_id,
-                review_type=review_data.review_type,
-                rating=review_data.rating
-            )
-            db.add(new_review)
-            
-            subject_user = db.query(models.User).filter_by(id=review_data.subject_id).first()
-            if subject_user:
-                total_reviews = subject_user.reviews_count or 0
-                if review_data.review_type == 'skill':
-                    current_total_score = (subject_user.skill_rating or 0) * total_reviews
-                    subject_user.skill_rating = (current_total_score + review_data.rating) / (total_reviews + 1)
-                elif review_data.review_type == 'sportsmanship':
-                    current_total_score = (subject_user.sportsmanship_rating or 0) * total_reviews
-                    subject_user.sportsmanship_rating = (current_total_score + review_data.rating) / (total_reviews + 1)
-                
-                subject_user.reviews_count = total_reviews + 1
-                db.add(subject_user)
-
-    for noshow_data in data.no_shows:
-        player_in_match = db.query(models.MatchPlayer).filter_by(match_id=match_id, user_id=noshow_data.subject_id).first()
-        if player_in_match and player_in_match.status != models.MatchPlayerStatus.noshow:
-            player_in_match.status = models.MatchPlayerStatus.noshow
-            db.add(player_in_match)
-            
-            subject_user = db.query(models.User).filter_by(id=noshow_data.subject_id).first()
-            if subject_user:
-                subject_user.no_show_count = (subject_user.no_show_count or 0) + 1
-                db.add(subject_user)
-                
-    db.commit()
-    return True
\ No newline at end of file
+    row = db.execute(PROCESS_REVIEWS_SQL, {
+        "match_id": match_id, "reviewer_id": reviewer_id,
+        "subject_ids": [review.subject_id for review in data.reviews],
+        "review_types": [review.review_type for review in data.reviews],
+        "ratings": [review.rating for review in data.reviews],
+        "no_show_ids": [no_show.subject_id for no_show in data.no_shows],
+        "prior_weight": ratings.PRIOR_WEIGHT, "default_prior": ratings.DEFAULT_PRIOR,
+    }).one()
+    for email in row.emails:
+        # Рейтинги входят в профиль, закэшированный вместе с принципалом.
+        invalidate_principal_on_commit(db, email)
+    leaderboard_index.invalidate_on_commit(db, row.user_ids)
+    roster_index.invalidate_on_commit(db, [match_id], row.user_ids)
+    response_cache.invalidate_on_commit(db, "matches", f"match:{match_id}")
+    # Новые рейтинги и неявки — в деталях и других активных матчей этих игроков.
+    invalidate_user_matches_on_commit(db, row.user_ids)
+    db.commit()
+    return {"reviews_added": row.reviews_added, "no_shows_marked": row.no_shows_marked}
+
+RATING_STATE_SQL = text("""
+SELECT last_review_id, prior_weight, skill_prior, sportsmanship_prior FROM rating_state WHERE id = 1
+""")
+
+SAVE_RATING_STATE_SQL = text("""
+INSERT INTO rating_state (id, last_review_id, prior_weight, skill_prior, sportsmanship_prior, recomputed_at)
+VALUES (1, :last_review_id, :prior_weight, :skill_prior, :sportsmanship_prior, now())
+ON CONFLICT (id) DO UPDATE SET
+    last_review_id = excluded.last_review_id, prior_weight = excluded.prior_weight,
+    skill_prior = excluded.skill_prior, sportsmanship_prior = excluded.sportsmanship_prior,
+    recomputed_at = excluded.recomputed_at
+""")
+
+# Пачка отзывов по PK (keyset) одной строкой массивов: без объекта строки на каждый отзыв.
+REVIEW_CHUNK_SQL = text("""
+SELECT max(id) AS last_id,
+       coalesce(array_agg(subject_id), '{}') AS subject_ids,
+       coalesce(array_agg(kind), '{}') AS kinds,
+       coalesce(array_agg(rating), '{}') AS ratings
+FROM (
+    SELECT id, subject_id, CAST(review_type = 'sportsmanship' AS integer) AS kind, rating
+    FROM player_reviews WHERE id > :after AND id <= :upto
+    ORDER BY id LIMIT :limit
+) chunk
+""")
+
+REVIEW_TOTALS_SQL = text("""
+SELECT subject_id, CAST(review_type = 'sportsmanship' AS integer) AS kind, count(*), sum(rating)
+FROM player_reviews
+WHERE subject_id = ANY(CAST(:ids AS integer[])) AND id > :after
+GROUP BY 1, 2
+""")
+
+LOCK_RATED_USERS_SQL = text("""
+SELECT id FROM users WHERE id = ANY(CAST(:ids AS integer[])) ORDER BY id FOR UPDATE
+""")
+
+# Пишутся только строки, где что-то изменилось (средние — с допуском на округление).
+WRITE_RATINGS_SQL = text("""
+UPDATE users u SET
+    skill_reviews_count = v.skill_count, skill_rating = v.skill_rating, skill_score = v.skill_score,
+    sportsmanship_reviews_count = v.sportsmanship_count, sportsmanship_rating = v.sportsmanship_rating,
+    sportsmanship_score = v.sportsmanship_score,
+    reviews_count = v.skill_count + v.sportsmanship_count,
+    updated_at = now()
+FROM unnest(
+    CAST(:ids AS integer[]),
+    CAST(:skill_counts AS integer[]), CAST(:skill_ratings AS float8[]), CAST(:skill_scores AS float8[]),
+    CAST(:sportsmanship_counts AS integer[]), CAST(:sportsmanship_ratings AS float8[]),
+    CAST(:sportsmanship_scores AS float8[])
+) AS v(id, skill_count, skill_rating, skill_score, sportsmanship_count, sportsmanship_rating, sportsmanship_score)
+WHERE u.id = v.id AND (
+    u.skill_reviews_count <> v.skill_count OR u.sportsmanship_reviews_count <> v.sportsmanship_count
+    OR u.reviews_count <> v.skill_count + v.sportsmanship_count
+    OR abs(u.skill_rating - v.skill_rating) > 1e-9 OR abs(u.sportsmanship_rating - v.sportsmanship_rating) > 1e-9
+    OR NOT coalesce(abs(u.skill_score - v.skill_score) <= 1e-9, u.skill_score IS NULL AND v.skill_score IS NULL)
+    OR NOT coalesce(abs(u.sportsmanship_score - v.sportsmanship_score) <= 1e-9,
+                    u.sportsmanship_score IS NULL AND v.sportsmanship_score IS NULL)
+)
+RETURNING u.id, u.email
+""")
+
+def _review_chunks(db: Session, after: int, upto: int, chunk_size: int):
+    """(subject_ids, kinds, ratings) массивами numpy по chunk_size отзывов с id в (after, upto]."""
+    while after < upto:
+        row = db.execute(REVIEW_CHUNK_SQL, {"after": after, "upto": upto, "limit": chunk_size}).one()
+        db.commit()
+        if row.last_id is None:
+            return
+        after = row.last_id
+        yield (
+            np.array(row.subject_ids, dtype=np.int64),
+            np.array(row.kinds, dtype=np.int8),
+            np.array(row.ratings, dtype=np.int64),
+        )
+
+def recompute_ratings(db: Session, full: bool = False, chunk_size: int = 50000) -> dict:
+    """Пересчёт рейтингов из player_reviews.
+
+    id отзыва выдаёт последовательность до COMMIT, поэтому отзыв с меньшим id может стать
+    виден позже отзыва с большим. Устоявшимися считаются отзывы до settled — на
+    ratings.REVIEW_ID_MARGIN меньше максимального id; более свежий хвост перечитывается.
+
+    Полный: устоявшиеся отзывы читаются пачками и группируются в numpy, priors
+    пересчитываются, затем пачками по chunk_size переписываются все пользователи; каждая
+    пачка блокирует строки users и дочитывает их отзывы после settled. Онлайн-обработка
+    отзывов обновляет users в той же транзакции, что и вставка: отзыв либо закоммичен до
+    блокировки и виден дочитке, либо ждёт её и прибавляется к записанному. Инкрементальный
+    (есть rating_state и не full): читаются отзывы после high-water mark, и их игрокам
+    точно пересчитываются числа и средние по всем их отзывам с прежними priors.
+    High-water mark не заходит дальше settled: хвост до максимального id следующий
+    инкрементальный пересчёт пройдёт ещё раз и подберёт отзывы, закоммиченные с опозданием.
+    """
+    started = perf_counter()
+    state = db.execute(RATING_STATE_SQL).one_or_none()
+    upto = db.execute(text("SELECT coalesce(max(id), 0) FROM player_reviews")).scalar()
+    settled = max(upto - ratings.REVIEW_ID_MARGIN, 0)
+    full = full or state is None
+    after = 0 if full else state.last_review_id
+    mark = max(settled, after)
+
+    totals = ratings.RatingTotals()
+    for subject_ids, kinds, values in _review_chunks(db, after, settled if full else upto, chunk_size):
+        totals.add(subject_ids, kinds, values)
+    reviews_read, read_seconds = totals.reviews, perf_counter() - started
+
+    if full:
+        priors, prior_weight = totals.priors(), ratings.PRIOR_WEIGHT
+        # Новые priors — сразу: онлайн-обработка отзывов считает с ними, пока идёт запись.
+        db.execute(SAVE_RATING_STATE_SQL, {
+            "last_review_id": state.last_review_id if state is not None else 0, "prior_weight": prior_weight,
+            "skill_prior": priors[ratings.SKILL], "sportsmanship_prior": priors[ratings.SPORTSMANSHIP],
+        })
+        db.commit()
+        max_user_id = db.execute(text("SELECT coalesce(max(id), 0) FROM users")).scalar()
+        user_ids = np.arange(1, max_user_id + 1, dtype=np.int64)
+    else:
+        priors, prior_weight = (state.skill_prior, state.sportsmanship_prior), state.prior_weight
+        user_ids = totals.rated_ids()
+
+    updated = 0
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        params = {"ids": chunk.tolist()}
+        db.execute(LOCK_RATED_USERS_SQL, params)
+        if full:
+            # Прочитанное дополняется хвостом после settled — под блокировкой строк users.
+            current = totals
+            current.add_grouped(db.execute(REVIEW_TOTALS_SQL, {**params, "after": settled}).all())
+        else:
+            current = ratings.RatingTotals()
+            current.add_grouped(db.execute(REVIEW_TOTALS_SQL, {**params, "after": 0}).all())
+        written = db.execute(WRITE_RATINGS_SQL, current.columns(chunk, priors, prior_weight)).all()
+        for _, email in written:
+            invalidate_principal_on_commit(db, email)
+        leaderboard_index.invalidate_on_commit(db, [user_id for user_id, _ in written])
+        roster_index.invalidate_on_commit(db, user_ids=[user_id for user_id, _ in written])
+        invalidate_user_matches_on_commit(db, [user_id for user_id, _ in written])
+        db.commit()
+        updated += len(written)
+
+    db.execute(SAVE_RATING_STATE_SQL, {
+        "last_review_id": mark, "prior_weight": prior_weight,
+        "skill_prior": priors[ratings.SKILL], "sportsmanship_prior": priors[ratings.SPORTSMANSHIP],
+    })
+    db.commit()
+    seconds = perf_counter() - started
+    return {
+        "mode": "full" if full else "incremental",
+        "reviews_read": reviews_read,
+        "users_checked": len(user_ids),
+        "users_updated": updated,
+        "last_review_id": mark,
+        "priors": {"skill": round(priors[ratings.SKILL], 4), "sportsmanship": round(priors[ratings.SPORTSMANSHIP], 4)},
+        "read_seconds": round(read_seconds, 3),
+        "seconds": round(seconds, 3),
+        "reviews_per_second": round(reviews_read / read_seconds) if reviews_read else 0,
+    }
+
+def leaderboard_rows_query(user_ids: Optional[List[int]] = None):
+    """Строки для core.leaderboard: все игроки с оценкой или только user_ids."""
+    query = select(
+        models.User.id, models.User.position, models.User.level,
+        models.User.skill_score, models.User.skill_reviews_count,
+        models.User.sportsmanship_score, models.User.sportsmanship_reviews_count,
+    )
+    if user_ids is None:
+        return query.where((models.User.skill_score.isnot(None)) | (models.User.sportsmanship_score.isnot(None)))
+    return query.where(models.User.id.in_(user_ids))
+
+def refresh_leaderboard_index(db: Session) -> None:
+    full, dirty = leaderboard_index.pending()
+    if full:
+        leaderboard_index.load(db.execute(leaderboard_rows_query()).all())
+    elif dirty:
+        leaderboard_index.refresh(dirty, db.execute(leaderboard_rows_query(dirty)).all())
+
+# Запасной путь без индекса в памяти: представление обновляет `manage.py refresh-leaderboard`
+# (и recompute-ratings), между обновлениями таблица может отставать от отзывов.
+_LEADERBOARD_FILTERS = """
+    (CAST(:position AS text) IS NULL OR l.position = :position)
+    AND (CAST(:level AS text) IS NULL OR l.level = :level)
+    AND l.{metric}_reviews_count >= :min_reviews"""
+
+LEADERBOARD_PAGE_SQL = {metric: text(f"""
+SELECT count(*) OVER () AS total, l.user_id, l.{metric}_score AS score, l.{metric}_reviews_count AS reviews_count
+FROM leaderboard l
+WHERE l.{metric}_score IS NOT NULL AND {_LEADERBOARD_FILTERS.format(metric=metric)}
+ORDER BY l.{metric}_score DESC, l.user_id
+LIMIT :limit OFFSET :offset
+""") for metric in leaderboard.METRICS}
+
+LEADERBOARD_RANK_SQL = {metric: text(f"""
+SELECT me.{metric}_score AS score, me.{metric}_reviews_count AS reviews_count,
+       count(*) FILTER (WHERE l.{metric}_score > me.{metric}_score
+                        OR l.{metric}_score = me.{metric}_score AND l.user_id < me.user_id) + 1 AS rank,
+       count(*) AS total
+FROM leaderboard me, leaderboard l
+WHERE me.user_id = :user_id AND me.{metric}_score IS NOT NULL
+  AND (CAST(:position AS text) IS NULL OR me.position = :position)
+  AND (CAST(:level AS text) IS NULL OR me.level = :level)
+  AND me.{metric}_reviews_count >= :min_reviews
+  AND l.{metric}_score IS NOT NULL AND {_LEADERBOARD_FILTERS.format(metric=metric)}
+GROUP BY me.user_id, me.{metric}_score, me.{metric}_reviews_count
+""") for metric in leaderboard.METRICS}
+
+def get_leaderboard(db: Session, metric: str, position: Optional[str] = None, level: Optional[str] = None,
+                    min_reviews: int = 0, limit: int = 20, offset: int = 0) -> dict:
+    if leaderboard_index.enabled:
+        refresh_leaderboard_index(db)
+        total, ranked = leaderboard_index.top(metric, position, level, min_reviews, limit, offset)
+    else:
+        rows = db.execute(LEADERBOARD_PAGE_SQL[metric], {
+            "position": position, "level": level, "min_reviews": min_reviews, "limit": limit, "offset": offset,
+        }).all()
+        total = rows[0].total if rows else 0
+        ranked = [(offset + number + 1, row.user_id, row.score, row.reviews_count) for number, row in enumerate(rows)]
+    users = {user.id: user for user in db.query(models.User).filter(models.User.id.in_([row[1] for row in ranked]))}
+    items = []
+    for rank, user_id, score, reviews_count in ranked:
+        user = users.get(user_id)
+        if user is None:
+            continue
+        items.append({
+            "rank": rank, "user_id": user_id, "full_name": user.full_name, "photo_url": user.photo_url,
+            "position": user.position, "level": user.level, "score": round(score, 4), "reviews_count": reviews_count,
+        })
+    return {"by": metric, "total": total, "items": items}
+
+def get_leaderboard_rank(db: Session, metric: str, user_id: int, position: Optional[str] = None,
+                         level: Optional[str] = None, min_reviews: int = 0) -> Optional[dict]:
+    """Место игрока среди подходящих под фильтры; None — игрок в такую таблицу не попадает."""
+    if leaderboard_index.enabled:
+        refresh_leaderboard_index(db)
+        found = leaderboard_index.rank(metric, user_id, position, level, min_reviews)
+    else:
+        row = db.execute(LEADERBOARD_RANK_SQL[metric], {
+            "user_id": user_id, "position": position, "level": level, "min_reviews": min_reviews,
+        }).one_or_none()
+        found = (row.rank, row.total, row.score, row.reviews_count) if row is not None else None
+    if found is None:
+        return None
+    rank, total, score, reviews_count = found
+    return {"by": metric, "rank": rank, "total": total, "score": round(score, 4), "reviews_count": reviews_count}
+
+def refresh_leaderboard_view(db: Session) -> None:
+    db.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY leaderboard"))
+    db.commit()
+
+# Составы будущих активных публичных матчей для core.recommendations (неявки не в составе).
+ROSTER_ROWS_SQL = text("""
+SELECT m.id, m.starts_at, m.max_players, m.confirmed_count,
+       coalesce(array_agg(mp.user_id) FILTER (WHERE mp.user_id IS NOT NULL), '{}') AS member_ids,
+       coalesce(array_agg(u.position) FILTER (WHERE mp.status = 'confirmed'), '{}') AS positions,
+       coalesce(array_agg(u.skill_rating) FILTER (WHERE mp.status = 'confirmed' AND u.skill_reviews_count > 0), '{}') AS ratings,
+       coalesce(sum(u.no_show_count) FILTER (WHERE mp.status = 'confirmed'), 0) AS no_shows
+FROM matches m
+LEFT JOIN match_players mp ON mp.match_id = m.id AND mp.status <> 'noshow'
+LEFT JOIN users u ON u.id = mp.user_id
+WHERE m.status = 'active' AND m.is_private = false AND m.starts_at > LOCALTIMESTAMP
+  AND (CAST(:match_ids AS integer[]) IS NULL OR m.id = ANY(CAST(:match_ids AS integer[])))
+GROUP BY m.id
+""")
+
+# Самые частые партнёры игрока по завершённым матчам, где оба были в составе.
+CO_PLAYERS_SQL = text("""
+SELECT other.user_id, count(*) AS games
+FROM match_players me
+JOIN matches m ON m.id = me.match_id AND m.status = 'completed'
+JOIN match_players other ON other.match_id = me.match_id AND other.user_id <> me.user_id AND other.status = 'confirmed'
+WHERE me.user_id = :user_id AND me.status = 'confirmed'
+GROUP BY other.user_id
+ORDER BY games DESC, other.user_id
+LIMIT :limit
+""")
+
+def refresh_roster_index(db: Session) -> None:
+    full, dirty = roster_index.pending()
+    if full:
+        roster_index.load(db.execute(ROSTER_ROWS_SQL, {"match_ids": None}).all())
+    elif dirty:
+        roster_index.refresh(dirty, db.execute(ROSTER_ROWS_SQL, {"match_ids": dirty}).all())
+
+def recommendation_player(user: models.User) -> recommendations.Player:
+    return recommendations.Player(
+        user.id, user.skill_rating if user.skill_reviews_count else None, user.position, user.no_show_count,
+    )
+
+def co_players_for(db: Session, user_id: int, limit: int) -> dict:
+    co_players = co_players_cache.get(user_id)
+    if co_players is None:
+        co_players = dict(db.execute(CO_PLAYERS_SQL, {"user_id": user_id, "limit": limit}).all())
+        co_players_cache.set(user_id, co_players)
+    return co_players
+
+def recommended_matches_query(match_ids: List[int]):
+    return select(models.Match)\
+        .options(joinedload(models.Match.captain), joinedload(models.Match.field))\
+        .filter(models.Match.id.in_(match_ids))
+
+def order_by_recommendation(matches: list, recommended) -> list:
+    by_id = {match.id: match for match in matches}
+    ordered = []
+    for match_id, score, average_skill, familiar in recommended:
+        match = by_id.get(match_id)
+        if match is not None:
+            match.score, match.average_skill_rating, match.familiar_players = score, average_skill, familiar
+            ordered.append(match)
+    return ordered
+
+def recommend_matches(db: Session, user: models.User, limit: int, co_players_limit: int) -> list:
+    """Активные публичные матчи со свободными местами, подходящие игроку (core/recommendations.py)."""
+    refresh_roster_index(db)
+    recommended = roster_index.recommend(recommendation_player(user), co_players_for(db, user.id, co_players_limit), limit)
+    if not recommended:
+        return []
+    matches = db.execute(recommended_matches_query([row[0] for row in recommended])).scalars().all()
+    return order_by_recommendation(matches, recommended)
+
+# Какие из ссылок на загруженные файлы ещё у кого-то в профиле; LIKE — условие частичных индексов.
+UPLOAD_REFERENCES_SQL = {
+    kind: text(f"SELECT {column} FROM users WHERE {column} LIKE '/static/%' AND {column} = ANY(:urls)")
+    for kind, column in UPLOAD_COLUMNS.items()
+}
+
+def referenced_uploads(db: Session, kind: str, urls: List[str]) -> set:
+    return set(db.execute(UPLOAD_REFERENCES_SQL[kind], {"urls": urls}).scalars())
+
+def sweep_orphan_uploads(db: Session, batch_size: int, dry_run: bool = False) -> int:
+    """Удаляет загруженные файлы, на которые не ссылается ни один пользователь (core/uploads.py)."""
+    return upload_store.sweep_orphans(lambda kind, urls: referenced_uploads(db, kind, urls), batch_size, dry_run)
\ No newline at end of file
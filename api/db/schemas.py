@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, field_validator
 from datetime import date, datetime, time
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict, Tuple
 
 class UserBase(BaseModel):
     id: int
@@ -13,6 +13,27 @@ class UserBase(BaseModel):
     achievements_doc: Optional[str] = None
     sportsmanship_rating: float = 0
     skill_rating: float = 0
+    sportsmanship_score: Optional[float] = None
+    skill_score: Optional[float] = None
+    sportsmanship_reviews_count: int = 0
+    skill_reviews_count: int = 0
+    no_show_count: int = 0
+    class Config:
+        from_attributes = True
+
+class PlayerPublic(BaseModel):
+    """Публичные поля игрока, без email и документов: для дельт комнат матчей."""
+    id: int
+    full_name: Optional[str] = None
+    photo_url: Optional[str] = None
+    level: Optional[str] = None
+    position: Optional[str] = None
+    sportsmanship_rating: float = 0
+    skill_rating: float = 0
+    sportsmanship_score: Optional[float] = None
+    skill_score: Optional[float] = None
+    sportsmanship_reviews_count: int = 0
+    skill_reviews_count: int = 0
     no_show_count: int = 0
     class Config:
         from_attributes = True
@@ -24,10 +45,15 @@ class FieldPublic(BaseModel):
     price_per_hour: int
     description: Optional[str] = None
     amenities: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     venue_id: int
     class Config:
         from_attributes = True
 
+class FieldNearby(FieldPublic):
+    distance_km: Optional[float] = None  # только при поиске рядом (near=)
+
 class VenueProfilePublic(BaseModel):
     id: int
     owner_id: int
@@ -39,6 +65,32 @@ class VenueProfilePublic(BaseModel):
     class Config:
         from_attributes = True
 
+class VenueSearchHit(VenueProfilePublic):
+    score: float
+    matched_field_ids: List[int] = []  # поля заведения, совпавшие с запросом
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    full_name: Optional[str] = None
+    photo_url: Optional[str] = None
+    position: Optional[str] = None
+    level: Optional[str] = None
+    score: float  # сглаженная оценка (core/ratings.py)
+    reviews_count: int  # отзывов этого типа
+
+class LeaderboardPage(BaseModel):
+    by: str
+    total: int
+    items: List[LeaderboardEntry]
+
+class LeaderboardRank(BaseModel):
+    by: str
+    rank: int
+    total: int
+    score: float
+    reviews_count: int
+
 class UserProfile(UserBase):
     venue_profile: Optional[VenueProfilePublic] = None
     class Config:
@@ -59,15 +111,65 @@ class MatchPublic(BaseModel):
     class Config:
         from_attributes = True
 
+class MatchPage(BaseModel):
+    items: List[MatchPublic]
+    next_cursor: Optional[str] = None
+
+class MatchSearchParams(BaseModel):
+    """Фильтры поиска по активным публичным матчам; пустое поле — без ограничения."""
+    sports: Optional[List[str]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    time_from: Optional[time] = None
+    time_to: Optional[time] = None
+    price_min: Optional[int] = None  # цена часа поля
+    price_max: Optional[int] = None
+    venue_id: Optional[int] = None
+    min_free_spots: Optional[int] = None
+    waitlist: Optional[bool] = None
+    near: Optional[Tuple[float, float]] = None  # (широта, долгота)
+    radius_km: Optional[float] = None
+
+class MatchSearchFacets(BaseModel):
+    sport: Dict[str, int]  # без учёта фильтра по виду спорта
+    day: Dict[str, int]  # "ГГГГ-ММ-ДД" -> количество
+
+class MatchSearchPage(MatchPage):
+    total: int
+    facets: MatchSearchFacets
+
 class TimeSlotPublic(BaseModel):
     id: int
     start_time: datetime
     end_time: datetime
     status: str
     price: int
+    held_until: Optional[datetime] = None  # удержан капитаном до этого момента; в прошлом — удержание истекло
     class Config:
         from_attributes = True
 
+class SlotHold(BaseModel):
+    slot_id: int
+    held_until: datetime
+    ttl_seconds: int
+
+class FieldAvailability(BaseModel):
+    field_id: int
+    # "ГГГГ-ММ-ДД" -> [[начало_мин, длительность_мин, количество, код_статуса, ценовая_полоса, id_первого_слота], ...]
+    days: Dict[str, List[List[int]]]
+
+class AvailabilityGrid(BaseModel):
+    start_date: date
+    days: int
+    statuses: List[str]
+    price_bands: List[int]
+    fields: List[FieldAvailability]
+
+class MatchRecommendation(MatchPublic):
+    score: float  # 0..1, веса признаков — core.recommendations.WEIGHTS
+    average_skill_rating: Optional[float] = None  # подтверждённых игроков с отзывами
+    familiar_players: int = 0  # игроков, с кем уже играли
+
 class MatchDetailsPublic(MatchPublic):
     players: List[UserBase] = []
     waitlist: List[UserBase] = []
@@ -83,6 +185,13 @@ class PlayerReviewCreate(BaseModel):
     review_type: str
     rating: int
 
+    @field_validator('review_type')
+    @classmethod
+    def check_review_type(cls, value: str) -> str:
+        if value not in ('skill', 'sportsmanship'):
+            raise ValueError("review_type must be 'skill' or 'sportsmanship'")
+        return value
+
 class NoShowCreate(BaseModel):
     subject_id: int
 
@@ -105,6 +214,22 @@ class FieldBase(BaseModel):
     price_per_hour: int
     description: Optional[str] = None
     amenities: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    @field_validator('latitude')
+    @classmethod
+    def check_latitude(cls, value: Optional[float]) -> Optional[float]:
+        if value is not None and not -90 <= value <= 90:
+            raise ValueError("latitude must be between -90 and 90")
+        return value
+
+    @field_validator('longitude')
+    @classmethod
+    def check_longitude(cls, value: Optional[float]) -> Optional[float]:
+        if value is not None and not -180 <= value <= 180:
+            raise ValueError("longitude must be between -180 and 180")
+        return value
 
 class FieldCreate(FieldBase):
     pass
@@ -140,6 +265,66 @@ class ScheduleGenerationRequest(BaseModel):
     end_time: time
     slot_duration_minutes: int = 60
 
+class WeekdayHours(BaseModel):
+    weekdays: List[int]  # 0 — понедельник ... 6 — воскресенье
+    start_time: time
+    end_time: time
+
+    @field_validator('weekdays')
+    @classmethod
+    def check_weekdays(cls, value: List[int]) -> List[int]:
+        if not value or any(day < 0 or day > 6 for day in value):
+            raise ValueError("weekdays must be non-empty values from 0 to 6")
+        return sorted(set(value))
+
+class RecurringScheduleRequest(BaseModel):
+    field_ids: Optional[List[int]] = None  # по умолчанию — все поля заведения
+    start_date: date
+    end_date: date
+    rules: List[WeekdayHours]
+    blackout_dates: List[date] = []
+    slot_duration_minutes: int = 60
+
+class PricingRuleCreate(BaseModel):
+    name: Optional[str] = None
+    price: int
+    priority: int = 0
+    weekdays: List[int] = [0, 1, 2, 3, 4, 5, 6]
+    start_time: Optional[time] = None
+    end_time: Optional[time] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+    @field_validator('weekdays')
+    @classmethod
+    def check_weekdays(cls, value: List[int]) -> List[int]:
+        if not value or any(day < 0 or day > 6 for day in value):
+            raise ValueError("weekdays must be non-empty values from 0 to 6")
+        return sorted(set(value))
+
+class PricingRulePublic(PricingRuleCreate):
+    id: int
+    field_id: int
+
+    class Config:
+        from_attributes = True
+
+class ScheduleJobPublic(BaseModel):
+    id: int
+    venue_id: int
+    status: str
+    total_units: int
+    processed_units: int
+    created_slots: int
+    progress: float
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
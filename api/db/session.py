@@ -1,8 +1,13 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from core.config import settings
 
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Параллельный асинхронный стек (asyncpg), включается через DB_ASYNC.
+async_engine = create_async_engine(settings.async_database_url, pool_pre_ping=True) if settings.DB_ASYNC else None
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if settings.DB_ASYNC else None
 Base = declarative_base()
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""Служебные команды обслуживания БД.
+
+    python manage.py check-counters [--fix]
+    python manage.py create-partitions [--months N]
+    python manage.py archive-slots [--keep-months N] [--drop] [--dry-run]
+    python manage.py backfill-coordinates FILE.csv [--dry-run]
+    python manage.py recompute-ratings [--full] [--chunk-size N]
+    python manage.py refresh-leaderboard
+    python manage.py sweep-uploads [--dry-run]
+
+Замеры (bench-*) — в benchmarks.py; модуль и его зависимости (psutil, websockets)
+загружаются, только когда вызвана команда bench-*.
+"""
+import argparse
+import csv
+import sys
+from datetime import date
+
+from core.config import settings
+from db import partitions, repository
+from db.session import SessionLocal, engine
+
+
+def check_counters(args) -> int:
+    with SessionLocal() as db:
+        drift = repository.find_match_counter_drift(db)
+        for row in drift:
+            print(
+                f"match {row.id}: confirmed {row.confirmed_count} -> {row.actual_confirmed}, "
+                f"waitlist {row.waitlist_count} -> {row.actual_waitlist}"
+            )
+        if drift and args.fix:
+            repository.fix_match_counters(db, drift)
+            print(f"fixed {len(drift)} matches")
+        elif not drift:
+            print("counters are consistent")
+    return 1 if drift and not args.fix else 0
+
+
+def create_partitions(args) -> int:
+    current = partitions.month_start(date.today())
+    months = [partitions.add_months(current, n) for n in range(args.months + 1)]
+    with engine.connect() as connection:
+        if not partitions.is_partitioned(connection):
+            print("time_slots is not partitioned")
+            return 1
+    created = partitions.ensure_partitions(engine, months)
+    for month in created:
+        print(f"created {partitions.partition_name(month)}")
+    print(f"{len(created)} partitions created, up to {partitions.partition_name(months[-1])}")
+    return 0
+
+
+def archive_slots(args) -> int:
+    cutoff = partitions.add_months(partitions.month_start(date.today()), -args.keep_months)
+    with engine.begin() as connection:
+        if not partitions.is_partitioned(connection):
+            print("time_slots is not partitioned")
+            return 1
+        expired = [
+            month for month in map(partitions.partition_month, partitions.list_partitions(connection))
+            if month is not None and month < cutoff
+        ]
+    for month in expired:
+        if args.dry_run:
+            print(f"would archive {partitions.partition_name(month)}")
+            continue
+        # Каждая партиция — своя транзакция: DETACH держит блокировку родителя недолго.
+        with engine.begin() as connection:
+            result = partitions.archive_partition(connection, month, drop=args.drop)
+        action = "dropped" if result["dropped"] else f"moved to {partitions.ARCHIVE_SCHEMA}"
+        print(f"{result['partition']}: kept {result['kept']} booked slots, {result['archived']} slots {action}")
+    if not expired:
+        print(f"nothing older than {cutoff.isoformat()}")
+    return 0
+
+
+def backfill_coordinates(args) -> int:
+    """CSV с заголовком: field_id или address, затем latitude, longitude.
+    Строка по адресу проставляет координаты всем полям с этим адресом."""
+    with open(args.file, newline="", encoding="utf-8") as source:
+        rows = list(csv.DictReader(source))
+    coordinates, skipped = [], 0
+    with SessionLocal() as db:
+        by_address = {}
+        if rows and "field_id" not in rows[0]:
+            by_address = repository.field_ids_by_address(db, [row["address"] for row in rows])
+        for row in rows:
+            try:
+                lat, lon = float(row["latitude"]), float(row["longitude"])
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                skipped += 1
+                continue
+            field_ids = [int(row["field_id"])] if row.get("field_id") else by_address.get(row.get("address"), [])
+            if not field_ids:
+                skipped += 1
+            coordinates.extend((field_id, lat, lon) for field_id in field_ids)
+        if args.dry_run:
+            print(f"would update {len(coordinates)} fields, {skipped} rows skipped")
+            return 0
+        updated = 0
+        for start in range(0, len(coordinates), args.batch_size):
+            updated += repository.set_field_coordinates(db, coordinates[start:start + args.batch_size])
+    print(f"updated {updated} fields, {skipped} rows skipped")
+    return 0
+
+
+def recompute_ratings(args) -> int:
+    with SessionLocal() as db:
+        result = repository.recompute_ratings(db, full=args.full, chunk_size=args.chunk_size)
+        print(
+            f"{result['mode']}: {result['reviews_read']} reviews read in {result['read_seconds']}s "
+            f"({result['reviews_per_second']} reviews/s), {result['users_updated']} of {result['users_checked']} "
+            f"users updated, {result['seconds']}s total"
+        )
+        print(
+            f"priors: skill {result['priors']['skill']}, sportsmanship {result['priors']['sportsmanship']}; "
+            f"high-water mark {result['last_review_id']}"
+        )
+        repository.refresh_leaderboard_view(db)
+    return 0
+
+
+def refresh_leaderboard(args) -> int:
+    with SessionLocal() as db:
+        repository.refresh_leaderboard_view(db)
+    print("leaderboard view refreshed")
+    return 0
+
+
+def sweep_uploads(args) -> int:
+    with SessionLocal() as db:
+        removed = repository.sweep_orphan_uploads(db, settings.LIFECYCLE_BATCH_SIZE, dry_run=args.dry_run)
+    print(f"{removed} orphaned files {'found' if args.dry_run else 'removed'}")
+    return 0
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description="PlayoffArena maintenance commands",
+                                     epilog="замеры: python manage.py bench-<name> --help (см. benchmarks.py)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    counters = commands.add_parser("check-counters", help="сверить confirmed_count/waitlist_count с match_players")
+    counters.add_argument("--fix", action="store_true", help="исправить найденные расхождения")
+    counters.set_defaults(handler=check_counters)
+
+    create = commands.add_parser("create-partitions", help="заранее создать месячные партиции time_slots")
+    create.add_argument("--months", type=int, default=settings.SLOT_PARTITIONS_AHEAD_MONTHS,
+                        help="на сколько месяцев вперёд от текущего")
+    create.set_defaults(handler=create_partitions)
+
+    archive = commands.add_parser("archive-slots", help="отсоединить и архивировать старые партиции time_slots")
+    archive.add_argument("--keep-months", type=int, default=settings.SLOT_RETENTION_MONTHS,
+                         help="сколько полных месяцев до текущего оставить в time_slots")
+    archive.add_argument("--drop", action="store_true", help="удалять партиции вместо переноса в схему archive")
+    archive.add_argument("--dry-run", action="store_true", help="только показать, что будет архивировано")
+    archive.set_defaults(handler=archive_slots)
+
+    backfill = commands.add_parser("backfill-coordinates", help="заполнить широту и долготу полей из CSV")
+    backfill.add_argument("file", help="CSV: field_id|address, latitude, longitude")
+    backfill.add_argument("--batch-size", type=int, default=1000, help="полей на одну транзакцию")
+    backfill.add_argument("--dry-run", action="store_true", help="только проверить файл")
+    backfill.set_defaults(handler=backfill_coordinates)
+
+    recompute = commands.add_parser("recompute-ratings", help="пересчитать рейтинги игроков из player_reviews")
+    recompute.add_argument("--full", action="store_true",
+                           help="пересчитать всё и обновить priors (по умолчанию — отзывы после прошлого пересчёта)")
+    recompute.add_argument("--chunk-size", type=int, default=settings.RATING_RECOMPUTE_CHUNK,
+                           help="отзывов на одну выборку и пользователей на одну транзакцию записи")
+    recompute.set_defaults(handler=recompute_ratings)
+
+    leaderboard = commands.add_parser("refresh-leaderboard", help="обновить материализованное представление leaderboard")
+    leaderboard.set_defaults(handler=refresh_leaderboard)
+
+    sweep = commands.add_parser("sweep-uploads", help="удалить загруженные файлы, на которые нет ссылок")
+    sweep.add_argument("--dry-run", action="store_true", help="только посчитать такие файлы")
+    sweep.set_defaults(handler=sweep_uploads)
+
+    if argv and argv[0].startswith("bench-"):
+        import benchmarks
+        benchmarks.add_commands(commands)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""field coordinates
+
+Revision ID: 1c7e4b9a2f60
+Revises: 6a2c5e8d1f47
+Create Date: 2026-10-18 20:04:37.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c7e4b9a2f60'
+down_revision: Union[str, Sequence[str], None] = '6a2c5e8d1f47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Координаты существующих полей заполняются отдельно: `manage.py backfill-coordinates`.
+    op.add_column('fields', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('fields', sa.Column('longitude', sa.Float(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_fields_lat_lon', 'fields', ['latitude', 'longitude'], unique=False,
+            postgresql_where=sa.text('latitude IS NOT NULL'),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_fields_lat_lon', table_name='fields', postgresql_concurrently=True)
+    op.drop_column('fields', 'longitude')
+    op.drop_column('fields', 'latitude')
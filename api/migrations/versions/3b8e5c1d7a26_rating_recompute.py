@@ -0,0 +1,90 @@
+"""per-type review counts and smoothed ratings
+
+Revision ID: 3b8e5c1d7a26
+Revises: f1a9c3e7b520
+Create Date: 2026-10-18 22:05:18.402716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e5c1d7a26'
+down_revision: Union[str, Sequence[str], None] = 'f1a9c3e7b520'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Значения по умолчанию RATING_PRIOR_WEIGHT и RATING_DEFAULT_PRIOR; с другими настройками
+# после миграции нужен `manage.py recompute-ratings --full`.
+PRIOR_WEIGHT = 5.0
+DEFAULT_PRIOR = 3.0
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('skill_reviews_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('sportsmanship_reviews_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('skill_score', sa.Float(), nullable=True))
+    op.add_column('users', sa.Column('sportsmanship_score', sa.Float(), nullable=True))
+    op.create_table('rating_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('last_review_id', sa.Integer(), nullable=False),
+    sa.Column('prior_weight', sa.Float(), nullable=False),
+    sa.Column('skill_prior', sa.Float(), nullable=False),
+    sa.Column('sportsmanship_prior', sa.Float(), nullable=False),
+    sa.Column('recomputed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Средние из общего reviews_count расходились с отзывами: пересчитываем их по player_reviews.
+    op.execute(sa.text("""
+        INSERT INTO rating_state (id, last_review_id, prior_weight, skill_prior, sportsmanship_prior, recomputed_at)
+        SELECT 1, coalesce(max(id), 0), :prior_weight,
+               coalesce(avg(rating) FILTER (WHERE review_type = 'skill'), :default_prior),
+               coalesce(avg(rating) FILTER (WHERE review_type = 'sportsmanship'), :default_prior),
+               now()
+        FROM player_reviews
+    """).bindparams(prior_weight=PRIOR_WEIGHT, default_prior=DEFAULT_PRIOR))
+    op.execute("""
+        WITH totals AS (
+            SELECT subject_id,
+                   count(*) FILTER (WHERE review_type = 'skill') AS skill_n,
+                   coalesce(sum(rating) FILTER (WHERE review_type = 'skill'), 0) AS skill_sum,
+                   count(*) FILTER (WHERE review_type = 'sportsmanship') AS sportsmanship_n,
+                   coalesce(sum(rating) FILTER (WHERE review_type = 'sportsmanship'), 0) AS sportsmanship_sum
+            FROM player_reviews GROUP BY subject_id
+        )
+        UPDATE users u SET
+            skill_reviews_count = t.skill_n,
+            skill_rating = CASE WHEN t.skill_n > 0 THEN t.skill_sum::float / t.skill_n ELSE 0 END,
+            skill_score = CASE WHEN t.skill_n > 0
+                THEN (s.prior_weight * s.skill_prior + t.skill_sum) / (s.prior_weight + t.skill_n) END,
+            sportsmanship_reviews_count = t.sportsmanship_n,
+            sportsmanship_rating = CASE WHEN t.sportsmanship_n > 0
+                THEN t.sportsmanship_sum::float / t.sportsmanship_n ELSE 0 END,
+            sportsmanship_score = CASE WHEN t.sportsmanship_n > 0
+                THEN (s.prior_weight * s.sportsmanship_prior + t.sportsmanship_sum)
+                     / (s.prior_weight + t.sportsmanship_n) END,
+            reviews_count = t.skill_n + t.sportsmanship_n
+        FROM totals t, rating_state s
+        WHERE u.id = t.subject_id AND s.id = 1
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_player_reviews_subject_id', 'player_reviews', ['subject_id'], unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_player_reviews_subject_id', table_name='player_reviews', postgresql_concurrently=True)
+    op.drop_table('rating_state')
+    op.drop_column('users', 'sportsmanship_score')
+    op.drop_column('users', 'skill_score')
+    op.drop_column('users', 'sportsmanship_reviews_count')
+    op.drop_column('users', 'skill_reviews_count')
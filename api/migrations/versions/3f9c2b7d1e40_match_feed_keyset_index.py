@@ -0,0 +1,34 @@
+"""match feed keyset index
+
+Revision ID: 3f9c2b7d1e40
+Revises: 61d5acd93842
+Create Date: 2026-10-18 10:12:41.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2b7d1e40'
+down_revision: Union[str, Sequence[str], None] = '61d5acd93842'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_matches_feed', 'matches', ['starts_at', 'id'], unique=False,
+            postgresql_where=sa.text("status = 'active' AND is_private = false"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_matches_feed', table_name='matches', postgresql_concurrently=True)
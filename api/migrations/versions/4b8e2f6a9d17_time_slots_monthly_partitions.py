@@ -0,0 +1,114 @@
+"""time_slots monthly partitions
+
+Revision ID: 4b8e2f6a9d17
+Revises: 7d3a9e5f1c62
+Create Date: 2026-10-18 16:41:08.203517
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8e2f6a9d17'
+down_revision: Union[str, Sequence[str], None] = '7d3a9e5f1c62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Партиции вперёд от текущего месяца; дальше их создаёт `manage.py create-partitions`.
+MONTHS_AHEAD = 12
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_month_partition(month: date) -> None:
+    op.execute(
+        f"CREATE TABLE time_slots_y{month.year:04d}m{month.month:02d} PARTITION OF time_slots "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    legacy_columns = {column['name'] for column in sa.inspect(bind).get_columns('time_slots')}
+
+    # У партиционированной таблицы уникальность id возможна только вместе с ключом
+    # партиционирования, поэтому внешний ключ matches.slot_id -> time_slots.id снимается.
+    op.drop_constraint('matches_slot_id_fkey', 'matches', type_='foreignkey')
+
+    op.rename_table('time_slots', 'time_slots_legacy')
+    op.execute('ALTER TABLE time_slots_legacy RENAME CONSTRAINT time_slots_pkey TO time_slots_legacy_pkey')
+    op.execute('ALTER INDEX ix_time_slots_id RENAME TO ix_time_slots_legacy_id')
+    op.execute('ALTER INDEX uq_time_slots_field_start RENAME TO uq_time_slots_legacy_field_start')
+
+    op.execute("""
+        CREATE TABLE time_slots (
+            id INTEGER NOT NULL DEFAULT nextval('time_slots_id_seq'),
+            field_id INTEGER NOT NULL,
+            start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            end_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            price_override INTEGER,
+            status timeslotstatus NOT NULL,
+            match_id INTEGER,
+            CONSTRAINT time_slots_field_id_fkey FOREIGN KEY (field_id) REFERENCES fields (id),
+            CONSTRAINT time_slots_match_id_fkey FOREIGN KEY (match_id) REFERENCES matches (id),
+            PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    """)
+    op.execute('ALTER SEQUENCE time_slots_id_seq OWNED BY time_slots.id')
+    op.create_index(op.f('ix_time_slots_id'), 'time_slots', ['id'], unique=False)
+    op.create_index('uq_time_slots_field_start', 'time_slots', ['field_id', 'start_time'], unique=True)
+    op.execute('CREATE TABLE time_slots_default PARTITION OF time_slots DEFAULT')
+
+    first, last = bind.execute(sa.text(
+        "SELECT date_trunc('month', min(start_time))::date, date_trunc('month', max(start_time))::date "
+        "FROM time_slots_legacy"
+    )).one()
+    current = date.today().replace(day=1)
+    month = min(first or current, current)
+    last = max(last or current, _add_months(current, MONTHS_AHEAD))
+    while month <= last:
+        _create_month_partition(month)
+        month = _add_months(month, 1)
+
+    columns = 'id, field_id, start_time, end_time, price_override, status'
+    if 'match_id' in legacy_columns:
+        columns += ', match_id'
+    op.execute(f'INSERT INTO time_slots ({columns}) SELECT {columns} FROM time_slots_legacy')
+    op.drop_table('time_slots_legacy')
+    op.execute('ANALYZE time_slots')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.rename_table('time_slots', 'time_slots_partitioned')
+    op.execute('ALTER TABLE time_slots_partitioned RENAME CONSTRAINT time_slots_pkey TO time_slots_partitioned_pkey')
+    op.execute('ALTER INDEX ix_time_slots_id RENAME TO ix_time_slots_partitioned_id')
+    op.execute('ALTER INDEX uq_time_slots_field_start RENAME TO uq_time_slots_partitioned_field_start')
+    op.execute("""
+        CREATE TABLE time_slots (
+            id INTEGER NOT NULL DEFAULT nextval('time_slots_id_seq'),
+            field_id INTEGER NOT NULL,
+            start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            end_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            price_override INTEGER,
+            status timeslotstatus NOT NULL,
+            match_id INTEGER,
+            CONSTRAINT time_slots_field_id_fkey FOREIGN KEY (field_id) REFERENCES fields (id),
+            CONSTRAINT time_slots_match_id_fkey FOREIGN KEY (match_id) REFERENCES matches (id),
+            CONSTRAINT time_slots_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute('ALTER SEQUENCE time_slots_id_seq OWNED BY time_slots.id')
+    op.execute('INSERT INTO time_slots SELECT * FROM time_slots_partitioned')
+    op.drop_table('time_slots_partitioned')
+    op.create_index(op.f('ix_time_slots_id'), 'time_slots', ['id'], unique=False)
+    op.create_index('uq_time_slots_field_start', 'time_slots', ['field_id', 'start_time'], unique=True)
+    op.create_foreign_key('matches_slot_id_fkey', 'matches', 'time_slots', ['slot_id'], ['id'])
@@ -0,0 +1,32 @@
+"""time_slots match_id index
+
+Revision ID: 5e1b7c3a9d24
+Revises: a7e3d5b9c240
+Create Date: 2026-10-19 10:12:44.530871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1b7c3a9d24'
+down_revision: Union[str, Sequence[str], None] = 'a7e3d5b9c240'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY для партиционированной таблицы не поддерживается — обычным CREATE INDEX.
+    op.create_index(
+        'ix_time_slots_match_id', 'time_slots', ['match_id'], unique=False,
+        postgresql_where=sa.text('match_id IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_time_slots_match_id', table_name='time_slots')
@@ -0,0 +1,38 @@
+"""match search indexes
+
+Revision ID: 6a2c5e8d1f47
+Revises: d4f1a8b36e92
+Create Date: 2026-10-18 19:22:05.731946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a2c5e8d1f47'
+down_revision: Union[str, Sequence[str], None] = 'd4f1a8b36e92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_matches_search', 'matches', ['field_id', 'starts_at'], unique=False,
+            postgresql_where=sa.text("status = 'active' AND is_private = false"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(op.f('ix_fields_sport'), 'fields', ['sport'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_fields_venue_id'), 'fields', ['venue_id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_fields_venue_id'), table_name='fields', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_fields_sport'), table_name='fields', postgresql_concurrently=True)
+        op.drop_index('ix_matches_search', table_name='matches', postgresql_concurrently=True)
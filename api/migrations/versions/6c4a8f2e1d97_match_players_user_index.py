@@ -0,0 +1,34 @@
+"""match_players user_id index
+
+Revision ID: 6c4a8f2e1d97
+Revises: 9d2f6a4c8e13
+Create Date: 2026-10-18 23:12:44.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c4a8f2e1d97'
+down_revision: Union[str, Sequence[str], None] = '9d2f6a4c8e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Знакомые игрока для рекомендаций ищутся по его матчам: user_id не ведущий в uq_match_players_match_user.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_match_players_user_id', 'match_players', ['user_id'], unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_match_players_user_id', table_name='match_players', postgresql_concurrently=True)
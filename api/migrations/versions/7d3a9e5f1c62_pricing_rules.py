@@ -0,0 +1,46 @@
+"""pricing rules
+
+Revision ID: 7d3a9e5f1c62
+Revises: e2b4f81c6a03
+Create Date: 2026-10-18 15:02:44.917310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3a9e5f1c62'
+down_revision: Union[str, Sequence[str], None] = 'e2b4f81c6a03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('pricing_rules',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('field_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=True),
+    sa.Column('price', sa.Integer(), nullable=False),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('weekday_mask', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.Time(), nullable=True),
+    sa.Column('end_time', sa.Time(), nullable=True),
+    sa.Column('start_date', sa.Date(), nullable=True),
+    sa.Column('end_date', sa.Date(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['field_id'], ['fields.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_pricing_rules_id'), 'pricing_rules', ['id'], unique=False)
+    op.create_index(op.f('ix_pricing_rules_field_id'), 'pricing_rules', ['field_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_pricing_rules_field_id'), table_name='pricing_rules')
+    op.drop_index(op.f('ix_pricing_rules_id'), table_name='pricing_rules')
+    op.drop_table('pricing_rules')
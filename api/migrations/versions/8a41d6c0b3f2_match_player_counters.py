@@ -0,0 +1,43 @@
+"""match player counters
+
+Revision ID: 8a41d6c0b3f2
+Revises: 3f9c2b7d1e40
+Create Date: 2026-10-18 11:03:27.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a41d6c0b3f2'
+down_revision: Union[str, Sequence[str], None] = '3f9c2b7d1e40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('matches', sa.Column('confirmed_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('matches', sa.Column('waitlist_count', sa.Integer(), server_default='0', nullable=False))
+    # Бэкфилл из фактических строк match_players.
+    op.execute("""
+        UPDATE matches m
+        SET confirmed_count = c.confirmed, waitlist_count = c.waitlist
+        FROM (
+            SELECT match_id,
+                   count(*) FILTER (WHERE status = 'confirmed') AS confirmed,
+                   count(*) FILTER (WHERE status = 'waitlist') AS waitlist
+            FROM match_players
+            GROUP BY match_id
+        ) c
+        WHERE c.match_id = m.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('matches', 'waitlist_count')
+    op.drop_column('matches', 'confirmed_count')
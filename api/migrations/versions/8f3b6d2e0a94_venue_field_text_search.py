@@ -0,0 +1,75 @@
+"""venue and field text search
+
+Revision ID: 8f3b6d2e0a94
+Revises: 1c7e4b9a2f60
+Create Date: 2026-10-18 20:47:13.660219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3b6d2e0a94'
+down_revision: Union[str, Sequence[str], None] = '1c7e4b9a2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VENUE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+VENUE_SEARCH_TEXT = "lower(coalesce(title, '') || ' ' || coalesce(description, ''))"
+FIELD_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', sport), 'A') || "
+    "setweight(to_tsvector('simple', address), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(amenities, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'D')"
+)
+FIELD_SEARCH_TEXT = "lower(sport || ' ' || address || ' ' || coalesce(amenities, '') || ' ' || coalesce(description, ''))"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # pg_trgm входит в contrib (есть в образе postgres:16-alpine). Если расширения нет,
+    # триграммные индексы не создаются, а поиск работает индексом в памяти (core/text_search.py).
+    has_trgm = bind.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')"
+    )).scalar()
+    if has_trgm:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, vector, search_text in (
+        ('venue_profiles', VENUE_SEARCH_VECTOR, VENUE_SEARCH_TEXT),
+        ('fields', FIELD_SEARCH_VECTOR, FIELD_SEARCH_TEXT),
+    ):
+        op.add_column(table, sa.Column(
+            'search_vector', postgresql.TSVECTOR(), sa.Computed(vector, persisted=True), nullable=True,
+        ))
+        op.add_column(table, sa.Column('search_text', sa.Text(), sa.Computed(search_text, persisted=True), nullable=True))
+    with op.get_context().autocommit_block():
+        for table in ('venue_profiles', 'fields'):
+            op.create_index(
+                f'ix_{table}_search_vector', table, ['search_vector'], unique=False,
+                postgresql_using='gin', postgresql_concurrently=True,
+            )
+            if has_trgm:
+                op.create_index(
+                    f'ix_{table}_search_text', table, ['search_text'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'},
+                    postgresql_concurrently=True,
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for table in ('fields', 'venue_profiles'):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS ix_{table}_search_text')
+            op.drop_index(f'ix_{table}_search_vector', table_name=table, postgresql_concurrently=True)
+    for table in ('fields', 'venue_profiles'):
+        op.drop_column(table, 'search_text')
+        op.drop_column(table, 'search_vector')
@@ -0,0 +1,44 @@
+"""leaderboard materialized view
+
+Revision ID: 9d2f6a4c8e13
+Revises: 3b8e5c1d7a26
+Create Date: 2026-10-18 22:41:06.275913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2f6a4c8e13'
+down_revision: Union[str, Sequence[str], None] = '3b8e5c1d7a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+METRICS = ('skill', 'sportsmanship')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Запасной путь таблицы лидеров (LEADERBOARD_INDEX_ENABLED=false); обновляется
+    # `manage.py refresh-leaderboard` — CONCURRENTLY, поэтому нужен уникальный индекс.
+    op.execute("""
+        CREATE MATERIALIZED VIEW leaderboard AS
+        SELECT id AS user_id, position, level,
+               skill_score, skill_reviews_count, sportsmanship_score, sportsmanship_reviews_count
+        FROM users
+        WHERE skill_score IS NOT NULL OR sportsmanship_score IS NOT NULL
+    """)
+    op.create_index('ix_leaderboard_user_id', 'leaderboard', ['user_id'], unique=True)
+    for metric in METRICS:
+        op.create_index(
+            f'ix_leaderboard_{metric}', 'leaderboard', [sa.text(f'{metric}_score DESC'), 'user_id'], unique=False,
+            postgresql_where=sa.text(f'{metric}_score IS NOT NULL'),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP MATERIALIZED VIEW leaderboard')
@@ -0,0 +1,37 @@
+"""time slot holds
+
+Revision ID: 9e6c2a4f7b35
+Revises: 4b8e2f6a9d17
+Create Date: 2026-10-18 17:26:51.640392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e6c2a4f7b35'
+down_revision: Union[str, Sequence[str], None] = '4b8e2f6a9d17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('time_slots', sa.Column('held_by', sa.Integer(), nullable=True))
+    op.add_column('time_slots', sa.Column('held_until', sa.DateTime(), nullable=True))
+    op.create_foreign_key('time_slots_held_by_fkey', 'time_slots', 'users', ['held_by'], ['id'])
+    op.create_index(
+        'ix_time_slots_held_by', 'time_slots', ['held_by'], unique=False,
+        postgresql_where=sa.text('held_by IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_time_slots_held_by', table_name='time_slots')
+    op.drop_constraint('time_slots_held_by_fkey', 'time_slots', type_='foreignkey')
+    op.drop_column('time_slots', 'held_until')
+    op.drop_column('time_slots', 'held_by')
@@ -0,0 +1,38 @@
+"""uploaded file references
+
+Revision ID: a7e3d5b9c240
+Revises: 6c4a8f2e1d97
+Create Date: 2026-10-18 23:48:31.906417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e3d5b9c240'
+down_revision: Union[str, Sequence[str], None] = '6c4a8f2e1d97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = {'ix_users_photo_url_uploaded': 'photo_url', 'ix_users_achievements_doc_uploaded': 'achievements_doc'}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Уборка файлов без ссылок проверяет пачки URL; внешние ссылки (Google) в индекс не попадают.
+    with op.get_context().autocommit_block():
+        for name, column in COLUMNS.items():
+            op.create_index(
+                name, 'users', [column], unique=False,
+                postgresql_where=sa.text(f"{column} LIKE '/static/%'"), postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in COLUMNS:
+            op.drop_index(name, table_name='users', postgresql_concurrently=True)
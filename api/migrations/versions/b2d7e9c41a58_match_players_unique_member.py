@@ -0,0 +1,47 @@
+"""match_players unique member
+
+Revision ID: b2d7e9c41a58
+Revises: 9e6c2a4f7b35
+Create Date: 2026-10-18 18:03:17.528904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d7e9c41a58'
+down_revision: Union[str, Sequence[str], None] = '9e6c2a4f7b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Дубли от гонок старого вступления: оставляем самую раннюю запись и пересчитываем счётчики.
+    op.execute("""
+        DELETE FROM match_players a
+        USING match_players b
+        WHERE a.match_id = b.match_id AND a.user_id = b.user_id AND a.id > b.id
+    """)
+    op.execute("""
+        UPDATE matches m
+        SET confirmed_count = c.confirmed, waitlist_count = c.waitlist
+        FROM (
+            SELECT match_id,
+                   count(*) FILTER (WHERE status = 'confirmed') AS confirmed,
+                   count(*) FILTER (WHERE status = 'waitlist') AS waitlist
+            FROM match_players
+            GROUP BY match_id
+        ) c
+        WHERE c.match_id = m.id
+          AND (m.confirmed_count <> c.confirmed OR m.waitlist_count <> c.waitlist)
+    """)
+    op.create_index('uq_match_players_match_user', 'match_players', ['match_id', 'user_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_match_players_match_user', table_name='match_players')
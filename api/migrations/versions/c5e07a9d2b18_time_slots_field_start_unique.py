@@ -0,0 +1,80 @@
+"""time_slots field/start unique index
+
+Revision ID: c5e07a9d2b18
+Revises: 8a41d6c0b3f2
+Create Date: 2026-10-18 13:05:27.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e07a9d2b18'
+down_revision: Union[str, Sequence[str], None] = '8a41d6c0b3f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+DOUBLE_BOOKED_SQL = """
+SELECT s.field_id, s.start_time, array_agg(s.id ORDER BY s.id) AS slot_ids,
+       array_agg(m.id ORDER BY s.id) AS match_ids
+FROM time_slots s JOIN matches m ON m.slot_id = s.id
+GROUP BY s.field_id, s.start_time
+HAVING count(*) > 1
+ORDER BY s.field_id, s.start_time
+LIMIT 20
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Два матча на копиях одного слота автоматически не развести: уникальный индекс на таких
+    # данных не построится, а CONCURRENTLY оставил бы его INVALID. Останавливаемся до изменений.
+    double_booked = op.get_bind().execute(sa.text(DOUBLE_BOOKED_SQL)).all()
+    if double_booked:
+        listed = "\n".join(
+            f"  field {row.field_id} at {row.start_time}: slots {row.slot_ids}, matches {row.match_ids}"
+            for row in double_booked
+        )
+        raise RuntimeError(
+            "uq_time_slots_field_start: a (field_id, start_time) slot is booked more than once. "
+            "Move or cancel all but one match per slot (matches.slot_id, time_slots.match_id) "
+            "and run the migration again. First conflicts:\n" + listed
+        )
+    # Дубликаты от старой генерации: оставляем слот, на который ссылается матч (иначе самый ранний id).
+    op.execute("""
+        DELETE FROM time_slots t
+        USING (
+            SELECT id, row_number() OVER (
+                PARTITION BY field_id, start_time
+                ORDER BY EXISTS (SELECT 1 FROM matches m WHERE m.slot_id = s.id) DESC, id
+            ) AS rn
+            FROM time_slots s
+        ) d
+        WHERE t.id = d.id AND d.rn > 1
+          AND NOT EXISTS (SELECT 1 FROM matches m WHERE m.slot_id = t.id)
+    """)
+    with op.get_context().autocommit_block():
+        # Остаток прошлой неудачной попытки: INVALID-индекс не используется, но мешает создать новый.
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS uq_time_slots_field_start')
+        try:
+            op.create_index(
+                'uq_time_slots_field_start', 'time_slots', ['field_id', 'start_time'], unique=True,
+                postgresql_concurrently=True,
+            )
+        except sa.exc.IntegrityError as e:
+            # Дубликат появился после очистки (старая версия приложения ещё генерирует слоты).
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS uq_time_slots_field_start')
+            raise RuntimeError(
+                "uq_time_slots_field_start: new duplicate slots appeared during the migration. "
+                "Stop schedule generation on the old release and run the migration again."
+            ) from e
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('uq_time_slots_field_start', table_name='time_slots', postgresql_concurrently=True)
@@ -0,0 +1,40 @@
+"""lifecycle scheduler indexes
+
+Revision ID: d4f1a8b36e92
+Revises: b2d7e9c41a58
+Create Date: 2026-10-18 18:47:30.114682
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f1a8b36e92'
+down_revision: Union[str, Sequence[str], None] = 'b2d7e9c41a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY для партиционированной таблицы не поддерживается — time_slots обычным CREATE INDEX.
+    op.create_index(
+        'ix_time_slots_available_start', 'time_slots', ['start_time'], unique=False,
+        postgresql_where=sa.text("status = 'available'"),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_matches_active_starts', 'matches', ['starts_at'], unique=False,
+            postgresql_where=sa.text("status = 'active'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_matches_active_starts', table_name='matches', postgresql_concurrently=True)
+    op.drop_index('ix_time_slots_available_start', table_name='time_slots')
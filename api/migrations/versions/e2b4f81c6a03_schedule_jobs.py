@@ -0,0 +1,55 @@
+"""schedule jobs
+
+Revision ID: e2b4f81c6a03
+Revises: c5e07a9d2b18
+Create Date: 2026-10-18 14:21:09.381552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b4f81c6a03'
+down_revision: Union[str, Sequence[str], None] = 'c5e07a9d2b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schedule_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('created_by', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Enum('pending', 'running', 'completed', 'failed', name='schedulejobstatus'), nullable=False),
+    sa.Column('params', sa.JSON(), nullable=False),
+    sa.Column('total_units', sa.Integer(), nullable=False),
+    sa.Column('processed_units', sa.Integer(), nullable=False),
+    sa.Column('created_slots', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue_profiles.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_schedule_jobs_id'), 'schedule_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_schedule_jobs_venue_id'), 'schedule_jobs', ['venue_id'], unique=False)
+    # Подбор незавершённых задач при старте.
+    op.create_index(
+        'ix_schedule_jobs_unfinished', 'schedule_jobs', ['updated_at'], unique=False,
+        postgresql_where=sa.text("status IN ('pending', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_schedule_jobs_unfinished', table_name='schedule_jobs')
+    op.drop_index(op.f('ix_schedule_jobs_venue_id'), table_name='schedule_jobs')
+    op.drop_index(op.f('ix_schedule_jobs_id'), table_name='schedule_jobs')
+    op.drop_table('schedule_jobs')
+    sa.Enum(name='schedulejobstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,68 @@
+"""player_reviews unique review
+
+Revision ID: f1a9c3e7b520
+Revises: 8f3b6d2e0a94
+Create Date: 2026-10-18 21:26:40.915372
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a9c3e7b520'
+down_revision: Union[str, Sequence[str], None] = '8f3b6d2e0a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE_REVIEW = 'uq_player_reviews_match_reviewer_subject_type'
+RATING_COLUMNS = ('sportsmanship_rating', 'skill_rating', 'no_show_count', 'reviews_count')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    # Начальная миграция не содержит отзывов и рейтингов пользователей (в рабочих базах они
+    # появились вне Alembic): досоздаём недостающее, существующее не трогаем.
+    user_columns = {column['name'] for column in inspector.get_columns('users')}
+    for name in RATING_COLUMNS:
+        if name not in user_columns:
+            column_type = sa.Float() if name.endswith('_rating') else sa.Integer()
+            op.add_column('users', sa.Column(name, column_type, server_default='0', nullable=False))
+
+    if not inspector.has_table('player_reviews'):
+        op.create_table('player_reviews',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('match_id', sa.Integer(), nullable=False),
+        sa.Column('reviewer_id', sa.Integer(), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('review_type', sa.Enum('sportsmanship', 'skill', name='reviewtype'), nullable=False),
+        sa.Column('rating', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['match_id'], ['matches.id'], ),
+        sa.ForeignKeyConstraint(['reviewer_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['subject_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('match_id', 'reviewer_id', 'subject_id', 'review_type', name=UNIQUE_REVIEW)
+        )
+        op.create_index(op.f('ix_player_reviews_id'), 'player_reviews', ['id'], unique=False)
+        return
+
+    # Дубли от гонок старой обработки: оставляем самый ранний отзыв.
+    op.execute("""
+        DELETE FROM player_reviews a
+        USING player_reviews b
+        WHERE a.match_id = b.match_id AND a.reviewer_id = b.reviewer_id
+          AND a.subject_id = b.subject_id AND a.review_type = b.review_type AND a.id > b.id
+    """)
+    op.create_unique_constraint(
+        UNIQUE_REVIEW, 'player_reviews', ['match_id', 'reviewer_id', 'subject_id', 'review_type']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Таблицу и колонки рейтинга не удаляем: до этой ревизии они могли существовать вне Alembic.
+    op.drop_constraint(UNIQUE_REVIEW, 'player_reviews', type_='unique')
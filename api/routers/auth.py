@@ -2,13 +2,15 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import timedelta
 import re
 
 from authlib.integrations.starlette_client import OAuth
 from db import models, schemas, repository
-from core.security import verify_password, create_access_token, get_db, ACCESS_TOKEN_EXPIRE_MINUTES
+from core.security import create_access_token, get_db, ACCESS_TOKEN_EXPIRE_MINUTES
+from core.password_pool import password_pool
 from core.config import settings
 
 router = APIRouter()
@@ -33,20 +35,21 @@ def validate_password(password: str):
     return True
 
 @router.post("/register", response_model=schemas.UserBase, status_code=status.HTTP_201_CREATED)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = repository.get_user_by_email(db, email=user.email)
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(repository.get_user_by_email, db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
     
     validate_password(user.password)
     
-    new_user = repository.create_user(db=db, user=user)
+    hashed_password = await password_pool.hash_async(user.password)
+    new_user = await run_in_threadpool(repository.create_user, db=db, user=user, hashed_password=hashed_password)
     return new_user
 
 @router.post("/login", response_model=schemas.Token)
-def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = repository.get_user_by_email(db, email=form_data.username)
-    if not user or not verify_password(form_data.password, user.pass_hash):
+async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await run_in_threadpool(repository.get_user_by_email, db, email=form_data.username)
+    if not user or not await password_pool.verify_async(form_data.password, user.pass_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неправильный email или пароль",
@@ -70,7 +73,7 @@ async def auth_via_google(request: Request, db: Session = Depends(get_db)):
     token = await oauth.google.authorize_access_token(request)
     user_info = await oauth.google.parse_id_token(request, token)
     
-    user = repository.get_or_create_oauth_user(db, user_info)
+    user = await run_in_threadpool(repository.get_or_create_oauth_user, db, user_info)
     
     access_token = create_access_token(data={"sub": user.email})
     
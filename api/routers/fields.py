@@ -1,17 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+import json
+from typing import List, Optional
 from datetime import date
 
-from db import models, schemas, repository
-from core.security import get_db, get_current_user
+from db import models, schemas, repository, async_repository
+from core.security import get_db, get_async_db, get_current_user
+from core.config import settings
+from core.response_cache import response_cache
+from core import geo
 
 router = APIRouter()
+field_list_adapter = TypeAdapter(List[schemas.FieldPublic])
+nearby_list_adapter = TypeAdapter(List[schemas.FieldNearby])
+slot_list_adapter = TypeAdapter(List[schemas.TimeSlotPublic])
 
-@router.get("", response_model=List[schemas.FieldPublic])
-def get_all_fields(db: Session = Depends(get_db)):
-    """Возвращает список всех полей."""
-    return repository.get_all_fields(db)
+@router.get("", response_model=List[schemas.FieldNearby])
+async def get_all_fields(
+    request: Request,
+    near: Optional[str] = Query(None, description="широта,долгота"),
+    radius_km: float = Query(settings.GEO_MAX_RADIUS_KM, gt=0, le=settings.GEO_MAX_RADIUS_KM),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """Возвращает список всех полей; с near — ближайшие к точке (не больше limit в радиусе radius_km)."""
+    point = None
+    if near:
+        try:
+            point = geo.parse_point(near)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный параметр near")
+    cached = await response_cache.lookup(request, "fields")
+    if cached.response:
+        return cached.response
+    if point is None:
+        fields = await run_in_threadpool(repository.get_all_fields, db)
+        return await response_cache.store(cached, field_list_adapter.dump_json(field_list_adapter.validate_python(fields, from_attributes=True)))
+    fields = await run_in_threadpool(repository.get_fields_near, db, *point, radius_km, limit)
+    return await response_cache.store(cached, nearby_list_adapter.dump_json(nearby_list_adapter.validate_python(fields, from_attributes=True)))
+
+def _owned_field(db: Session, field_id: int, current_user: models.User) -> models.Field:
+    db_field = repository.get_field_by_id(db, field_id)
+    if not db_field or not db_field.venue or db_field.venue.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    return db_field
+
+AVAILABILITY_MAX_FIELDS = 100
+
+@router.get("/availability", response_model=schemas.AvailabilityGrid)
+async def get_availability(
+    request: Request,
+    start_date: date,
+    days: int = Query(7, ge=1, le=31),
+    field_ids: Optional[List[int]] = Query(None),
+    venue_id: Optional[int] = None,
+    db = Depends(get_async_db)
+):
+    """Сетка доступности нескольких полей (или всех полей заведения) за диапазон дней одним запросом."""
+    if venue_id is not None:
+        field_ids = await async_repository.get_venue_field_ids(db, venue_id=venue_id)
+    elif not field_ids:
+        raise HTTPException(status_code=400, detail="Укажите field_ids или venue_id")
+    field_ids = sorted(set(field_ids))
+    if len(field_ids) > AVAILABILITY_MAX_FIELDS:
+        raise HTTPException(status_code=400, detail="Слишком много полей в запросе")
+    cached = await response_cache.lookup(request, "fields", *(f"slots:{field_id}" for field_id in field_ids))
+    if cached.response:
+        return cached.response
+    grid = await async_repository.get_availability(db, field_ids=field_ids, start_date=start_date, days=days)
+    return await response_cache.store(cached, json.dumps(grid, separators=(",", ":")))
 
 @router.post("/{field_id}/generate-schedule", status_code=status.HTTP_201_CREATED)
 def generate_schedule(
@@ -21,14 +80,84 @@ def generate_schedule(
     current_user: models.User = Depends(get_current_user)
 ):
     """Генерирует расписание (слоты) для поля. Доступно только владельцу."""
-    db_field = repository.get_field_by_id(db, field_id)
-    if not db_field or not db_field.venue or db_field.venue.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Недостаточно прав")
-
+    db_field = _owned_field(db, field_id, current_user)
     count = repository.generate_schedule_for_field(db, field=db_field, schedule_data=schedule_data)
-    return {"message": f"Successfully generated {count} new time slots."}
+    return {"message": f"Successfully generated {count} new time slots.", "created": count}
 
 @router.get("/{field_id}/slots", response_model=List[schemas.TimeSlotPublic])
-def get_available_slots(field_id: int, on_date: date, db: Session = Depends(get_db)):
+async def get_available_slots(field_id: int, on_date: date, request: Request, db = Depends(get_async_db)):
     """Получает список слотов для поля на указанную дату."""
-    return repository.get_slots_for_field_on_date(db, field_id=field_id, on_date=on_date)
\ No newline at end of file
+    cached = await response_cache.lookup(request, f"slots:{field_id}", "fields")
+    if cached.response:
+        return cached.response
+    slots = await async_repository.get_slots_for_field_on_date(db, field_id=field_id, on_date=on_date)
+    return await response_cache.store(cached, slot_list_adapter.dump_json(slot_list_adapter.validate_python(slots, from_attributes=True)))
+
+@router.post("/slots/{slot_id}/hold", response_model=schemas.SlotHold)
+def hold_slot(slot_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """Удерживает слот за текущим пользователем на SLOT_HOLD_SECONDS, пока он заполняет форму матча."""
+    result = repository.hold_slot(db, slot_id=slot_id, user=current_user, ttl_seconds=settings.SLOT_HOLD_SECONDS)
+    if result == "slot_not_found":
+        raise HTTPException(status_code=404, detail="Слот не найден")
+    if result == "slot_not_available":
+        raise HTTPException(status_code=400, detail="Слот уже занят")
+    return {"slot_id": result.id, "held_until": result.held_until, "ttl_seconds": settings.SLOT_HOLD_SECONDS}
+
+@router.delete("/slots/{slot_id}/hold", status_code=status.HTTP_204_NO_CONTENT)
+def release_slot_hold(slot_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """Снимает удержание слота текущим пользователем."""
+    repository.release_slot_hold(db, slot_id=slot_id, user=current_user)
+
+def _check_pricing_rule(rule: schemas.PricingRuleCreate) -> None:
+    if rule.price < 0:
+        raise HTTPException(status_code=400, detail="Цена не может быть отрицательной")
+    if rule.start_time and rule.end_time and rule.start_time >= rule.end_time:
+        raise HTTPException(status_code=400, detail="Некорректное окно времени")
+    if rule.start_date and rule.end_date and rule.start_date > rule.end_date:
+        raise HTTPException(status_code=400, detail="Некорректный диапазон дат")
+
+@router.get("/{field_id}/pricing-rules", response_model=List[schemas.PricingRulePublic])
+def get_pricing_rules(field_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """Правила цен поля (по убыванию приоритета). Доступно только владельцу."""
+    _owned_field(db, field_id, current_user)
+    return repository.get_pricing_rules(db, field_id)
+
+@router.post("/{field_id}/pricing-rules", response_model=schemas.PricingRulePublic, status_code=status.HTTP_201_CREATED)
+def create_pricing_rule(
+    field_id: int,
+    rule: schemas.PricingRuleCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Добавляет правило цены (час пик, выходные, сезон). Доступно только владельцу."""
+    _owned_field(db, field_id, current_user)
+    _check_pricing_rule(rule)
+    return repository.create_pricing_rule(db, field_id=field_id, rule=rule)
+
+@router.put("/{field_id}/pricing-rules/{rule_id}", response_model=schemas.PricingRulePublic)
+def update_pricing_rule(
+    field_id: int,
+    rule_id: int,
+    rule: schemas.PricingRuleCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    _owned_field(db, field_id, current_user)
+    _check_pricing_rule(rule)
+    db_rule = repository.get_pricing_rule(db, rule_id)
+    if not db_rule or db_rule.field_id != field_id:
+        raise HTTPException(status_code=404, detail="Правило не найдено")
+    return repository.update_pricing_rule(db, db_rule=db_rule, rule=rule)
+
+@router.delete("/{field_id}/pricing-rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_pricing_rule(
+    field_id: int,
+    rule_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    _owned_field(db, field_id, current_user)
+    db_rule = repository.get_pricing_rule(db, rule_id)
+    if not db_rule or db_rule.field_id != field_id:
+        raise HTTPException(status_code=404, detail="Правило не найдено")
+    repository.delete_pricing_rule(db, db_rule=db_rule)
@@ -1,7 +1,36 @@
 from fastapi import APIRouter
+from core.security import principal_cache
+from core.password_pool import password_pool
+from core.response_cache import response_cache
+from core import invalidation
+from core.realtime import match_rooms
+from core.pricing import pricing_engine
+from core.lifecycle import lifecycle_scheduler
+from core.geo import geo_index
+from core.text_search import text_search_index
+from core.leaderboard import leaderboard_index
+from core.recommendations import roster_index
+from core.uploads import upload_store
 
 router = APIRouter()
 
 @router.get("/")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@router.get("/metrics")
+async def metrics():
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_pool": password_pool.stats(),
+        "response_cache": response_cache.stats(),
+        "invalidation_bus": invalidation.stats.as_dict(),
+        "match_rooms": match_rooms.stats(),
+        "pricing_cache": pricing_engine.stats(),
+        "lifecycle": lifecycle_scheduler.stats.as_dict(),
+        "geo_index": geo_index.stats(),
+        "text_search": text_search_index.stats(),
+        "leaderboard": leaderboard_index.stats(),
+        "recommendations": roster_index.stats(),
+        "uploads": upload_store.stats.as_dict(),
+    }
\ No newline at end of file
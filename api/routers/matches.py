@@ -1,8 +1,14 @@
-from fastapi import APIRouter, Depends, status, HTTPException
+from contextlib import asynccontextmanager
+from datetime import date, time
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request, Response, WebSocket
 from sqlalchemy.orm import Session
-from typing import List
-from db import models, schemas, repository
-from core.security import get_current_user, get_db
+from typing import List, Optional
+from db import models, schemas, repository, async_repository
+from core.security import get_current_user, get_db, get_async_db
+from core.response_cache import response_cache
+from core.realtime import match_rooms
+from core.config import settings
+from core import geo
 
 router = APIRouter()
 
@@ -20,54 +26,152 @@ def create_new_match(
     newly_created_match = repository.get_match_by_id(db, result.id)
     return newly_created_match
 
-@router.get("", response_model=List[schemas.MatchPublic])
-def get_all_active_matches(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return repository.get_active_matches(db, skip=skip, limit=limit)
+@router.get("", response_model=schemas.MatchPage)
+async def get_all_active_matches(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    skip: int = Query(0, ge=0, deprecated=True),
+    db = Depends(get_async_db)
+):
+    """Публичная лента активных матчей. Следующая страница — по next_cursor; skip оставлен для совместимости."""
+    cached = await response_cache.lookup(request, "matches", "fields")
+    if cached.response:
+        return cached.response
+    after = None
+    if cursor:
+        try:
+            after = repository.decode_match_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+    matches = await async_repository.get_active_matches(db, skip=skip, limit=limit, after=after)
+    next_cursor = repository.encode_match_cursor(matches[-1]) if len(matches) == limit else None
+    page = schemas.MatchPage(items=matches, next_cursor=next_cursor)
+    return await response_cache.store(cached, page.model_dump_json())
+
+@router.get("/search", response_model=schemas.MatchSearchPage)
+async def search_matches(
+    request: Request,
+    sport: Optional[List[str]] = Query(None),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    time_from: Optional[time] = None,
+    time_to: Optional[time] = None,
+    price_min: Optional[int] = Query(None, ge=0),
+    price_max: Optional[int] = Query(None, ge=0),
+    venue_id: Optional[int] = None,
+    min_free_spots: Optional[int] = Query(None, ge=1),
+    waitlist: Optional[bool] = None,
+    near: Optional[str] = Query(None, description="широта,долгота"),
+    radius_km: float = Query(settings.GEO_DEFAULT_RADIUS_KM, gt=0, le=settings.GEO_MAX_RADIUS_KM),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    db = Depends(get_async_db)
+):
+    """Поиск активных публичных матчей с фильтрами и счётчиками по видам спорта и дням."""
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from позже date_to")
+    point = None
+    if near:
+        try:
+            point = geo.parse_point(near)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный параметр near")
+    cached = await response_cache.lookup(request, "matches", "fields")
+    if cached.response:
+        return cached.response
+    after = None
+    if cursor:
+        try:
+            after = repository.decode_match_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+    params = schemas.MatchSearchParams(
+        sports=sport, date_from=date_from, date_to=date_to, time_from=time_from, time_to=time_to,
+        price_min=price_min, price_max=price_max, venue_id=venue_id,
+        min_free_spots=min_free_spots, waitlist=waitlist,
+        near=point, radius_km=radius_km if point else None,
+    )
+    page = await async_repository.search_matches(db, params=params, limit=limit, after=after)
+    return await response_cache.store(cached, page.model_dump_json())
+
+def _details_response(details_json: str) -> Response:
+    return Response(content=details_json, media_type="application/json")
+
+@router.get("/recommended", response_model=List[schemas.MatchRecommendation])
+async def get_recommended_matches(
+    limit: int = Query(20, ge=1, le=100),
+    db = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Активные публичные матчи со свободными местами, подобранные под уровень, позицию,
+    надёжность и знакомых текущего пользователя; лучшие первыми."""
+    return await async_repository.recommend_matches(
+        db, current_user, limit, settings.RECOMMENDATIONS_CO_PLAYERS_LIMIT
+    )
 
 @router.get("/invite/{invite_code}", response_model=schemas.MatchDetailsPublic)
 def get_match_by_invite(invite_code: str, db: Session = Depends(get_db)):
     db_match = repository.get_match_by_invite_code(db, invite_code=invite_code)
     if db_match is None:
         raise HTTPException(status_code=404, detail="Матч по этому приглашению не найден")
-    return repository.get_match_by_id(db, match_id=db_match.id)
+    return _details_response(repository.get_match_details_json(db, match_id=db_match.id))
 
 @router.get("/{match_id}", response_model=schemas.MatchDetailsPublic)
-def get_match_details(match_id: int, db: Session = Depends(get_db)):
-    db_match = repository.get_match_by_id(db, match_id=match_id)
-    if db_match is None:
+async def get_match_details(match_id: int, request: Request, db = Depends(get_async_db)):
+    cached = await response_cache.lookup(request, f"match:{match_id}", "fields")
+    if cached.response:
+        return cached.response
+    details_json = await async_repository.get_match_details_json(db, match_id=match_id)
+    if details_json is None:
         raise HTTPException(status_code=404, detail="Матч не найден")
-    return db_match
+    return await response_cache.store(cached, details_json)
+
+@router.websocket("/{match_id}/ws")
+async def match_room(websocket: WebSocket, match_id: int):
+    """Живые изменения матча: сначала снимок, затем дельты (player_joined, player_left, status_changed)."""
+    # Подписка раньше снимка: дельты, пришедшие во время чтения, не теряются.
+    subscriber = match_rooms.subscribe(match_id)
+    try:
+        # Короткая сессия только на снимок: тысячи открытых сокетов не должны держать соединения пула.
+        async with asynccontextmanager(get_async_db)() as db:
+            details_json = await async_repository.get_match_details_json(db, match_id=match_id)
+        if details_json is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        await websocket.accept()
+        await websocket.send_text('{"type":"snapshot","match":' + details_json + '}')
+        await match_rooms.serve(websocket, subscriber)
+    finally:
+        match_rooms.unsubscribe(match_id, subscriber)
 
 @router.post("/{match_id}/join", response_model=schemas.MatchDetailsPublic)
-def join_match(match_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_match = repository.get_match_by_id(db, match_id=match_id)
+async def join_match(match_id: int, db = Depends(get_async_db), current_user: models.User = Depends(get_current_user)):
+    db_match = await async_repository.get_match_row(db, match_id=match_id)
     if not db_match:
         raise HTTPException(status_code=404, detail="Матч не найден")
-    repository.add_player_to_match(db=db, user=current_user, match=db_match)
-    return repository.get_match_by_id(db, match_id=match_id)
+    return _details_response(await async_repository.add_player_to_match(db, user=current_user, match=db_match, details=True))
 
 @router.post("/{match_id}/leave", response_model=schemas.MatchDetailsPublic)
-def leave_match(match_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_match = repository.get_match_by_id(db, match_id=match_id)
+async def leave_match(match_id: int, db = Depends(get_async_db), current_user: models.User = Depends(get_current_user)):
+    db_match = await async_repository.get_match_row(db, match_id=match_id)
     if not db_match:
         raise HTTPException(status_code=404, detail="Матч не найден")
-    updated_match = repository.remove_player_from_match(db=db, user=current_user, match=db_match)
-    if updated_match is None:
+    details_json = await async_repository.remove_player_from_match(db, user=current_user, match=db_match, details=True)
+    if details_json is None:
         raise HTTPException(status_code=400, detail="Капитан не может покинуть матч")
-    return repository.get_match_by_id(db, match_id=match_id)
+    return _details_response(details_json)
 
 @router.post("/{match_id}/complete", response_model=schemas.MatchDetailsPublic)
 def complete_match(match_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_match = repository.get_match_by_id(db, match_id=match_id)
+    db_match = repository.get_match_row(db, match_id=match_id)
     if not db_match or db_match.captain_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
-    repository.update_match_status(db, match=db_match, status=models.MatchStatus.completed)
-    return repository.get_match_by_id(db, match_id=match_id)
+    return _details_response(repository.update_match_status(db, match=db_match, status=models.MatchStatus.completed, details=True))
 
 @router.post("/{match_id}/cancel", response_model=schemas.MatchDetailsPublic)
 def cancel_match(match_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_match = repository.get_match_by_id(db, match_id=match_id)
+    db_match = repository.get_match_row(db, match_id=match_id)
     if not db_match or db_match.captain_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
-    repository.update_match_status(db, match=db_match, status=models.MatchStatus.cancelled)
-    return repository.get_match_by_id(db, match_id=match_id)
\ No newline at end of file
+    return _details_response(repository.update_match_status(db, match=db_match, status=models.MatchStatus.cancelled, details=True))
\ No newline at end of file
@@ -12,11 +12,11 @@ def submit_match_reviews(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    match = repository.get_match_by_id(db, match_id)
+    match = repository.get_match_row(db, match_id)
     if not match or match.captain_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
     if match.status != models.MatchStatus.completed:
         raise HTTPException(status_code=400, detail="Отзывы можно оставить только для завершенных матчей")
 
-    repository.process_reviews_and_no_shows(db, match_id=match_id, reviewer_id=current_user.id, data=data)
-    return {"message": "Отзывы успешно отправлены"}
\ No newline at end of file
+    processed = repository.process_reviews_and_no_shows(db, match_id=match_id, reviewer_id=current_user.id, data=data)
+    return {"message": "Отзывы успешно отправлены", **processed}
\ No newline at end of file
@@ -1,20 +1,50 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
-import shutil
-import os
-from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
 from db import models, schemas, repository
 from core.security import get_current_user, get_db
+from core.uploads import UploadError, upload_store
 
 router = APIRouter()
 
-os.makedirs("static/avatars", exist_ok=True)
-os.makedirs("static/docs", exist_ok=True)
+# Тело читается потоково в core.uploads, поэтому параметра UploadFile нет — описываем его для OpenAPI.
+UPLOAD_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
 
 @router.get("/me", response_model=schemas.UserProfile)
 def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
+@router.get("/leaderboard", response_model=schemas.LeaderboardPage)
+def read_leaderboard(
+    by: str = Query("skill", pattern="^(skill|sportsmanship)$"),
+    position: Optional[str] = Query(None, max_length=100),
+    level: Optional[str] = Query(None, max_length=100),
+    min_reviews: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: Session = Depends(get_db)
+):
+    """Игроки по убыванию сглаженной оценки (by); при равной оценке выше зарегистрированный раньше."""
+    return repository.get_leaderboard(db, by, position, level, min_reviews, limit, offset)
+
+@router.get("/leaderboard/me", response_model=schemas.LeaderboardRank)
+def read_my_leaderboard_rank(
+    by: str = Query("skill", pattern="^(skill|sportsmanship)$"),
+    position: Optional[str] = Query(None, max_length=100),
+    level: Optional[str] = Query(None, max_length=100),
+    min_reviews: int = Query(0, ge=0),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Место текущего пользователя в таблице лидеров с теми же фильтрами."""
+    rank = repository.get_leaderboard_rank(db, by, current_user.id, position, level, min_reviews)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Вас нет в таблице лидеров с такими фильтрами")
+    return rank
+
 @router.put("/me", response_model=schemas.UserProfile)
 def update_users_me(
     user_update: schemas.UserUpdate,
@@ -24,40 +54,28 @@ def update_users_me(
     updated_user = repository.update_user(db=db, db_user=current_user, user_update=user_update)
     return updated_user
 
-@router.post("/me/upload-photo", response_model=schemas.UserProfile)
-def upload_user_photo(
-    file: UploadFile = File(...),
+async def _store_upload(request: Request, db: Session, user: models.User, kind: str, default_extension: str):
+    # Соединение после проверки токена не держим, пока клиент шлёт файл: медленные загрузки
+    # иначе выбирают весь пул. user отсоединяется, set_user_upload привяжет его снова.
+    await run_in_threadpool(db.close)
+    try:
+        stored = await upload_store.receive(request, kind, default_extension)
+    except UploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    return await run_in_threadpool(repository.set_user_upload, db, user, kind, stored.url)
+
+@router.post("/me/upload-photo", response_model=schemas.UserProfile, openapi_extra=UPLOAD_BODY)
+async def upload_user_photo(
+    request: Request,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    file_extension = file.filename.split(".")[-1] if '.' in file.filename else 'jpg'
-    file_name = f"{current_user.id}_{datetime.now().timestamp()}.{file_extension}"
-    file_path = f"static/avatars/{file_name}"
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    current_user.photo_url = f"/{file_path}"
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    return await _store_upload(request, db, current_user, "avatars", "jpg")
 
-@router.post("/me/upload-document", response_model=schemas.UserProfile)
-def upload_achievement_document(
-    file: UploadFile = File(...),
+@router.post("/me/upload-document", response_model=schemas.UserProfile, openapi_extra=UPLOAD_BODY)
+async def upload_achievement_document(
+    request: Request,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    file_extension = file.filename.split(".")[-1] if '.' in file.filename else 'pdf'
-    file_name = f"doc_{current_user.id}_{datetime.now().timestamp()}.{file_extension}"
-    file_path = f"static/docs/{file_name}"
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    current_user.achievements_doc = f"/{file_path}"
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
\ No newline at end of file
+    return await _store_upload(request, db, current_user, "docs", "pdf")
\ No newline at end of file
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List
 
-from db import models, schemas, repository
-from core.security import get_current_user, get_db
+from db import models, schemas, repository, async_repository
+from core.security import get_current_user, get_db, get_async_db
+from core.response_cache import response_cache
+from core.schedule_jobs import schedule_job_runner
 
 router = APIRouter()
+venue_list_adapter = TypeAdapter(List[schemas.VenueProfilePublic])
+venue_hits_adapter = TypeAdapter(List[schemas.VenueSearchHit])
 
 @router.post("", response_model=schemas.VenueProfilePublic, status_code=status.HTTP_201_CREATED)
 def create_venue(
@@ -18,8 +24,26 @@ def create_venue(
     return repository.create_venue_profile(db=db_session, owner=current_user, venue=venue)
 
 @router.get("", response_model=List[schemas.VenueProfilePublic])
-def read_venues(skip: int = 0, limit: int = 100, db_session: Session = Depends(get_db)):
-    return repository.get_venues(db=db_session, skip=skip, limit=limit)
+async def read_venues(request: Request, skip: int = 0, limit: int = 100, db_session = Depends(get_async_db)):
+    cached = await response_cache.lookup(request, "venues")
+    if cached.response:
+        return cached.response
+    venues = await async_repository.get_venues(db_session, skip=skip, limit=limit)
+    return await response_cache.store(cached, venue_list_adapter.dump_json(venue_list_adapter.validate_python(venues, from_attributes=True)))
+
+@router.get("/search", response_model=List[schemas.VenueSearchHit])
+async def search_venues(
+    request: Request,
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    db_session: Session = Depends(get_db)
+):
+    """Поиск заведений по названию и описанию, а также по виду спорта, адресу и удобствам их полей."""
+    cached = await response_cache.lookup(request, "venues", "fields")
+    if cached.response:
+        return cached.response
+    venues = await run_in_threadpool(repository.search_venues, db_session, q, limit)
+    return await response_cache.store(cached, venue_hits_adapter.dump_json(venue_hits_adapter.validate_python(venues, from_attributes=True)))
 
 @router.put("/{venue_id}", response_model=schemas.VenueProfilePublic)
 def update_venue(
@@ -55,4 +79,43 @@ def update_field(
     db_field = repository.get_field_by_id(db=db_session, field_id=field_id)
     if not db_field or db_field.venue.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
-    return repository.update_field(db=db_session, db_field=db_field, field_update=field_update)
\ No newline at end of file
+    return repository.update_field(db=db_session, db_field=db_field, field_update=field_update)
+
+@router.post("/{venue_id}/schedule-jobs", response_model=schemas.ScheduleJobPublic, status_code=status.HTTP_202_ACCEPTED)
+def create_schedule_job(
+    venue_id: int,
+    schedule: schemas.RecurringScheduleRequest,
+    db_session: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Запускает фоновую генерацию расписания для нескольких полей заведения по правилам дней недели."""
+    db_venue = repository.get_venue(db=db_session, venue_id=venue_id)
+    if not db_venue or db_venue.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    if schedule.start_date > schedule.end_date or schedule.slot_duration_minutes <= 0 or not schedule.rules:
+        raise HTTPException(status_code=400, detail="Некорректные параметры расписания")
+    venue_field_ids = {field.id for field in db_venue.fields}
+    field_ids = sorted(venue_field_ids if schedule.field_ids is None else set(schedule.field_ids))
+    if not field_ids or not set(field_ids) <= venue_field_ids:
+        raise HTTPException(status_code=400, detail="Поле не принадлежит заведению")
+    db_job = repository.create_schedule_job(
+        db_session, venue=db_venue, created_by=current_user, schedule=schedule, field_ids=field_ids
+    )
+    schedule_job_runner.submit(db_job.id)
+    return db_job
+
+@router.get("/{venue_id}/schedule-jobs/{job_id}", response_model=schemas.ScheduleJobPublic)
+def read_schedule_job(
+    venue_id: int,
+    job_id: int,
+    db_session: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Статус и прогресс фоновой генерации расписания."""
+    db_venue = repository.get_venue(db=db_session, venue_id=venue_id)
+    if not db_venue or db_venue.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    db_job = repository.get_schedule_job(db_session, job_id)
+    if not db_job or db_job.venue_id != venue_id:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return db_job
@@ -73,7 +73,7 @@ document.addEventListener('DOMContentLoaded', async () => {
         try {
             const response = await fetch('/api/matches');
             if (!response.ok) throw new Error('Не удалось загрузить матчи');
-            const matches = await response.json();
+            const { items: matches } = await response.json();
             
             if (matches.length > 0) {
                 matchesGrid.innerHTML = matches.map(renderMatchCard).join('');
@@ -93,7 +93,7 @@ document.addEventListener('DOMContentLoaded', async () => {
             // Запрашиваем только 3 матча для превью
             const response = await fetch('/api/matches?limit=3');
             if (!response.ok) throw new Error('Не удалось загрузить матчи');
-            const matches = await response.json();
+            const { items: matches } = await response.json();
 
             if (matches.length > 0) {
                 liveMatchesGrid.innerHTML = matches.map(renderMatchCard).join('');
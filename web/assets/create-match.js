@@ -26,6 +26,46 @@ document.addEventListener('DOMContentLoaded', async () => {
         });
     } catch (error) { console.error("Ошибка загрузки полей", error); }
 
+    // Сетка доступности поля на неделю вперёд: переключение дат внутри недели не делает новых запросов.
+    const WEEK_DAYS = 7;
+    const weekCache = new Map();
+
+    const addDays = (isoDate, days) => {
+        const d = new Date(isoDate);
+        d.setUTCDate(d.getUTCDate() + days);
+        return d.toISOString().slice(0, 10);
+    };
+
+    const loadWeek = async (fieldId, onDate) => {
+        const cached = weekCache.get(fieldId);
+        if (cached && onDate >= cached.start && onDate < addDays(cached.start, WEEK_DAYS)) {
+            return cached.grid;
+        }
+        const response = await fetch(`/api/fields/availability?field_ids=${fieldId}&start_date=${onDate}&days=${WEEK_DAYS}`);
+        if (!response.ok) return null;
+        const grid = await response.json();
+        weekCache.set(fieldId, { start: onDate, grid });
+        return grid;
+    };
+
+    // Разворачивает RLE-отрезки [начало_мин, длительность, количество, статус, ценовая_полоса, первый_id] в слоты.
+    const expandSlots = (grid, onDate) => {
+        const runs = (grid.fields[0] && grid.fields[0].days[onDate]) || [];
+        const slots = [];
+        runs.forEach(([startMinute, duration, count, statusCode, band, firstId]) => {
+            for (let k = 0; k < count; k++) {
+                const minute = startMinute + k * duration;
+                slots.push({
+                    id: firstId + k,
+                    start: `${String(Math.floor(minute / 60)).padStart(2, '0')}:${String(minute % 60).padStart(2, '0')}`,
+                    status: grid.statuses[statusCode],
+                    price: grid.price_bands[band],
+                });
+            }
+        });
+        return slots;
+    };
+
     const fetchAndRenderSlots = async () => {
         const fieldId = fieldSelect.value;
         const onDate = dateSelect.value;
@@ -35,20 +75,16 @@ document.addEventListener('DOMContentLoaded', async () => {
         }
 
         slotsContainer.innerHTML = `<p style="color: var(--muted);">Загрузка...</p>`;
-        const response = await fetch(`/api/fields/${fieldId}/slots?on_date=${onDate}`);
-        if (response.ok) {
-            const slots = await response.json();
-            const availableSlots = slots.filter(s => s.status === 'available');
+        const grid = await loadWeek(fieldId, onDate);
+        if (grid) {
+            const availableSlots = expandSlots(grid, onDate).filter(s => s.status === 'available');
             if (availableSlots.length > 0) {
-                slotsContainer.innerHTML = availableSlots.map(slot => {
-                    const startTime = new Date(slot.start_time).toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' });
-                    return `
+                slotsContainer.innerHTML = availableSlots.map(slot => `
                         <label class="slot-radio">
                             <input type="radio" name="slot_id" value="${slot.id}" required>
-                            <span>${startTime} - ${slot.price} KZT</span>
+                            <span>${slot.start} - ${slot.price} KZT</span>
                         </label>
-                    `;
-                }).join('');
+                    `).join('');
             } else {
                 slotsContainer.innerHTML = `<p style="color: var(--muted);">На эту дату свободных слотов нет.</p>`;
             }
@@ -58,6 +94,21 @@ document.addEventListener('DOMContentLoaded', async () => {
     fieldSelect.addEventListener('change', fetchAndRenderSlots);
     dateSelect.addEventListener('change', fetchAndRenderSlots);
 
+    // Выбранный слот удерживается за пользователем, пока он заполняет форму.
+    slotsContainer.addEventListener('change', async (e) => {
+        if (e.target.name !== 'slot_id') return;
+        const response = await fetch(`/api/fields/slots/${e.target.value}/hold`, {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (!response.ok) {
+            const errorData = await response.json();
+            alert(`Ошибка: ${errorData.detail}`);
+            weekCache.delete(fieldSelect.value);
+            fetchAndRenderSlots();
+        }
+    });
+
     createMatchForm.addEventListener('submit', async (e) => {
         e.preventDefault();
         const selectedSlot = document.querySelector('input[name="slot_id"]:checked');
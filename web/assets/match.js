@@ -23,6 +23,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     
     const token = localStorage.getItem('accessToken');
     let currentUserId = null;
+    let matchState = null;
 
     if (token) {
         try {
@@ -35,6 +36,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
 
     const renderPage = (matchData) => {
+        matchState = matchData;
         const startsAt = new Date(matchData.starts_at).toLocaleString('ru-RU', { dateStyle: 'full', timeStyle: 'short' });
         matchDetailsDiv.innerHTML = `
             <div class="page-header">
@@ -52,14 +54,14 @@ document.addEventListener('DOMContentLoaded', async () => {
         maxPlayersSpan.textContent = matchData.max_players;
         playerListDiv.innerHTML = matchData.players.map(player => `
              <div class="player-item">
-                <span>${player.full_name || player.email} ${player.id === matchData.captain.id ? ' (👑 Капитан)' : ''}</span>
+                <span>${player.full_name || player.email || `Игрок ${player.id}`} ${player.id === matchData.captain.id ? ' (👑 Капитан)' : ''}</span>
             </div>
         `).join('') || '<div style="padding: 12px;"><p style="color: var(--muted);">Никто еще не присоединился.</p></div>';
         
         if (matchData.waitlist && matchData.waitlist.length > 0) {
             waitlistContainer.style.display = 'block';
             waitlistDiv.innerHTML = matchData.waitlist.map(player => `
-                <div class="player-item"><span>${player.full_name || player.email}</span></div>
+                <div class="player-item"><span>${player.full_name || player.email || `Игрок ${player.id}`}</span></div>
             `).join('');
         } else {
             waitlistContainer.style.display = 'none';
@@ -119,7 +121,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                     <form id="reviews-form">
                         ${playersToReview.map(player => `
                             <div class="player-review-block">
-                                <p><strong>${player.full_name || player.email}</strong></p>
+                                <p><strong>${player.full_name || player.email || `Игрок ${player.id}`}</strong></p>
                                 <div class="review-inputs">
                                     <div class="form-group">
                                         <label>Навык игры (1-5)</label>
@@ -156,11 +158,61 @@ document.addEventListener('DOMContentLoaded', async () => {
             const matchData = await response.json();
             if (!matchId) { matchId = matchData.id; }
             renderPage(matchData);
+            return true;
         } catch(error) {
             matchDetailsDiv.innerHTML = `<h1>${error.message}</h1>`;
+            return false;
         }
     };
 
+    // Дельты повторяемы: снимок может уже содержать изменение, пришедшее следом.
+    const applyDelta = (delta) => {
+        if (!matchState) return;
+        const withoutUser = (list, userId) => list.filter(p => p.id !== userId);
+        if (delta.type === 'player_joined') {
+            matchState.players = withoutUser(matchState.players, delta.user.id);
+            matchState.waitlist = withoutUser(matchState.waitlist, delta.user.id);
+            (delta.status === 'waitlist' ? matchState.waitlist : matchState.players).push(delta.user);
+        } else if (delta.type === 'player_left') {
+            const promoted = matchState.waitlist.find(p => p.id === delta.promoted_user_id);
+            matchState.players = withoutUser(matchState.players, delta.user_id);
+            matchState.waitlist = withoutUser(withoutUser(matchState.waitlist, delta.user_id), delta.promoted_user_id);
+            if (promoted && !matchState.players.some(p => p.id === promoted.id)) {
+                matchState.players.push(promoted);
+            }
+        } else if (delta.type === 'status_changed') {
+            matchState.status = delta.status;
+        } else {
+            return;
+        }
+        matchState.players_count = matchState.players.length;
+        renderPage(matchState);
+    };
+
+    let reconnectDelay = 1000;
+    const connectRoom = () => {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/api/matches/${matchId}/ws`);
+        socket.addEventListener('open', () => { reconnectDelay = 1000; });
+        socket.addEventListener('message', (event) => {
+            const message = JSON.parse(event.data);
+            if (message.type === 'ping') {
+                socket.send(JSON.stringify({ type: 'pong' }));
+            } else if (message.type === 'snapshot') {
+                renderPage(message.match);
+            } else if (message.type === 'resync') {
+                fetchMatchData();
+            } else {
+                applyDelta(message);
+            }
+        });
+        socket.addEventListener('close', (event) => {
+            if (event.code === 1008) return;
+            setTimeout(connectRoom, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        });
+    };
+
     document.body.addEventListener('click', async (e) => {
         const action = e.target.id;
         const validActions = ['join-btn', 'leave-btn', 'complete-btn', 'cancel-btn'];
@@ -237,5 +289,7 @@ document.addEventListener('DOMContentLoaded', async () => {
         }
     });
 
-    fetchMatchData();
+    if (await fetchMatchData() && 'WebSocket' in window) {
+        connectRoom();
+    }
 });
\ No newline at end of file
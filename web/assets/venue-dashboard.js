@@ -23,6 +23,14 @@ document.addEventListener('DOMContentLoaded', async () => {
     const closeScheduleModalBtn = document.getElementById('close-schedule-modal-btn');
     let currentManagingFieldId = null;
 
+    // Расписание всего заведения (фоновая задача)
+    const venueScheduleForm = document.getElementById('venue-schedule-form');
+    const venueScheduleFields = document.getElementById('venue-schedule-fields');
+    const scheduleRulesDiv = document.getElementById('schedule-rules');
+    const addRuleBtn = document.getElementById('add-rule-btn');
+    const venueScheduleProgress = document.getElementById('venue-schedule-progress');
+    const WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'];
+
     const token = localStorage.getItem('accessToken');
     if (!token) {
         window.location.href = '/login.html';
@@ -52,6 +60,46 @@ document.addEventListener('DOMContentLoaded', async () => {
         `).join('');
     };
 
+    const renderScheduleFields = (fields) => {
+        venueScheduleFields.innerHTML = (fields || []).map(field => `
+            <label style="display: block;"><input type="checkbox" class="schedule-field" value="${field.id}" checked> ${field.sport} - ${field.address}</label>
+        `).join('') || '<p style="color: var(--muted);">Сначала добавьте поля.</p>';
+    };
+
+    const addScheduleRule = (weekdays = [0, 1, 2, 3, 4], startTime = '09:00', endTime = '22:00') => {
+        const rule = document.createElement('div');
+        rule.className = 'schedule-rule venue-card';
+        rule.innerHTML = `
+            <div>${WEEKDAYS.map((day, index) => `
+                <label style="margin-right: 8px;"><input type="checkbox" class="rule-weekday" value="${index}" ${weekdays.includes(index) ? 'checked' : ''}> ${day}</label>
+            `).join('')}</div>
+            <div style="display: grid; grid-template-columns: 1fr 1fr auto; gap: 10px; align-items: end;">
+                <div class="form-group"><label>Время начала</label><input type="time" class="rule-start" value="${startTime}" required></div>
+                <div class="form-group"><label>Время конца</label><input type="time" class="rule-end" value="${endTime}" required></div>
+                <button type="button" class="btn btn-secondary remove-rule-btn">Удалить</button>
+            </div>
+        `;
+        scheduleRulesDiv.appendChild(rule);
+    };
+
+    const pollScheduleJob = async (venueId, jobId) => {
+        const response = await fetch(`/api/venues/${venueId}/schedule-jobs/${jobId}`, { headers: { 'Authorization': `Bearer ${token}` } });
+        if (!response.ok) {
+            venueScheduleProgress.textContent = 'Не удалось получить статус генерации.';
+            return;
+        }
+        const job = await response.json();
+        const percent = Math.round(job.progress * 100);
+        if (job.status === 'completed') {
+            venueScheduleProgress.textContent = `Готово: создано слотов — ${job.created_slots}.`;
+        } else if (job.status === 'failed') {
+            venueScheduleProgress.textContent = `Ошибка генерации: ${job.error || 'неизвестная ошибка'}`;
+        } else {
+            venueScheduleProgress.textContent = `Генерация: ${percent}% (создано слотов — ${job.created_slots})`;
+            setTimeout(() => pollScheduleJob(venueId, jobId), 1000);
+        }
+    };
+
     const fetchAndRender = async () => {
         try {
             const response = await fetch('/api/users/me', { headers: { 'Authorization': `Bearer ${token}` }});
@@ -67,6 +115,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                 venueEditForm.description.value = currentUserData.venue_profile.description || '';
 
                 renderFields(currentUserData.venue_profile.fields);
+                renderScheduleFields(currentUserData.venue_profile.fields);
             } else {
                 createVenueSection.style.display = 'block';
                 manageVenueSection.style.display = 'none';
@@ -182,6 +231,46 @@ document.addEventListener('DOMContentLoaded', async () => {
     
     closeScheduleModalBtn.addEventListener('click', () => scheduleModal.close());
 
+    addRuleBtn.addEventListener('click', () => addScheduleRule([5, 6], '10:00', '20:00'));
+
+    scheduleRulesDiv.addEventListener('click', (e) => {
+        if (e.target.classList.contains('remove-rule-btn')) {
+            e.target.closest('.schedule-rule').remove();
+        }
+    });
+
+    venueScheduleForm.addEventListener('submit', async (e) => {
+        e.preventDefault();
+        const venueId = currentUserData.venue_profile.id;
+        const rules = [...scheduleRulesDiv.querySelectorAll('.schedule-rule')].map(rule => ({
+            weekdays: [...rule.querySelectorAll('.rule-weekday:checked')].map(input => parseInt(input.value)),
+            start_time: rule.querySelector('.rule-start').value,
+            end_time: rule.querySelector('.rule-end').value,
+        })).filter(rule => rule.weekdays.length > 0);
+        const data = {
+            start_date: e.target.start_date.value,
+            end_date: e.target.end_date.value,
+            field_ids: [...venueScheduleFields.querySelectorAll('.schedule-field:checked')].map(input => parseInt(input.value)),
+            rules: rules,
+            blackout_dates: e.target.blackout_dates.value.split(',').map(d => d.trim()).filter(Boolean),
+            slot_duration_minutes: parseInt(e.target.slot_duration_minutes.value),
+        };
+
+        const response = await fetch(`/api/venues/${venueId}/schedule-jobs`, {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' },
+            body: JSON.stringify(data)
+        });
+        if (response.ok) {
+            const job = await response.json();
+            venueScheduleProgress.textContent = 'Генерация запущена...';
+            pollScheduleJob(venueId, job.id);
+        } else {
+            const error = await response.json();
+            alert(`Ошибка: ${typeof error.detail === 'string' ? error.detail : 'проверьте параметры расписания'}`);
+        }
+    });
+
     scheduleGenerateForm.addEventListener('submit', async (e) => {
         e.preventDefault();
         const data = {
@@ -237,5 +326,6 @@ document.addEventListener('DOMContentLoaded', async () => {
         }
     });
     
+    addScheduleRule();
     fetchAndRender();
 });
\ No newline at end of file
@@ -23,19 +23,39 @@ document.addEventListener('DOMContentLoaded', async () => {
         `;
     };
 
-    try {
-        const response = await fetch('/api/venues');
-        if (!response.ok) throw new Error('Не удалось загрузить площадки');
-        
-        const venues = await response.json();
-        
-        if (venues.length > 0) {
-            venuesListDiv.innerHTML = venues.map(renderVenueCard).join('');
-        } else {
-            venuesListDiv.innerHTML = "<p style='color: var(--muted);'>Площадок пока не добавлено.</p>";
+    const searchInput = document.getElementById('venue-search');
+    let searchTimer = null;
+    let requestId = 0;
+
+    const loadVenues = async (query) => {
+        const currentRequest = ++requestId;
+        const url = query ? `/api/venues/search?q=${encodeURIComponent(query)}` : '/api/venues';
+        try {
+            const response = await fetch(url);
+            if (!response.ok) throw new Error('Не удалось загрузить площадки');
+
+            const venues = await response.json();
+            // Пока шёл запрос, пользователь мог изменить строку поиска.
+            if (currentRequest !== requestId) return;
+
+            if (venues.length > 0) {
+                venuesListDiv.innerHTML = venues.map(renderVenueCard).join('');
+            } else if (query) {
+                venuesListDiv.innerHTML = "<p style='color: var(--muted);'>Ничего не найдено.</p>";
+            } else {
+                venuesListDiv.innerHTML = "<p style='color: var(--muted);'>Площадок пока не добавлено.</p>";
+            }
+        } catch (error) {
+            console.error(error);
+            venuesListDiv.innerHTML = "<p style='color: #dc3545;'>Ошибка при загрузке площадок.</p>";
         }
-    } catch (error) {
-        console.error(error);
-        venuesListDiv.innerHTML = "<p style='color: #dc3545;'>Ошибка при загрузке площадок.</p>";
-    }
+    };
+
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        const query = searchInput.value.trim();
+        searchTimer = setTimeout(() => loadVenues(query.length >= 2 ? query : ''), 250);
+    });
+
+    await loadVenues('');
 });
\ No newline at end of file